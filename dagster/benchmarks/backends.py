@@ -0,0 +1,111 @@
+"""Benchmarks the compute backends of the pipeline's transforms.
+
+Runs gap detection, removing the combinations that back off and joining the price data with
+the items for the dashboard on every backend, for synthetic histories of N items x M hours,
+and checks that every backend returns the same frames as pandas. Backends whose package is
+not installed are skipped. Run from the dagster folder:
+
+    python -m benchmarks.backends
+    python -m benchmarks.backends --items 20000 --hours 2160 --backends pandas duckdb
+"""
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import synthetic_data
+from marketcrawler.compute import BACKENDS, get_compute_backend
+from marketcrawler.dtypes import compact_items, compact_price_data
+
+
+def measure(fn, repeat: int) -> tuple[pd.DataFrame, float]:
+    """Runs fn `repeat` times. Returns its result and the best time."""
+    seconds = float("inf")
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        result = fn()
+        seconds = min(seconds, time.perf_counter() - start)
+    return result, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--hours", type=int, default=24 * 30)
+    parser.add_argument(
+        "--coverage",
+        type=float,
+        default=0.9,
+        help="Share of (item, hour) pairs that already exist.",
+    )
+    parser.add_argument(
+        "--backing-off",
+        type=float,
+        default=0.1,
+        help="Share of the missing combinations that back off.",
+    )
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per transform, the best counts."
+    )
+    args = parser.parse_args()
+
+    all_items, available_price_data, dt_now, dt_past = synthetic_data(
+        args.items, args.hours, coverage=args.coverage
+    )
+    # Shaped like the asset inputs: compact dtypes, in no particular order
+    all_items = compact_items(all_items)
+    available_price_data = compact_price_data(
+        available_price_data.sample(frac=1, random_state=0).reset_index(drop=True)
+    )
+
+    backends = {}
+    for name in args.backends:
+        try:
+            backends[name] = get_compute_backend(name)
+        except ImportError as e:
+            print(f"Skipping {name}: {e}")
+    if "pandas" not in backends:
+        # The reference the other backends are checked against
+        backends = {"pandas": get_compute_backend("pandas"), **backends}
+
+    reference = {}
+    print(
+        f"{'transform':<22} {'backend':<8} {'rows in':>12} {'rows out':>12} {'seconds':>9} {'rows/s':>12} {'speedup':>8}  identical"
+    )
+    for transform in ["missing_combinations", "remove_backing_off", "join_items"]:
+        for name, backend in backends.items():
+            if transform == "missing_combinations":
+                rows_in = args.items * args.hours
+                fn = lambda: backend.missing_combinations(
+                    all_items, available_price_data, dt_now, dt_past
+                )
+            elif transform == "remove_backing_off":
+                missing = reference["missing_combinations"][0]
+                backing_off = missing.sample(
+                    frac=args.backing_off, random_state=1
+                ).reset_index(drop=True)
+                rows_in = len(missing)
+                fn = lambda: backend.remove_backing_off(missing, backing_off)
+            else:
+                rows_in = len(available_price_data)
+                fn = lambda: backend.join_items(available_price_data, all_items)
+
+            result, seconds = measure(fn, args.repeat)
+            if name == "pandas":
+                reference[transform] = result, seconds
+                identical = "-"
+            else:
+                try:
+                    pd.testing.assert_frame_equal(result, reference[transform][0])
+                    identical = "yes"
+                except AssertionError as e:
+                    identical = f"NO: {str(e).splitlines()[0]}"
+            speedup = reference[transform][1] / seconds if seconds > 0 else np.nan
+            print(
+                f"{transform:<22} {name:<8} {rows_in:>12} {len(result):>12} {seconds:>9.3f} {rows_in / seconds:>12.0f} {speedup:>7.2f}x  {identical}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""Benchmarks the crawler and reporting pipeline on synthetic data.
+
+Times gap detection, the crawl against an in-process stand-in for the price api (range and
+batch mode), inserting into a local Postgres and rendering the dashboard, for N items x M
+hours. Reports throughput and peak memory, and compares them to stored baselines. Run from
+the dagster folder:
+
+    python -m benchmarks.pipeline
+    python -m benchmarks.pipeline --items 10000 --hours 24 --save-baselines
+
+The insert benchmark uses the POSTGRES_* variables like the pipeline does, and writes to a
+schema of its own that is dropped afterwards. It is skipped if Postgres can't be reached.
+Baselines depend on the machine, so record your own before comparing changes with them.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import dagster as dg
+import pandas as pd
+from benchmarks.price_api import start_price_api
+from benchmarks.synthetic import synthetic_data
+from marketcrawler.crawling import (
+    crawl_missing_price_data,
+    crawl_missing_price_ranges,
+    determine_missing_combinations,
+)
+from marketcrawler.rendering import build_dashboard, publish_dashboard
+from marketcrawler.resources import ApiEndpointResource, Database, DatabaseResource
+from marketcrawler.writer import PRICE_COLUMNS, ChunkedWriter
+from psycopg.conninfo import make_conninfo
+from typing import Callable
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+
+class BenchmarkContext:
+    """The parts of an asset execution context the crawl functions use."""
+
+    asset_key = dg.AssetKey("recent_price_data")
+    log = logging.getLogger("benchmarks")
+
+    def log_event(self, event) -> None:
+        pass
+
+
+class SchemaDatabaseResource(DatabaseResource):
+    """Resolves unqualified table names in the given schema first."""
+
+    schema_name: str
+
+    def get_conninfo(self) -> str:
+        return make_conninfo(
+            super().get_conninfo(), options=f"-c search_path={self.schema_name}"
+        )
+
+
+def measure(fn: Callable[[], int], repeat: int) -> dict:
+    """Runs fn, which returns the number of rows it handled, `repeat` times for the best time
+    and once more under tracemalloc for the peak memory. Tracing slows everything down, so
+    it's kept out of the timed runs."""
+    seconds = float("inf")
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        rows = fn()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds > 0 else 0.0,
+        "peak_mib": peak / 2**20,
+    }
+
+
+def bench_gap_detection(all_items, available_price_data, dt_now, dt_past) -> int:
+    return len(
+        determine_missing_combinations(all_items, available_price_data, dt_now, dt_past)
+    )
+
+
+def bench_crawl(crawl, missing_combinations, api: ApiEndpointResource) -> int:
+    entries = []
+    failures = []
+    crawl(
+        BenchmarkContext(),
+        missing_combinations,
+        api,
+        entries.append,
+        lambda *failure: failures.append(failure),
+    )
+    if failures:
+        raise Exception(f"{len(failures)} combinations failed to crawl.")
+    return len(entries)
+
+
+def bench_insert(database: DatabaseResource, rows: list[dict]) -> int:
+    with ChunkedWriter(
+        database,
+        chunk_size=10_000,
+        flush_seconds=30.0,
+        retry_backoff=3600.0,
+        retry_backoff_max=7 * 24 * 3600.0,
+    ) as writer:
+        for row in rows:
+            writer.write(row)
+    with database.get_connection() as conn:
+        conn.execute("TRUNCATE price_data")
+        conn.commit()
+    return writer.inserted_rows
+
+
+def bench_dashboard(df_with_items: pd.DataFrame, item_names: list[str]) -> int:
+    fig, stats = build_dashboard(df_with_items, item_names)
+    with tempfile.TemporaryDirectory() as directory:
+        publish_dashboard(fig, directory, "dashboard_benchmark.html")
+    return stats["num_records"]
+
+
+def create_schema(schema_name: str) -> SchemaDatabaseResource | None:
+    """Creates a schema with empty copies of the tables the writer uses. Returns a database
+    resource writing to it, or None if Postgres isn't available."""
+    database = SchemaDatabaseResource(
+        host=Database.host,
+        port=Database.port,
+        database=Database.database,
+        user=Database.user,
+        password=Database.password,
+        schema_name=schema_name,
+    )
+    try:
+        with database.get_connection() as conn:
+            conn.execute(f"CREATE SCHEMA {schema_name}")
+            # Without defaults, so the ids don't use up the sequences of the real tables
+            conn.execute(
+                "CREATE TABLE price_data (LIKE public.price_data INCLUDING INDEXES) PARTITION BY RANGE (timestamp)"
+            )
+            conn.execute("CREATE SEQUENCE price_data_entry_id_seq")
+            conn.execute(
+                "ALTER TABLE price_data ALTER entry_id SET DEFAULT nextval('price_data_entry_id_seq')"
+            )
+            conn.execute(
+                "CREATE TABLE crawl_ledger (LIKE public.crawl_ledger INCLUDING ALL)"
+            )
+            conn.commit()
+    except Exception as e:
+        print(f"Skipping the insert benchmark, Postgres is not available: {str(e)}")
+        return None
+    return database
+
+
+def drop_schema(database: SchemaDatabaseResource) -> None:
+    with database.get_connection() as conn:
+        conn.execute(f"DROP SCHEMA {database.schema_name} CASCADE")
+        conn.commit()
+
+
+def run_benchmarks(
+    num_items: int, num_hours: int, coverage: float, repeat: int
+) -> dict[str, dict]:
+    all_items, available_price_data, dt_now, dt_past = synthetic_data(
+        num_items, num_hours, coverage
+    )
+    results = {}
+
+    results["gap_detection"] = measure(
+        lambda: bench_gap_detection(
+            all_items[["item_id"]], available_price_data, dt_now, dt_past
+        ),
+        repeat,
+    )
+
+    missing_combinations = determine_missing_combinations(
+        all_items[["item_id"]], available_price_data, dt_now, dt_past
+    )
+    url, server = start_price_api(num_items)
+    try:
+        api = ApiEndpointResource(api_endpoint=url, batch_size=100)
+        for name, crawl in [
+            ("crawl_range", crawl_missing_price_ranges),
+            ("crawl_batch", crawl_missing_price_data),
+        ]:
+            results[name] = measure(
+                lambda: bench_crawl(crawl, missing_combinations, api), repeat
+            )
+    finally:
+        server.shutdown()
+
+    database = create_schema(f"benchmark_{os.getpid()}")
+    if database is not None:
+        try:
+            rows = available_price_data[PRICE_COLUMNS].to_dict("records")
+            results["insert"] = measure(lambda: bench_insert(database, rows), repeat)
+        finally:
+            drop_schema(database)
+
+    df_with_items = available_price_data.merge(all_items, on="item_id", how="left")
+    item_names = list(all_items["name"])
+    results["dashboard"] = measure(
+        lambda: bench_dashboard(df_with_items, item_names), repeat
+    )
+    return results
+
+
+def compare(
+    results: dict[str, dict], baselines: dict[str, dict], tolerance: float
+) -> list[str]:
+    """Prints the results next to their baselines. Returns the benchmarks that got worse
+    by more than the tolerance, in throughput or peak memory."""
+    print(
+        f"{'benchmark':<14} {'rows':>9} {'seconds':>9} {'rows/s':>11} {'baseline':>11} {'peak MiB':>9} {'baseline':>9}  status"
+    )
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        status = "no baseline"
+        baseline_rate = baseline_peak = ""
+        if baseline is not None:
+            baseline_rate = f"{baseline['rows_per_second']:.0f}"
+            baseline_peak = f"{baseline['peak_mib']:.1f}"
+            slower = result["rows_per_second"] < baseline["rows_per_second"] * (
+                1 - tolerance
+            )
+            larger = result["peak_mib"] > baseline["peak_mib"] * (1 + tolerance)
+            if slower or larger:
+                status = "REGRESSION"
+                regressions.append(name)
+            else:
+                ratio = result["rows_per_second"] / baseline["rows_per_second"]
+                status = f"ok ({ratio:.2f}x)"
+        print(
+            f"{name:<14} {result['rows']:>9} {result['seconds']:>9.3f} {result['rows_per_second']:>11.0f} {baseline_rate:>11} {result['peak_mib']:>9.1f} {baseline_peak:>9}  {status}"
+        )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=1_000)
+    parser.add_argument("--hours", type=int, default=7 * 24)
+    parser.add_argument(
+        "--coverage",
+        type=float,
+        default=0.9,
+        help="Share of (item, hour) pairs that already exist, the rest gets crawled.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Timed runs per benchmark, the best counts.",
+    )
+    parser.add_argument("--baselines", default=BASELINES_PATH)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Relative loss in throughput, or growth in peak memory, that counts as a regression.",
+    )
+    parser.add_argument(
+        "--save-baselines",
+        action="store_true",
+        help="Store the results as the baselines for this scale.",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    scale = f"{args.items}x{args.hours}@{args.coverage}"
+    results = run_benchmarks(args.items, args.hours, args.coverage, args.repeat)
+
+    stored = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as f:
+            stored = json.load(f)
+    baselines = stored.get(scale, {}).get("results", {})
+    print(f"{args.items} items x {args.hours} hours, coverage {args.coverage}")
+    regressions = compare(results, baselines, args.tolerance)
+
+    if args.save_baselines:
+        stored[scale] = {
+            "machine": f"{platform.machine()} {platform.processor() or platform.system()}, Python {platform.python_version()}",
+            "results": results,
+        }
+        with open(args.baselines, "w") as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Saved baselines for {scale} to {args.baselines}")
+        return 0
+
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""A stand-in for the price api, served from a thread of the benchmark's own process.
+
+It answers the same endpoints the crawler uses (`/price`, `/prices` and `/prices/range`),
+for the items 1 to num_items, with cheap deterministic prices. So the benchmarks measure
+the crawler, not the api's simulation.
+"""
+
+import json
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def price_point(item_id: int, dt: datetime) -> dict:
+    hour = int(dt.timestamp()) // 3600
+    return {
+        "success": True,
+        "price": 1.0 + (item_id * 31 + hour) % 100 / 10,
+        "volume": (item_id + hour) % 50,
+    }
+
+
+class PriceApiHandler(BaseHTTPRequestHandler):
+    # Keeps connections alive, like uvicorn does
+    protocol_version = "HTTP/1.1"
+    num_items = 0
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def send_body(self, body: bytes, content_type: str, status: int = 200) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, obj, status: int = 200) -> None:
+        self.send_body(json.dumps(obj).encode(), "application/json", status)
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == "/price":
+            item_id = int(query["item_id"])
+            if not 1 <= item_id <= self.num_items:
+                self.send_json({"detail": f"Item with id {item_id} not found."}, 404)
+                return
+            self.send_json(price_point(item_id, datetime.fromisoformat(query["time"])))
+        elif url.path == "/prices/range":
+            start = datetime.fromisoformat(query["start"])
+            end = datetime.fromisoformat(query["end"])
+            item_ids = (
+                [int(query["item_id"])]
+                if "item_id" in query
+                else range(1, self.num_items + 1)
+            )
+            lines = []
+            dt = start
+            while dt < end:
+                time = dt.isoformat()
+                for item_id in item_ids:
+                    lines.append(
+                        json.dumps(
+                            {
+                                "item_id": item_id,
+                                "time": time,
+                                **price_point(item_id, dt),
+                            }
+                        )
+                    )
+                dt += timedelta(hours=1)
+            self.send_body(
+                "".join(f"{line}\n" for line in lines).encode(), "application/x-ndjson"
+            )
+        else:
+            self.send_json({"detail": "Not Found"}, 404)
+
+    def do_POST(self) -> None:
+        if urlparse(self.path).path != "/prices":
+            self.send_json({"detail": "Not Found"}, 404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        results = []
+        for entry in body["entries"]:
+            item_id = int(entry["item_id"])
+            results.append(
+                {
+                    "item_id": item_id,
+                    "time": entry["time"],
+                    **price_point(item_id, datetime.fromisoformat(entry["time"])),
+                }
+            )
+        self.send_json({"success": True, "results": results})
+
+
+def start_price_api(num_items: int) -> tuple[str, ThreadingHTTPServer]:
+    """Serves the stand-in on a free local port. Returns its url and the server, call
+    `server.shutdown()` when done."""
+    handler = type("Handler", (PriceApiHandler,), {"num_items": num_items})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
@@ -0,0 +1,161 @@
+"""Benchmarks how long loading the Definitions takes.
+
+Every run, and with the multiprocess executor every step, starts a fresh process that imports
+marketcrawler before doing anything. This starts a new interpreter per repetition that loads the
+Definitions, and reports the best time next to the time of importing dagster alone. It also lists
+the heavy dependencies that got imported on the way, which should only be imported by the assets
+that use them. Run from the dagster folder:
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --repeat 10 --save-baselines
+
+Baselines are stored next to the pipeline's, under "startup". They depend on the machine, so
+record your own before comparing changes with them.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+# Dependencies that loading the Definitions must not import
+HEAVY_MODULES = [
+    "numpy",
+    "pandas",
+    "plotly",
+    "psycopg",
+    "psycopg_pool",
+    "pyarrow",
+    "requests",
+]
+
+STARTUPS = {
+    "dagster": "import dagster",
+    "definitions": "import marketcrawler; marketcrawler.defs.get_repository_def()",
+}
+
+# Runs in the new interpreter, reports the time spent and the heavy modules imported as JSON
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "modules": [m for m in {modules!r} if m in sys.modules]}}))
+"""
+
+
+def measure_startup(statement: str, repeat: int) -> dict:
+    """Runs the statement in `repeat` new interpreters. Returns the best time spent in it, the
+    best time of the whole process including the interpreter's own start, and the heavy modules
+    it imported."""
+    seconds = process_seconds = float("inf")
+    modules = []
+    for _ in range(max(1, repeat)):
+        probe = PROBE.format(statement=statement, modules=HEAVY_MODULES)
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", probe],
+            check=True,
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout
+        process_seconds = min(process_seconds, time.perf_counter() - start)
+        result = json.loads(output.strip().splitlines()[-1])
+        seconds = min(seconds, result["seconds"])
+        modules = result["modules"]
+    return {
+        "seconds": seconds,
+        "process_seconds": process_seconds,
+        "heavy_modules": modules,
+    }
+
+
+def compare(
+    results: dict[str, dict], baselines: dict[str, dict], tolerance: float
+) -> list[str]:
+    """Prints the results next to their baselines. Returns the startups that got slower by more
+    than the tolerance, or that import heavy modules."""
+    regressions = []
+    print(
+        f"{'startup':<12} {'seconds':>9} {'baseline':>9} {'process':>9}  {'heavy modules':<30} status"
+    )
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        status = "no baseline"
+        baseline_seconds = ""
+        if baseline is not None:
+            baseline_seconds = f"{baseline['seconds']:.3f}"
+            if result["seconds"] > baseline["seconds"] * (1 + tolerance):
+                status = f"SLOWER ({result['seconds'] / baseline['seconds']:.2f}x)"
+                regressions.append(name)
+            else:
+                status = "ok"
+        if name != "dagster" and result["heavy_modules"]:
+            status = "IMPORTS HEAVY MODULES"
+            if name not in regressions:
+                regressions.append(name)
+        print(
+            f"{name:<12} {result['seconds']:>9.3f} {baseline_seconds:>9} {result['process_seconds']:>9.3f}  {', '.join(result['heavy_modules']) or '-':<30} {status}"
+        )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="New interpreters per startup, the best counts.",
+    )
+    parser.add_argument("--baselines", default=BASELINES_PATH)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Relative growth in startup time that counts as a regression.",
+    )
+    parser.add_argument(
+        "--save-baselines",
+        action="store_true",
+        help="Store the results as the startup baselines.",
+    )
+    args = parser.parse_args()
+
+    results = {
+        name: measure_startup(statement, args.repeat)
+        for name, statement in STARTUPS.items()
+    }
+
+    stored = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as f:
+            stored = json.load(f)
+    baselines = stored.get("startup", {}).get("results", {})
+    regressions = compare(results, baselines, args.tolerance)
+
+    if args.save_baselines:
+        stored["startup"] = {
+            "machine": f"{platform.machine()} {platform.processor() or platform.system()}, Python {platform.python_version()}",
+            "results": results,
+        }
+        with open(args.baselines, "w") as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Saved startup baselines to {args.baselines}")
+        return 0
+
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+"""Synthetic items and price data for the benchmarks."""
+
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta, timezone
+
+
+def synthetic_items(num_items: int) -> pd.DataFrame:
+    """Generates items shaped like the items table, with ids 1 to num_items."""
+    item_ids = np.arange(1, num_items + 1, dtype=np.int64)
+    return pd.DataFrame(
+        {
+            "item_id": item_ids,
+            "name": [f"Item {item_id}" for item_id in item_ids.tolist()],
+            "type": "synthetic",
+        }
+    )
+
+
+def synthetic_data(
+    num_items: int, num_hours: int, coverage: float, seed: int = 0
+) -> tuple[pd.DataFrame, pd.DataFrame, datetime, datetime]:
+    """Generates items and price data where roughly `coverage` of all (item, hour) pairs exist."""
+    rng = np.random.default_rng(seed)
+    dt_now = datetime(2025, 1, 1, tzinfo=timezone.utc) + timedelta(hours=num_hours // 2)
+    dt_past = dt_now - timedelta(hours=num_hours)
+    all_items = synthetic_items(num_items)
+
+    num_points = int(num_items * num_hours * coverage)
+    cells = rng.choice(num_items * num_hours, size=num_points, replace=False)
+    available_price_data = pd.DataFrame(
+        {
+            "item_id": cells // num_hours + 1,
+            "volume": rng.poisson(10, size=num_points),
+            "price": rng.random(num_points),
+            "timestamp": pd.to_datetime(
+                int(dt_past.timestamp()) + (cells % num_hours) * 3600,
+                unit="s",
+                utc=True,
+            ),
+        }
+    )
+    return all_items, available_price_data, dt_now, dt_past
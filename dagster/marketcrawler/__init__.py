@@ -1,9 +1,18 @@
 import dagster as dg
-from .resources import Database, Api
+from .resources import Database, Api, PriceCache, ArrowIO, CrawlIO, Compute, Retention
+from .sensors import (
+    CRAWL_TRIGGER,
+    crawl_retry_sensor,
+    newest_hour_sensor,
+    new_price_data_sensor,
+)
 from .assets import (
     all_items,
     available_price_data,
     recent_price_data,
+    price_history_cache,
+    price_rollups,
+    price_data_retention,
     generate_plotly_dashboard,
 )
 
@@ -13,6 +22,9 @@ run_pipeline_job = dg.define_asset_job(
         "all_items",
         "available_price_data",
         "recent_price_data",
+        "price_history_cache",
+        "price_rollups",
+        "price_data_retention",
         "generate_plotly_dashboard",
     ],
 )
@@ -23,13 +35,21 @@ crawl_job = dg.define_asset_job(
         "all_items",
         "available_price_data",
         "recent_price_data",
+        "price_history_cache",
+        "price_rollups",
+        "price_data_retention",
     ],
 )
 
-daily_schedule = dg.ScheduleDefinition(
-    job=crawl_job,
-    cron_schedule="0 * * * *",
-    default_status=dg.DefaultScheduleStatus.RUNNING,
+# Runs at the end of every hour and only materializes the hour that just closed.
+# Stopped by default when the sensors are used instead (CRAWL_TRIGGER=sensor).
+daily_schedule = dg.build_schedule_from_partitioned_job(
+    crawl_job,
+    default_status=(
+        dg.DefaultScheduleStatus.RUNNING
+        if CRAWL_TRIGGER == "schedule"
+        else dg.DefaultScheduleStatus.STOPPED
+    ),
 )
 
 defs = dg.Definitions(
@@ -37,6 +57,9 @@ defs = dg.Definitions(
         all_items,
         available_price_data,
         recent_price_data,
+        price_history_cache,
+        price_rollups,
+        price_data_retention,
         generate_plotly_dashboard,
     ],
     jobs=[
@@ -45,8 +68,18 @@ defs = dg.Definitions(
     schedules=[
         daily_schedule,
     ],
+    sensors=[
+        newest_hour_sensor,
+        new_price_data_sensor,
+        crawl_retry_sensor,
+    ],
     resources={
         "database": Database,
         "api": Api,
+        "price_cache": PriceCache,
+        "io_manager": ArrowIO,
+        "crawl_io_manager": CrawlIO,
+        "compute": Compute,
+        "retention": Retention,
     },
 )
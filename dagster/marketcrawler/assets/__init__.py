@@ -1,3 +1,6 @@
 from .database import all_items, available_price_data
 from .crawler import recent_price_data
+from .cache import price_history_cache
+from .rollup import price_rollups
+from .retention import price_data_retention
 from .report import generate_plotly_dashboard
@@ -0,0 +1,29 @@
+import dagster as dg
+from marketcrawler.resources import DatabaseResource, PriceCacheResource
+
+
+@dg.asset(
+    kinds={"parquet", "postgres", "python"},
+    group_name="Database",
+    description="Keeps a local Parquet copy of the price data up to date, appending only new rows.",
+    deps=["recent_price_data"],
+)
+def price_history_cache(
+    context: dg.AssetExecutionContext,
+    database: DatabaseResource,
+    price_cache: PriceCacheResource,
+) -> None:
+    """Appends all price data inserted since the last sync to the local price cache."""
+    try:
+        stats = price_cache.sync(database)
+    except Exception as e:
+        raise dg.Failure(f"Excpetion while syncing the price cache: {str(e)}")
+    context.add_output_metadata(
+        {
+            "appended_rows": dg.MetadataValue.int(stats["appended_rows"]),
+            "high_water_mark": dg.MetadataValue.int(stats["high_water_mark"]),
+            "pending_holes": dg.MetadataValue.int(stats["pending_holes"]),
+            "compacted_days": dg.MetadataValue.int(stats["compacted_days"]),
+            "cache_dir": dg.MetadataValue.path(price_cache.cache_dir),
+        }
+    )
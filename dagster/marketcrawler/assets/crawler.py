@@ -1,204 +1,351 @@
 import dagster as dg
-import pandas as pd
-from marketcrawler.resources import DatabaseResource, ApiEndpointResource
-from datetime import datetime, timedelta, timezone
-
-
-def determine_missing_combinations(
-    all_items: pd.DataFrame,
-    available_price_data: pd.DataFrame,
-    dt_now: datetime,
-    dt_past: datetime,
-) -> pd.DataFrame:
-    """Determines all (item_id, day, hour) combinations between dt_past and dt_now that are missing in the pric edata."""
-    # Set day_of_year and hour for the data we have
-    available_price_data["day_of_year"] = available_price_data["timestamp"].dt.dayofyear
-    available_price_data["hour"] = available_price_data["timestamp"].dt.hour
-
-    # Generate all tuples (day, hour) for the given timestamp
-    all_datetimes = pd.date_range(start=dt_past, end=dt_now, freq="H")
-    all_days = all_datetimes.dayofyear
-    all_hours = all_datetimes.hour
-
-    time_combinations = pd.DataFrame(
-        {"day_of_year": all_days, "hour": all_hours}
-    ).drop_duplicates()
-
-    # Merge the two dataframes to create (item_id, day_of_year, hour) triples
-    all_combinations = all_items[["item_id"]].merge(time_combinations, how="cross")
-
-    existing_combinations = available_price_data[
-        ["item_id", "day_of_year", "hour"]
-    ].drop_duplicates()
-
-    # Remove all combinations that we already have
-    missing_combinations = (
-        all_combinations.merge(
-            existing_combinations,
-            on=["item_id", "day_of_year", "hour"],
-            how="left",
-            indicator=True,
-        )
-        .query('_merge == "left_only"')
-        .drop("_merge", axis=1)
+from marketcrawler.assets.database import read_price_data
+from marketcrawler.metrics import RunMetrics
+from marketcrawler.resources import (
+    DatabaseResource,
+    ApiEndpointResource,
+    ComputeResource,
+)
+from marketcrawler.resources.api import CircuitOpenError
+from marketcrawler.partitions import hourly_partitions, hourly_backfill_policy
+from datetime import datetime
+from typing import Iterator, Literal
+
+
+class CrawlConfig(dg.Config):
+    # Where missing (item_id, hour) combinations are found: "local" compares the asset
+    # inputs in Python, "database" lets Postgres compute them and only returns the gaps
+    gap_detection: Literal["local", "database"] = "local"
+    # How missing combinations are requested: "range" streams whole ranges of hours for all
+    # items with one request each, "batch" asks for the (item_id, hour) pairs themselves.
+    # "auto" uses ranges for the hours that lack at least range_min_missing of all items,
+    # and batches for the rest, as a range also returns everything we have already.
+    fetch_mode: Literal["auto", "range", "batch"] = "auto"
+    range_min_missing: float = 0.5
+    # Seconds until a failed combination is tried again. Doubles with every failed attempt,
+    # up to retry_backoff_max_seconds.
+    retry_backoff_seconds: float = 3600.0
+    retry_backoff_max_seconds: float = 7 * 24 * 3600.0
+    # Crawled rows are committed in chunks of this size, or after commit_interval seconds
+    commit_size: int = 10_000
+    commit_interval: float = 30.0
+    # Number of shards the missing combinations are split into. Every shard is crawled and
+    # inserted by its own op, which the multiprocess executor runs in a process of its own,
+    # with the api's concurrency limit to itself. The api's requests_per_second is divided
+    # among the shards, so together they don't send more requests than a single crawl.
+    shards: int = 1
+    # Split by "item" or by "time" (hour). "auto" splits by time in range and auto mode, as a
+    # range request covers all items anyway, and by item in batch mode.
+    shard_by: Literal["auto", "item", "time"] = "auto"
+
+
+@dg.op(
+    out={
+        "plan": dg.Out(io_manager_key="crawl_io_manager"),
+        "shards": dg.DynamicOut(io_manager_key="crawl_io_manager"),
+    },
+)
+def plan_price_crawl(
+    context: dg.OpExecutionContext,
+    config: CrawlConfig,
+    all_items,
+    available_price_data,
+    database: DatabaseResource,
+    compute: ComputeResource,
+) -> Iterator[dg.Output | dg.DynamicOutput]:
+    """Determines the missing combinations of the partition's hour and splits them into shards."""
+    # The crawl's helpers need pandas, so they're only imported by the ops that run them,
+    # and loading the definitions stays cheap
+    from marketcrawler.crawling import (
+        mostly_missing_hours,
+        query_missing_combinations,
+        split_missing_combinations,
     )
-    return missing_combinations
+    from marketcrawler.ledger import read_backing_off
 
+    backend = compute.get_backend()
 
-def crawl_missing_price_data(
-    context: dg.AssetExecutionContext,
-    missing_combinations: pd.DataFrame,
-    api: ApiEndpointResource,
-) -> list[dict]:
-    """Crawls all price and volume points for missing pairs of (item_id, day, hour)."""
-
-    current_year = datetime.now().year
-    new_entries = []
-    total_entries = len(missing_combinations)
-    tried_entries = 0
-
-    for row in missing_combinations.itertuples():
-        item_id = row.item_id
-        day_of_year = row.day_of_year
-        hour = row.hour
-        # Datetime needed for the API call
-        dt = datetime(current_year, 1, 1) + timedelta(days=day_of_year - 1, hours=hour)
+    # The daterange we want to return price data for
+    dt_past, dt_now = context.partition_time_window
+    metrics = RunMetrics(context)
+
+    # A retry or re-execution may find chunks that an earlier attempt committed already. The input
+    # doesn't know about them, so read the window again to resume where that attempt stopped.
+    resumed = context.retry_number > 0 or context.run.parent_run_id is not None
+    if resumed:
         try:
-            # Call the api
-            response = api.request(
-                item_id=str(item_id),
-                time=dt.isoformat(),
+            with metrics.phase("db_read"):
+                available_price_data = read_price_data(database, dt_past, dt_now)
+        except Exception as e:
+            raise dg.Failure(
+                f"Excpetion while getting price data from database: {str(e)}"
             )
-            # Various checks to make we successfully got data
-            response.raise_for_status()
-            result = response.json()
-            if not result.get("success", False):
-                raise Exception(
-                    f"Unsuccessful query: {result.get('error','(No error returned)')}."
+
+    # Which combinations do we lack
+    if config.gap_detection == "database":
+        try:
+            with metrics.phase("gap_detection"):
+                missing_combinations = query_missing_combinations(
+                    database, dt_now, dt_past
                 )
-            if not "price" in result or not "volume" in result:
-                raise Exception("Missing price or volume field in response.")
-
-            # Extract data
-            price = result.get("price")
-            volume = result.get("volume")
-            new_entries.append(
-                {
-                    "item_id": item_id,
-                    "volume": volume,
-                    "price": price,
-                    "timestamp": dt,
-                }
+        except Exception as e:
+            raise dg.Failure(
+                f"Excpetion while getting missing combinations from database: {str(e)}"
             )
-            context.log.debug(
-                f"Successfuly crawled item: {item_id}, Time: {dt.isoformat()}."
+    else:
+        with metrics.phase("gap_detection"):
+            missing_combinations = backend.missing_combinations(
+                all_items,
+                available_price_data,
+                dt_now,
+                dt_past,
             )
+
+    skipped_combinations = None
+    if len(missing_combinations) > 0:
+        # Combinations that failed before are only tried again once their backoff expired
+        try:
+            with metrics.phase("db_read"):
+                backing_off = read_backing_off(database, dt_past, dt_now)
         except Exception as e:
-            context.log.warning(
-                f"Failed to crawl item_id: {item_id}, Time: {dt.isoformat()}. Reason: {str(e)}"
+            raise dg.Failure(f"Excpetion while reading the crawl ledger: {str(e)}")
+        num_missing = len(missing_combinations)
+        missing_combinations = backend.remove_backing_off(
+            missing_combinations, backing_off
+        )
+        skipped_combinations = num_missing - len(missing_combinations)
+        if skipped_combinations:
+            context.log.info(
+                f"Skipping {skipped_combinations} combinations that failed recently."
             )
 
-        # Return a status uptadte at least every 5% percent of progress
-        tried_entries += 1
-        if tried_entries % max(1, total_entries // 20) == 0:
-            context.log_event(
-                dg.AssetObservation(
-                    asset_key=context.asset_key,
-                    metadata={
-                        "successful": len(new_entries),
-                        "failed": tried_entries - len(new_entries),
-                        "total": total_entries,
-                        "progress": tried_entries / total_entries,
-                    },
-                )
+    if config.fetch_mode == "auto" and len(missing_combinations) > 0:
+        # Decided here, as the shards don't know how many items there are
+        missing_combinations = missing_combinations.assign(
+            by_range=mostly_missing_hours(
+                missing_combinations,
+                all_items["item_id"].nunique(),
+                config.range_min_missing,
             )
-    return new_entries
+        )
 
+    shard_by = config.shard_by
+    if shard_by == "auto":
+        shard_by = "item" if config.fetch_mode == "batch" else "time"
+    shards = split_missing_combinations(missing_combinations, config.shards, shard_by)
+    if shards:
+        # We need to crawl some data
+        context.log.info(
+            f"Found {len(missing_combinations)} missing combinations. Starting to crawl in {len(shards)} shard(s)"
+        )
 
-@dg.asset(
-    kinds={"json", "postgres", "python"},
-    group_name="Crawler",
-    description="Returns price data up to the last 10 days. If missing, the data will be crawled and inserted into the database.",
-    deps=["all_items", "available_price_data"],
-)
-def recent_price_data(
-    context: dg.AssetExecutionContext,
-    all_items: pd.DataFrame,
-    available_price_data: pd.DataFrame,
+    yield dg.Output(
+        {
+            "resumed": resumed,
+            "skipped_combinations": skipped_combinations,
+            "phase_seconds": metrics.phase_seconds,
+        },
+        "plan",
+    )
+    for number, shard in enumerate(shards):
+        yield dg.DynamicOutput(shard, mapping_key=str(number), output_name="shards")
+
+
+@dg.op(out=dg.Out(io_manager_key="crawl_io_manager"))
+def crawl_price_shard(
+    context: dg.OpExecutionContext,
+    config: CrawlConfig,
+    shard,
     database: DatabaseResource,
     api: ApiEndpointResource,
-) -> pd.DataFrame:
-    """Returns recent price data for the past 10 days. Determines what is missing, crawls it, stores it in the database."""
+) -> dict:
+    """Crawls one shard of the missing combinations and inserts it into the database.
+    Returns the shard's statistics, the rows themselves stay in the database."""
+    from marketcrawler.crawling import (
+        crawl_missing_price_data,
+        crawl_missing_price_ranges,
+    )
+    from marketcrawler.writer import ChunkedWriter
 
-    # The daterange we want to return price data for
-    dt_past = datetime.now(timezone.utc) - timedelta(days=10)
-    dt_now = datetime.now(timezone.utc)
+    metrics = RunMetrics(context)
+    # The shards' processes can't share a limiter, so each gets its part of the rate
+    api = api.share_rate_limit(config.shards)
+    if config.fetch_mode == "auto":
+        by_range = shard["by_range"].to_numpy()
+        shard = shard.drop(columns="by_range")
+        parts = [
+            (crawl_missing_price_ranges, shard[by_range]),
+            (crawl_missing_price_data, shard[~by_range]),
+        ]
+    elif config.fetch_mode == "range":
+        parts = [(crawl_missing_price_ranges, shard)]
+    else:
+        parts = [(crawl_missing_price_data, shard)]
+    failed_combinations = 0
+    held_back_combinations = 0
 
-    # We don't need to consider data older than 10 days
-    available_price_data = available_price_data[
-        available_price_data["timestamp"] >= dt_past
-    ]
+    try:
+        # Rows are written and committed in chunks while the crawl goes on
+        with ChunkedWriter(
+            database,
+            chunk_size=config.commit_size,
+            flush_seconds=config.commit_interval,
+            retry_backoff=config.retry_backoff_seconds,
+            retry_backoff_max=config.retry_backoff_max_seconds,
+        ) as writer:
 
-    # Which combinations do we lack
-    missing_combinations = determine_missing_combinations(
-        all_items,
-        available_price_data,
-        dt_now,
-        dt_past,
-    )
+            def on_failure(item_id: int, dt: datetime, error: Exception) -> None:
+                nonlocal failed_combinations, held_back_combinations
+                failed_combinations += 1
+                if isinstance(error, CircuitOpenError):
+                    # Never sent, so it doesn't count as an attempt
+                    held_back_combinations += 1
+                else:
+                    writer.fail(item_id, dt, str(error))
 
-    if len(missing_combinations) > 0:
-        # We need to crawl some data
-        context.log.info(
-            f"Found {len(missing_combinations)} missing combinations. Starting to crawl"
+            with metrics.phase("crawl"):
+                for crawl, part in parts:
+                    if len(part) > 0:
+                        crawl(
+                            context,
+                            part,
+                            api,
+                            writer.write,
+                            on_failure,
+                            metrics.api_latency,
+                        )
+
+        # Measured on the writer's thread, it overlaps with the crawl
+        metrics.add_phase("insert", writer.insert_seconds)
+    except Exception as e:
+        raise dg.Failure(
+            f"Excpetion while inserting price data into database: {str(e)}"
         )
-        new_entries = crawl_missing_price_data(context, missing_combinations, api)
 
-        # Insert the new data
-        context.log.info(
-            f"Found {len(new_entries)} price points. Inserting now",
+    return {
+        "failed_combinations": failed_combinations,
+        "held_back_combinations": held_back_combinations,
+        "inserted_rows": writer.inserted_rows,
+        "duplicate_rows": writer.duplicate_rows,
+        "committed_chunks": writer.committed_chunks,
+        "insert_seconds": writer.insert_seconds,
+        "phase_seconds": metrics.phase_seconds,
+        "api_latencies": metrics.api_latency.values,
+    }
+
+
+@dg.op
+def assemble_price_data(
+    context: dg.OpExecutionContext,
+    plan: dict,
+    results: list[dict],
+    available_price_data,
+    database: DatabaseResource,
+):
+    """Returns the price data for the partition's hour, including what the shards inserted,
+    and sums up their statistics."""
+    from marketcrawler.dtypes import compact_price_data
+    from marketcrawler.ledger import clear_crawled
+
+    dt_past, dt_now = context.partition_time_window
+    metrics = RunMetrics(context)
+    # Phases of several shards add up, like the time spent in each of them
+    for stats in [plan, *results]:
+        metrics.merge(stats["phase_seconds"], stats.get("api_latencies", []))
+
+    crawl_metadata = {}
+    if plan["skipped_combinations"] is not None:
+        crawl_metadata["skipped_combinations"] = dg.MetadataValue.int(
+            plan["skipped_combinations"]
         )
-        data_tuples = [
-            (entry["item_id"], entry["volume"], entry["price"], entry["timestamp"])
-            for entry in new_entries
-        ]
-        try:
+    # Also without any shards, a due combination may have been crawled by another run meanwhile,
+    # and its entry would keep the retry sensor requesting the hour
+    try:
+        with metrics.phase("ledger_cleanup"):
             with database.get_connection() as conn:
-                with conn.cursor() as cur:
-                    cur.executemany(
-                        "INSERT INTO price_data (item_id, volume, price, timestamp) VALUES (%s, %s, %s, %s)",
-                        data_tuples,
-                    )
+                clear_crawled(conn, dt_past, dt_now)
                 conn.commit()
+    except Exception as e:
+        raise dg.Failure(f"Excpetion while cleaning up the crawl ledger: {str(e)}")
 
-        except Exception as e:
-            raise dg.Failure(
-                f"Excpetion while inserting price data into database: {str(e)}"
+    insert_metadata = {}
+    if results:
+
+        def total(name: str) -> int | float:
+            return sum(stats[name] for stats in results)
+
+        if total("held_back_combinations"):
+            context.log.warning(
+                f"The api's circuit breaker was open, {total('held_back_combinations')} combinations were not requested."
             )
+        crawl_metadata["shards"] = dg.MetadataValue.int(len(results))
+        crawl_metadata["failed_combinations"] = dg.MetadataValue.int(
+            total("failed_combinations")
+        )
+        insert_metadata = {
+            "inserted_rows": dg.MetadataValue.int(total("inserted_rows")),
+            "duplicate_rows": dg.MetadataValue.int(total("duplicate_rows")),
+            "committed_chunks": dg.MetadataValue.int(total("committed_chunks")),
+            "insert_rows_per_second": dg.MetadataValue.float(
+                total("inserted_rows") / total("insert_seconds")
+                if total("insert_seconds") > 0
+                else 0.0
+            ),
+        }
+
+    if plan["resumed"] or any(
+        stats["inserted_rows"] + stats["duplicate_rows"] for stats in results
+    ):
+        # The shards committed their rows from other processes, so read the window back
         try:
-            # Read the new data from table
-            with database.get_connection() as conn:
-                df = pd.read_sql(
-                    "SELECT item_id, volume, price, timestamp FROM price_data", conn
-                )
+            with metrics.phase("db_read"):
+                df = read_price_data(database, dt_past, dt_now)
         except Exception as e:
             raise dg.Failure(
                 f"Excpetion while getting price data from database: {str(e)}"
             )
-        # Filter out old data
-        df = df[df["timestamp"] >= dt_past]
     else:
         # We can use what we got as input
         df = available_price_data
 
     # Sanitize and return the data
-    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
+    df = compact_price_data(df)
     context.add_output_metadata(
         {
             "num_records": dg.MetadataValue.int(len(df)),
             "columns": dg.MetadataValue.text(str(list(df.columns))),
             "preview": dg.MetadataValue.md(df.head().to_markdown()),
+            **crawl_metadata,
+            **insert_metadata,
+            **metrics.metadata(),
         }
     )
+    metrics.export()
 
     return df
+
+
+def map_crawl_config(config: dict) -> dict:
+    """Hands the asset's config to the ops that need it, so it's set once for the whole asset."""
+    return {
+        name: {"config": config} for name in ("plan_price_crawl", "crawl_price_shard")
+    }
+
+
+@dg.graph_asset(
+    kinds={"json", "postgres", "python"},
+    group_name="Crawler",
+    description="Returns the price data of the partition's hour. If missing, the data will be crawled and inserted into the database.",
+    ins={"all_items": dg.AssetIn(metadata={"columns": ["item_id"]})},
+    config=dg.ConfigMapping(
+        config_fn=map_crawl_config, config_schema=CrawlConfig.to_config_schema()
+    ),
+    partitions_def=hourly_partitions,
+    backfill_policy=hourly_backfill_policy,
+)
+def recent_price_data(all_items, available_price_data):
+    """Determines what is missing, crawls it in shards that each store their part in the database,
+    and returns the price data for the partition's hour."""
+    plan, shards = plan_price_crawl(all_items, available_price_data)
+    results = shards.map(crawl_price_shard).collect()
+    return assemble_price_data(plan, results, available_price_data)
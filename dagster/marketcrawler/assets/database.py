@@ -1,6 +1,13 @@
 import dagster as dg
-import pandas as pd
+from marketcrawler.metrics import RunMetrics
 from marketcrawler.resources import DatabaseResource
+from marketcrawler.partitions import hourly_partitions, hourly_backfill_policy
+from datetime import datetime
+from typing import TYPE_CHECKING, Iterator
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
 
 
 @dg.asset(
@@ -8,13 +15,17 @@ from marketcrawler.resources import DatabaseResource
     group_name="Database",
     description="Returns a dataframe with all available items.",
 )
-def all_items(
-    context: dg.AssetExecutionContext, database: DatabaseResource
-) -> pd.DataFrame:
+def all_items(context: dg.AssetExecutionContext, database: DatabaseResource):
     """Returns all items that we have (item_id, name, type)"""
+    # Imported here, so that loading the definitions doesn't pay for pandas
+    import pandas as pd
+    from marketcrawler.dtypes import compact_items
+
     with database.get_connection() as conn:
         try:
-            df = pd.read_sql("SELECT item_id, name, type FROM items", conn)
+            df = compact_items(
+                pd.read_sql("SELECT item_id, name, type FROM items", conn)
+            )
             context.add_output_metadata(
                 {
                     "num_records": dg.MetadataValue.int(len(df)),
@@ -27,30 +38,72 @@ def all_items(
             raise dg.Failure(f"Excpetion while getting items from database: {str(e)}")
 
 
+def iter_price_data(
+    database: DatabaseResource, dt_start: datetime, dt_end: datetime
+) -> Iterator["pa.Table"]:
+    """Streams the price data with dt_start <= timestamp < dt_end in chunks of the database's
+    `fetch_chunk_size` rows, as Arrow tables with the compact price schema."""
+    import pyarrow as pa
+    from marketcrawler.dtypes import PRICE_ARROW_SCHEMA
+
+    with database.get_connection() as conn:
+        # A named cursor keeps the result on the server, so only one chunk is held in memory.
+        # The window is served by the index on price_data's timestamp.
+        with conn.cursor(name="read_price_data") as cur:
+            cur.execute(
+                "SELECT item_id, volume, price, timestamp FROM price_data WHERE timestamp >= %(dt_start)s AND timestamp < %(dt_end)s",
+                {"dt_start": dt_start, "dt_end": dt_end},
+            )
+            while rows := cur.fetchmany(max(1, database.fetch_chunk_size)):
+                yield pa.Table.from_arrays(
+                    [
+                        pa.array(column, type=field.type)
+                        for column, field in zip(zip(*rows), PRICE_ARROW_SCHEMA)
+                    ],
+                    schema=PRICE_ARROW_SCHEMA,
+                )
+
+
+def read_price_data(
+    database: DatabaseResource, dt_start: datetime, dt_end: datetime
+) -> "pd.DataFrame":
+    """Reads the price data with dt_start <= timestamp < dt_end (item_id, volume, price, timestamp),
+    with compact dtypes."""
+    import pyarrow as pa
+    from marketcrawler.dtypes import PRICE_ARROW_SCHEMA
+
+    table = pa.concat_tables(
+        [PRICE_ARROW_SCHEMA.empty_table(), *iter_price_data(database, dt_start, dt_end)]
+    )
+    # self_destruct frees the Arrow buffers while converting, instead of holding both copies
+    return table.to_pandas(
+        split_blocks=True, self_destruct=True, coerce_temporal_nanoseconds=True
+    )
+
+
 @dg.asset(
     kinds={"postgres", "python"},
     group_name="Database",
-    description="Returns a dataframe with all available price entries.",
+    description="Returns a dataframe with the available price entries of the partition's hour.",
+    partitions_def=hourly_partitions,
+    backfill_policy=hourly_backfill_policy,
 )
-def available_price_data(
-    context: dg.AssetExecutionContext, database: DatabaseResource
-) -> pd.DataFrame:
-    """Returns all price data we have (item_id, volume, price, timestamp)"""
-    with database.get_connection() as conn:
-        try:
-            df = pd.read_sql(
-                "SELECT item_id, volume, price, timestamp FROM price_data", conn
-            )
-            context.add_output_metadata(
-                {
-                    "num_records": dg.MetadataValue.int(len(df)),
-                    "columns": dg.MetadataValue.text(str(list(df.columns))),
-                    "preview": dg.MetadataValue.md(df.head().to_markdown()),
-                }
-            )
-            df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
-            return df
-        except Exception as e:
-            raise dg.Failure(
-                f"Excpetion while getting price data from database: {str(e)}"
-            )
+def available_price_data(context: dg.AssetExecutionContext, database: DatabaseResource):
+    """Returns the price data we have for the partition's hour (item_id, volume, price, timestamp)"""
+    dt_start, dt_end = context.partition_time_window
+    metrics = RunMetrics(context)
+    try:
+        with metrics.phase("db_read"):
+            df = read_price_data(database, dt_start, dt_end)
+    except Exception as e:
+        raise dg.Failure(f"Excpetion while getting price data from database: {str(e)}")
+    context.add_output_metadata(
+        {
+            "num_records": dg.MetadataValue.int(len(df)),
+            "columns": dg.MetadataValue.text(str(list(df.columns))),
+            "preview": dg.MetadataValue.md(df.head().to_markdown()),
+            **metrics.metadata(),
+        }
+    )
+    metrics.export()
+    return df
@@ -1,92 +1,82 @@
 import dagster as dg
-import pandas as pd
-import plotly.subplots as subplt
-import plotly.graph_objects as go
 import os
-import plotly.express as px
+from marketcrawler.metrics import RunMetrics
+from marketcrawler.resources import ComputeResource, PriceCacheResource
+from datetime import datetime, timedelta, timezone
+
+
+class PriceWindowConfig(dg.Config):
+    """How many days of price data, counted back from now, to show, and how to render them."""
+
+    days: int = 10
+    # Number of points per subplot the series are downsampled to, all items together
+    max_points: int = 200_000
+    # Above this many points per subplot, WebGL is used instead of SVG
+    webgl_threshold: int = 20_000
+    # Number of dashboards kept in the dashboards volume, older ones are removed
+    keep_last: int = 50
 
 
 @dg.asset(
     kinds={"python", "plotly"},
     group_name="Report",
-    description="Generates a report of the last 10 days.",
-    deps=["recent_price_data", "all_items"],
+    description="Generates a report of the last days (10 by default).",
+    deps=["recent_price_data", "price_history_cache"],
+    ins={"all_items": dg.AssetIn(metadata={"columns": ["item_id", "name"]})},
 )
 def generate_plotly_dashboard(
     context: dg.AssetExecutionContext,
-    recent_price_data: pd.DataFrame,
-    all_items: pd.DataFrame,
+    config: PriceWindowConfig,
+    all_items,
+    price_cache: PriceCacheResource,
+    compute: ComputeResource,
 ):
-    """Generates a plotly dashboard for the price data of the last 10 days, and stores it in the dashboard-server's folder."""
-    df_with_items = recent_price_data.merge(all_items, on="item_id", how="left")
-    df_with_items = df_with_items.sort_values(["name", "timestamp"])
-
-    fig = subplt.make_subplots(
-        rows=2,
-        cols=1,
-        subplot_titles=("Prices Over Time", "Volumes Over Time"),
-        vertical_spacing=0.15,
-    )
-
-    unique_items = all_items["name"].unique()
+    """Generates a plotly dashboard for the price data of the configured window, and stores it in the dashboard-server's folder."""
+    # Plotly is only needed here, so it's not imported when loading the definitions
+    from marketcrawler.rendering import build_dashboard, publish_dashboard
 
-    colors = px.colors.qualitative.Plotly
+    # recent_price_data is partitioned by hour, so read the whole window from the local
+    # price cache instead of loading every partition
+    dt_now = datetime.now(timezone.utc)
+    metrics = RunMetrics(context)
+    try:
+        with metrics.phase("cache_read"):
+            recent_price_data = price_cache.read(
+                dt_now - timedelta(days=config.days), dt_now
+            )
+    except Exception as e:
+        raise dg.Failure(f"Excpetion while reading the price cache: {str(e)}")
+    with metrics.phase("join"):
+        df_with_items = compute.get_backend().join_items(recent_price_data, all_items)
 
-    for i, item_name in enumerate(unique_items):
-        item_data = df_with_items[df_with_items["name"] == item_name]
-        color = colors[i % len(colors)]
-
-        fig.add_trace(
-            go.Scatter(
-                x=item_data["timestamp"],
-                y=item_data["price"],
-                mode="lines",
-                name=f"{item_name}",
-                legendgroup=f"item_{i}",
-                line=dict(color=color),
-                marker=dict(color=color),
-                showlegend=True,
-            ),
-            row=1,
-            col=1,
+    with metrics.phase("render"):
+        fig, stats = build_dashboard(
+            df_with_items,
+            list(all_items["name"].unique()),
+            max_points=config.max_points,
+            webgl_threshold=config.webgl_threshold,
+            presorted=True,
         )
 
-        fig.add_trace(
-            go.Scatter(
-                x=item_data["timestamp"],
-                y=item_data["volume"],
-                mode="lines",
-                name=f"{item_name}",
-                legendgroup=f"item_{i}",
-                line=dict(color=color),
-                marker=dict(color=color),
-                showlegend=False,
-            ),
-            row=2,
-            col=1,
-        )
-
-    fig.update_layout(
-        height=800,
-        title_text="Price Data Dashboard",
-        hovermode="x unified",
-    )
-
-    fig.update_xaxes(title_text="Time", row=1, col=1)
-    fig.update_xaxes(title_text="Time", row=2, col=1)
-
-    fig.update_yaxes(title_text="Price", row=1, col=1)
-    fig.update_yaxes(title_text="Volume", row=2, col=1)
-
     dashboard_name = f"dashboard_{context.run_id}.html"
-    html_path = os.path.join("/app", "dashboards", dashboard_name)
-    os.makedirs(os.path.dirname(html_path), exist_ok=True)
-
-    fig.write_html(html_path)
+    with metrics.phase("publish"):
+        published = publish_dashboard(
+            fig,
+            os.path.join("/app", "dashboards"),
+            dashboard_name,
+            keep_last=config.keep_last,
+        )
 
     url = f"http://localhost/dashboards/{dashboard_name}"
     context.add_output_metadata(
         {
             "dashboard": dg.MetadataValue.url(url),
+            "num_records": dg.MetadataValue.int(stats["num_records"]),
+            "rendered_points": dg.MetadataValue.int(stats["rendered_points"]),
+            "webgl": dg.MetadataValue.bool(stats["webgl"]),
+            "size_bytes": dg.MetadataValue.int(published["size_bytes"]),
+            "pruned_dashboards": dg.MetadataValue.int(published["pruned_dashboards"]),
+            **metrics.metadata(),
         }
     )
+    metrics.export()
@@ -0,0 +1,71 @@
+import dagster as dg
+from marketcrawler.resources import (
+    DatabaseResource,
+    PriceCacheResource,
+    RetentionResource,
+)
+from datetime import datetime, timezone
+
+
+@dg.asset(
+    kinds={"parquet", "postgres", "python"},
+    group_name="Database",
+    description="Drops the monthly partitions of price_data, the days of the price cache and the crawl ledger entries that are older than the retention period.",
+    deps=["price_history_cache", "price_rollups"],
+)
+def price_data_retention(
+    context: dg.AssetExecutionContext,
+    database: DatabaseResource,
+    price_cache: PriceCacheResource,
+    retention: RetentionResource,
+) -> None:
+    """Drops expired partitions of price_data, after the price cache and the rollups picked up their rows,
+    and the same months from the price cache and the crawl ledger."""
+    from marketcrawler.ledger import drop_expired_entries
+    from marketcrawler.price_partitions import drop_expired_partitions, month_of
+
+    dropped = []
+    dropped_days = []
+    dropped_entries = 0
+    dt_cutoff = retention.get_cutoff()
+    if dt_cutoff is not None:
+        try:
+            with database.get_connection() as conn:
+                dropped = drop_expired_partitions(conn, dt_cutoff)
+                conn.commit()
+        except Exception as e:
+            raise dg.Failure(f"Excpetion while dropping old price data: {str(e)}")
+        if dropped:
+            context.log.info(f"Dropped partitions {', '.join(dropped)}.")
+
+        # The cache and the ledger keep the months that Postgres kept, i.e. everything from the
+        # cutoff's month on. A combination whose partition is gone can't be crawled again anyway.
+        month = month_of(dt_cutoff)
+        dt_month = datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+        try:
+            with database.get_connection() as conn:
+                dropped_entries = drop_expired_entries(conn, dt_month)
+                conn.commit()
+        except Exception as e:
+            raise dg.Failure(
+                f"Excpetion while dropping old crawl ledger entries: {str(e)}"
+            )
+        if dropped_entries:
+            context.log.info(f"Dropped {dropped_entries} crawl ledger entries.")
+
+        try:
+            dropped_days = price_cache.drop_before(dt_month)
+        except Exception as e:
+            raise dg.Failure(f"Excpetion while dropping old cached days: {str(e)}")
+        if dropped_days:
+            context.log.info(
+                f"Dropped {len(dropped_days)} days from the price cache, up to {dropped_days[-1]}."
+            )
+    context.add_output_metadata(
+        {
+            "retention_days": dg.MetadataValue.int(retention.retention_days),
+            "dropped_partitions": dg.MetadataValue.int(len(dropped)),
+            "dropped_cache_days": dg.MetadataValue.int(len(dropped_days)),
+            "dropped_ledger_entries": dg.MetadataValue.int(dropped_entries),
+        }
+    )
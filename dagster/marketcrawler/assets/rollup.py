@@ -0,0 +1,153 @@
+import dagster as dg
+import time
+from marketcrawler.resources import DatabaseResource
+from marketcrawler.partitions import hourly_partitions, hourly_backfill_policy
+from datetime import datetime
+
+# Serializes rollup updates, so that runs of neighbouring hours don't compute days and
+# rolling windows from each other's uncommitted rows. Any constant works, it only has to be unique.
+ROLLUP_LOCK_ID = 727_001
+
+# The log return of an hour's vwap over the previous hour's, in a query over price_rollup_hourly
+# with the window w. NULL if the previous hour is missing or either of them didn't trade.
+LOG_RETURN = """
+    CASE
+        WHEN lag(hour) OVER w = hour - interval '1 hour' AND lag(vwap) OVER w > 0 AND vwap > 0
+        THEN ln(vwap / lag(vwap) OVER w)
+    END
+"""
+
+
+def update_rollups(
+    database: DatabaseResource, dt_start: datetime, dt_end: datetime
+) -> dict:
+    """Recomputes the hourly rollups of [dt_start, dt_end), the rolling volatility of the hours
+    whose window includes them, and the daily rollups of the days they belong to. Volatility is
+    the standard deviation of the hourly log returns of the vwap."""
+    params = {"dt_start": dt_start, "dt_end": dt_end}
+    with database.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (ROLLUP_LOCK_ID,))
+
+            cur.execute(
+                """
+                INSERT INTO price_rollup_hourly (item_id, hour, num_points, volume, vwap, min_price, max_price, mean_price)
+                SELECT
+                    item_id,
+                    date_trunc('hour', timestamp) AS hour,
+                    count(*),
+                    sum(volume),
+                    sum(price * volume) / nullif(sum(volume), 0),
+                    min(price),
+                    max(price),
+                    avg(price)
+                FROM price_data
+                WHERE timestamp >= %(dt_start)s AND timestamp < %(dt_end)s
+                GROUP BY item_id, date_trunc('hour', timestamp)
+                ON CONFLICT (item_id, hour) DO UPDATE SET
+                    num_points = EXCLUDED.num_points,
+                    volume = EXCLUDED.volume,
+                    vwap = EXCLUDED.vwap,
+                    min_price = EXCLUDED.min_price,
+                    max_price = EXCLUDED.max_price,
+                    mean_price = EXCLUDED.mean_price
+                """,
+                params,
+            )
+            hourly_rows = cur.rowcount
+
+            # The new hours' returns, and the return of the hour after them, are part of the rolling
+            # windows of the 23 hours after them. The earliest window needs the vwap 24 hours back.
+            cur.execute(
+                f"""
+                UPDATE price_rollup_hourly SET volatility_24h = rolling.volatility
+                FROM (
+                    SELECT
+                        item_id,
+                        hour,
+                        stddev_samp(log_return) OVER (
+                            PARTITION BY item_id ORDER BY hour
+                            RANGE BETWEEN interval '23 hours' PRECEDING AND CURRENT ROW
+                        ) AS volatility
+                    FROM (
+                        SELECT item_id, hour, {LOG_RETURN} AS log_return
+                        FROM price_rollup_hourly
+                        WHERE hour >= %(dt_start)s - interval '24 hours'
+                        AND hour < %(dt_end)s + interval '24 hours'
+                        WINDOW w AS (PARTITION BY item_id ORDER BY hour)
+                    ) AS returns
+                ) AS rolling
+                WHERE price_rollup_hourly.item_id = rolling.item_id
+                AND price_rollup_hourly.hour = rolling.hour
+                AND rolling.hour >= %(dt_start)s
+                """,
+                params,
+            )
+
+            # Also the day of dt_end, whose first hour's return may have changed. The return of
+            # a day's first hour is taken over the last hour of the day before.
+            cur.execute(
+                f"""
+                INSERT INTO price_rollup_daily (item_id, day, num_points, volume, vwap, min_price, max_price, mean_price, volatility)
+                SELECT
+                    item_id,
+                    (hour AT TIME ZONE 'UTC')::date AS day,
+                    sum(num_points),
+                    sum(volume),
+                    sum(vwap * volume) / nullif(sum(volume), 0),
+                    min(min_price),
+                    max(max_price),
+                    sum(mean_price * num_points) / sum(num_points),
+                    stddev_samp(log_return)
+                FROM (
+                    SELECT *, {LOG_RETURN} AS log_return
+                    FROM price_rollup_hourly
+                    WHERE hour >= date_trunc('day', %(dt_start)s AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' - interval '1 hour'
+                    AND hour < date_trunc('day', %(dt_end)s AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' + interval '1 day'
+                    WINDOW w AS (PARTITION BY item_id ORDER BY hour)
+                ) AS returns
+                WHERE hour >= date_trunc('day', %(dt_start)s AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'
+                GROUP BY item_id, (hour AT TIME ZONE 'UTC')::date
+                ON CONFLICT (item_id, day) DO UPDATE SET
+                    num_points = EXCLUDED.num_points,
+                    volume = EXCLUDED.volume,
+                    vwap = EXCLUDED.vwap,
+                    min_price = EXCLUDED.min_price,
+                    max_price = EXCLUDED.max_price,
+                    mean_price = EXCLUDED.mean_price,
+                    volatility = EXCLUDED.volatility
+                """,
+                params,
+            )
+            daily_rows = cur.rowcount
+        conn.commit()
+    return {"hourly_rows": hourly_rows, "daily_rows": daily_rows}
+
+
+@dg.asset(
+    kinds={"postgres", "python"},
+    group_name="Database",
+    description="Keeps hourly and daily per item statistics (volume, VWAP, min/max/mean price, volatility of the hourly VWAP log returns) up to date for the partition's hour.",
+    deps=["recent_price_data"],
+    partitions_def=hourly_partitions,
+    backfill_policy=hourly_backfill_policy,
+)
+def price_rollups(
+    context: dg.AssetExecutionContext,
+    database: DatabaseResource,
+) -> None:
+    """Updates the rollup tables for the partition's hour, and for the day it belongs to."""
+    dt_start, dt_end = context.partition_time_window
+    try:
+        start = time.perf_counter()
+        stats = update_rollups(database, dt_start, dt_end)
+        seconds = time.perf_counter() - start
+    except Exception as e:
+        raise dg.Failure(f"Excpetion while updating the price rollups: {str(e)}")
+    context.add_output_metadata(
+        {
+            "hourly_rows": dg.MetadataValue.int(stats["hourly_rows"]),
+            "daily_rows": dg.MetadataValue.int(stats["daily_rows"]),
+            "seconds": dg.MetadataValue.float(seconds),
+        }
+    )
@@ -0,0 +1,411 @@
+import importlib
+import math
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Generator, Iterator
+from marketcrawler.crawling import determine_missing_combinations, to_epoch_hours
+from marketcrawler.ledger import remove_backing_off
+from marketcrawler.resources.compute import missing_package_message
+
+
+def import_optional(name: str):
+    """Imports an optional dependency of a compute backend, or explains how to get it."""
+    try:
+        return importlib.import_module(name)
+    except ImportError as e:
+        raise ImportError(missing_package_message(name)) from e
+
+
+def to_epoch_ns(timestamps: pd.Series) -> np.ndarray:
+    """Converts timezone aware timestamps to nanoseconds since the unix epoch."""
+    return pd.to_datetime(timestamps, utc=True).dt.as_unit("ns").array.asi8
+
+
+def window_hours(dt_now: datetime, dt_past: datetime) -> np.ndarray:
+    """Returns every full hour from dt_past (inclusive) to dt_now (exclusive), in hours since the unix epoch."""
+    first_hour = math.ceil(dt_past.timestamp() / 3600)
+    return np.arange(
+        first_hour,
+        max(first_hour, math.ceil(dt_now.timestamp() / 3600)),
+        dtype=np.int64,
+    )
+
+
+def cell_blocks(
+    num_items: int, num_hours: int, block_size: int
+) -> Iterator[tuple[int, int]]:
+    """Yields the [low, high) ranges of cell keys, position of the item * num_hours + hour within
+    the window, of blocks of whole items with about block_size cells each."""
+    items_per_block = max(1, block_size // num_hours)
+    for first_item in range(0, num_items, items_per_block):
+        yield first_item * num_hours, min(
+            first_item + items_per_block, num_items
+        ) * num_hours
+
+
+def combinations_frame(item_ids: np.ndarray, hours: np.ndarray) -> pd.DataFrame:
+    """Builds the (item_id, timestamp) frame determine_missing_combinations returns."""
+    return pd.DataFrame(
+        {
+            "item_id": item_ids.astype(np.int64),
+            "timestamp": pd.to_datetime(hours * 3600, unit="s", utc=True),
+        }
+    )
+
+
+def name_codes(all_items: pd.DataFrame) -> tuple[np.ndarray, int]:
+    """Returns the position of every item's name in the order pandas sorts names in, and the
+    position that items without a name, or rows without an item, are sorted to (the last).
+    """
+    names = all_items["name"]
+    if not isinstance(names.dtype, pd.CategoricalDtype):
+        names = names.astype("category")
+    codes = names.cat.codes.to_numpy(dtype=np.int64)
+    unnamed = len(names.cat.categories)
+    return np.where(codes < 0, unnamed, codes), unnamed
+
+
+def joined_frame(
+    price_data: pd.DataFrame,
+    all_items: pd.DataFrame,
+    positions: np.ndarray,
+    item_positions: np.ndarray,
+) -> pd.DataFrame:
+    """Builds the rows of the left join of the price data with the items, from the positions of
+    their price data and item rows. An item position of -1 stands for no matching item.
+    """
+    items = all_items.drop(columns="item_id").reset_index(drop=True)
+    return pd.concat(
+        [
+            price_data.take(positions).reset_index(drop=True),
+            # Like in a merge, columns of missing items become NaN
+            items.reindex(item_positions).reset_index(drop=True),
+        ],
+        axis=1,
+    )
+
+
+class PandasBackend:
+    """Runs the pipeline's transforms with pandas and numpy. The other backends run the same
+    joins, filters and sorts on their own engine, only handing positions back to pandas, so
+    that they return exactly the same frames, all with a fresh RangeIndex.
+    """
+
+    name = "pandas"
+
+    def missing_combinations(
+        self,
+        all_items: pd.DataFrame,
+        available_price_data: pd.DataFrame,
+        dt_now: datetime,
+        dt_past: datetime,
+    ) -> pd.DataFrame:
+        """Same as determine_missing_combinations, sorted by item_id and timestamp."""
+        return determine_missing_combinations(
+            all_items, available_price_data, dt_now, dt_past
+        )
+
+    def remove_backing_off(
+        self, missing_combinations: pd.DataFrame, backing_off: pd.DataFrame
+    ) -> pd.DataFrame:
+        """Same as ledger.remove_backing_off, keeping the order of the missing combinations."""
+        return remove_backing_off(missing_combinations, backing_off).reset_index(
+            drop=True
+        )
+
+    def join_items(
+        self, price_data: pd.DataFrame, all_items: pd.DataFrame
+    ) -> pd.DataFrame:
+        """Left joins the price data with the items, sorted by name and timestamp."""
+        return (
+            price_data.merge(all_items, on="item_id", how="left")
+            .sort_values(["name", "timestamp"])
+            .reset_index(drop=True)
+        )
+
+
+class PolarsBackend(PandasBackend):
+    """Runs the transforms as lazy Polars queries, which use all cores. The number of threads is
+    set with the POLARS_MAX_THREADS environment variable."""
+
+    name = "polars"
+
+    def __init__(self, block_size: int = 10_000_000):
+        self.pl = import_optional("polars")
+        # The cross join of items and hours is computed in blocks of about this many cells
+        self.block_size = block_size
+
+    def missing_combinations(self, all_items, available_price_data, dt_now, dt_past):
+        pl = self.pl
+        item_ids = np.unique(all_items["item_id"].to_numpy(dtype=np.int64))
+        hours = window_hours(dt_now, dt_past)
+        if len(item_ids) == 0 or len(hours) == 0:
+            return combinations_frame(item_ids[:0], hours)
+        first_hour, num_hours = int(hours[0]), len(hours)
+
+        # Every cell of the window is a single integer key, which joins much faster than
+        # (item_id, hour) pairs
+        known = (
+            pl.DataFrame(
+                {
+                    "item_id": available_price_data["item_id"].to_numpy(np.int64),
+                    "hour": to_epoch_hours(available_price_data["timestamp"]),
+                }
+            )
+            .lazy()
+            .filter(pl.col("hour").is_between(first_hour, first_hour + num_hours - 1))
+            .join(
+                pl.DataFrame(
+                    {"item_id": item_ids, "position": np.arange(len(item_ids))}
+                ).lazy(),
+                on="item_id",
+                how="inner",
+            )
+            .select(key=pl.col("position") * num_hours + pl.col("hour") - first_hour)
+            .collect()
+        )
+
+        blocks = []
+        for low, high in cell_blocks(len(item_ids), num_hours, self.block_size):
+            blocks.append(
+                pl.DataFrame({"key": pl.int_range(low, high, eager=True)})
+                .lazy()
+                .join(
+                    known.lazy().filter(pl.col("key").is_between(low, high - 1)),
+                    on="key",
+                    how="anti",
+                )
+                .sort("key")
+                .collect()["key"]
+                .to_numpy()
+            )
+        keys = np.concatenate(blocks)
+        return combinations_frame(
+            item_ids[keys // num_hours], first_hour + keys % num_hours
+        )
+
+    def remove_backing_off(self, missing_combinations, backing_off):
+        if len(backing_off) == 0:
+            return missing_combinations.reset_index(drop=True)
+        pl = self.pl
+        positions = (
+            pl.DataFrame(
+                {
+                    "position": np.arange(len(missing_combinations)),
+                    "item_id": missing_combinations["item_id"].to_numpy(np.int64),
+                    "timestamp": to_epoch_ns(missing_combinations["timestamp"]),
+                }
+            )
+            .lazy()
+            .join(
+                pl.DataFrame(
+                    {
+                        "item_id": backing_off["item_id"].to_numpy(np.int64),
+                        "timestamp": to_epoch_ns(backing_off["timestamp"]),
+                    }
+                ).lazy(),
+                on=["item_id", "timestamp"],
+                how="anti",
+            )
+            .sort("position")
+            .collect()["position"]
+            .to_numpy()
+        )
+        return missing_combinations.take(positions).reset_index(drop=True)
+
+    def join_items(self, price_data, all_items):
+        pl = self.pl
+        codes, unnamed = name_codes(all_items)
+        ordered = (
+            pl.DataFrame(
+                {
+                    "position": np.arange(len(price_data)),
+                    "item_id": price_data["item_id"].to_numpy(np.int64),
+                    "timestamp": to_epoch_ns(price_data["timestamp"]),
+                }
+            )
+            .lazy()
+            .join(
+                pl.DataFrame(
+                    {
+                        "item_position": np.arange(len(all_items)),
+                        "item_id": all_items["item_id"].to_numpy(np.int64),
+                        "name_code": codes,
+                    }
+                ).lazy(),
+                on="item_id",
+                how="left",
+                maintain_order="left_right",
+            )
+            .with_columns(
+                pl.col("item_position").fill_null(-1),
+                pl.col("name_code").fill_null(unnamed),
+            )
+            # Sorting by a single key is several times faster than by name and timestamp. The
+            # sort is stable, so ties keep the order of the merge, like pandas' stable sort does.
+            .sort(
+                pl.col("name_code") * (pl.len().cast(pl.Int64) + 1)
+                + pl.col("timestamp").rank("dense").cast(pl.Int64),
+                maintain_order=True,
+            )
+            .collect()
+        )
+        return joined_frame(
+            price_data,
+            all_items,
+            ordered["position"].to_numpy(),
+            ordered["item_position"].to_numpy(),
+        )
+
+
+class DuckDBBackend(PandasBackend):
+    """Runs the transforms as DuckDB queries over Arrow tables, which use all cores, and spill
+    to disk instead of running out of memory."""
+
+    name = "duckdb"
+
+    def __init__(self, block_size: int = 10_000_000):
+        self.duckdb = import_optional("duckdb")
+        # The missing cells of the window are computed in blocks of about this many cells
+        self.block_size = block_size
+
+    @contextmanager
+    def connect(self, **tables: dict) -> Generator:
+        """Opens a new in-memory database, with the given columns registered as tables."""
+        con = self.duckdb.connect()
+        try:
+            for name, columns in tables.items():
+                con.register(name, pa.table(columns))
+            yield con
+        finally:
+            con.close()
+
+    def query(self, query: str, params: list, **tables: dict) -> pa.Table:
+        """Runs the query on a new in-memory database, with the given columns registered as tables."""
+        with self.connect(**tables) as con:
+            return con.execute(query, params).to_arrow_table()
+
+    def missing_combinations(self, all_items, available_price_data, dt_now, dt_past):
+        item_ids = np.unique(all_items["item_id"].to_numpy(dtype=np.int64))
+        hours = window_hours(dt_now, dt_past)
+        if len(item_ids) == 0 or len(hours) == 0:
+            return combinations_frame(item_ids[:0], hours)
+        first_hour, num_hours = int(hours[0]), len(hours)
+
+        blocks = []
+        with self.connect(
+            items={"item_id": item_ids, "position": np.arange(len(item_ids))},
+            known={
+                "item_id": available_price_data["item_id"].to_numpy(np.int64),
+                "hour": to_epoch_hours(available_price_data["timestamp"]),
+            },
+        ) as con:
+            for low, high in cell_blocks(len(item_ids), num_hours, self.block_size):
+                # Every cell of the window is a single integer key, like in the Polars backend
+                blocks.append(
+                    con.execute(
+                        """
+                        SELECT cells.range AS key FROM range($low, $high) AS cells
+                        ANTI JOIN (
+                            SELECT items.position * $num_hours + known.hour - $first_hour AS key
+                            FROM known JOIN items ON items.item_id = known.item_id
+                            WHERE items.position >= $low // $num_hours
+                            AND items.position < $high // $num_hours
+                            AND known.hour >= $first_hour
+                            AND known.hour < $first_hour + $num_hours
+                        ) AS known_keys ON known_keys.key = cells.range
+                        ORDER BY key
+                        """,
+                        {
+                            "low": low,
+                            "high": high,
+                            "first_hour": first_hour,
+                            "num_hours": num_hours,
+                        },
+                    )
+                    .to_arrow_table()["key"]
+                    .to_numpy()
+                )
+        keys = np.concatenate(blocks)
+        return combinations_frame(
+            item_ids[keys // num_hours], first_hour + keys % num_hours
+        )
+
+    def remove_backing_off(self, missing_combinations, backing_off):
+        if len(backing_off) == 0:
+            return missing_combinations.reset_index(drop=True)
+        kept = self.query(
+            """
+            SELECT missing.position FROM missing
+            WHERE NOT EXISTS (
+                SELECT 1 FROM backing_off
+                WHERE backing_off.item_id = missing.item_id
+                AND backing_off.timestamp = missing.timestamp
+            )
+            ORDER BY missing.position
+            """,
+            [],
+            missing={
+                "position": np.arange(len(missing_combinations)),
+                "item_id": missing_combinations["item_id"].to_numpy(np.int64),
+                "timestamp": to_epoch_ns(missing_combinations["timestamp"]),
+            },
+            backing_off={
+                "item_id": backing_off["item_id"].to_numpy(np.int64),
+                "timestamp": to_epoch_ns(backing_off["timestamp"]),
+            },
+        )
+        return missing_combinations.take(kept["position"].to_numpy()).reset_index(
+            drop=True
+        )
+
+    def join_items(self, price_data, all_items):
+        codes, unnamed = name_codes(all_items)
+        ordered = self.query(
+            """
+            SELECT
+                prices.position,
+                coalesce(items.item_position, -1) AS item_position,
+                coalesce(items.name_code, ?) AS name_code,
+                prices.timestamp
+            FROM prices
+            LEFT JOIN items ON items.item_id = prices.item_id
+            ORDER BY name_code, prices.timestamp, prices.position, item_position
+            """,
+            [unnamed],
+            prices={
+                "position": np.arange(len(price_data)),
+                "item_id": price_data["item_id"].to_numpy(np.int64),
+                "timestamp": to_epoch_ns(price_data["timestamp"]),
+            },
+            items={
+                "item_position": np.arange(len(all_items)),
+                "item_id": all_items["item_id"].to_numpy(np.int64),
+                "name_code": codes,
+            },
+        )
+        return joined_frame(
+            price_data,
+            all_items,
+            ordered["position"].to_numpy(),
+            ordered["item_position"].to_numpy(),
+        )
+
+
+BACKENDS = {
+    "pandas": PandasBackend,
+    "polars": PolarsBackend,
+    "duckdb": DuckDBBackend,
+}
+
+
+def get_compute_backend(name: str) -> PandasBackend:
+    """Returns the backend of the given name. Raises an ImportError if its package is missing."""
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown compute backend {name!r}, expected one of {', '.join(BACKENDS)}."
+        )
+    return BACKENDS[name]()
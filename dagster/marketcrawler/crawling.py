@@ -0,0 +1,441 @@
+import dagster as dg
+import json
+import math
+import numpy as np
+import pandas as pd
+from marketcrawler.metrics import LatencyHistogram
+from marketcrawler.resources import DatabaseResource, ApiEndpointResource
+from marketcrawler.resources.api import MAX_BATCH_SIZE, CircuitOpenError
+from datetime import datetime
+from typing import Callable, Iterator, Literal
+
+
+def to_epoch_hours(timestamps: pd.Series) -> np.ndarray:
+    """Converts timezone aware timestamps to whole hours since the unix epoch, rounding down.
+    Missing timestamps become a large negative number, outside of any window."""
+    units_per_hour = pd.Timedelta(hours=1) // pd.Timedelta(1, unit=timestamps.dt.unit)
+    return timestamps.array.asi8 // units_per_hour
+
+
+def iter_missing_combinations(
+    all_items: pd.DataFrame,
+    available_price_data: pd.DataFrame,
+    dt_now: datetime,
+    dt_past: datetime,
+    block_size: int = 1_000_000,
+) -> Iterator[pd.DataFrame]:
+    """Yields the (item_id, timestamp) combinations of every full hour from dt_past (inclusive) to dt_now (exclusive)
+    that are missing in the price data. Items are processed in blocks of about `block_size` (item, hour) cells,
+    so memory is bounded by the block size and not by the number of items times hours in the window.
+    """
+    first_hour = math.ceil(dt_past.timestamp() / 3600)
+    num_hours = max(0, math.ceil(dt_now.timestamp() / 3600) - first_hour)
+    item_ids = np.unique(all_items["item_id"].to_numpy(dtype=np.int64))
+    if num_hours == 0 or len(item_ids) == 0:
+        return
+
+    # Key every price point we have by (index of its item, hour within the window)
+    hours = to_epoch_hours(available_price_data["timestamp"]) - first_hour
+    items = available_price_data["item_id"].to_numpy(dtype=np.int64)
+    positions = np.searchsorted(item_ids, items)
+    is_known = (
+        (positions < len(item_ids))
+        & (item_ids[np.minimum(positions, len(item_ids) - 1)] == items)
+        & (hours >= 0)
+        & (hours < num_hours)
+    )
+    keys = np.sort(positions[is_known] * num_hours + hours[is_known])
+
+    items_per_block = max(1, block_size // num_hours)
+    for first_item in range(0, len(item_ids), items_per_block):
+        last_item = min(first_item + items_per_block, len(item_ids))
+        lowest_key = first_item * num_hours
+        highest_key = last_item * num_hours
+
+        # Bitmap of the block's cells, cleared for every price point we have
+        is_missing = np.ones(highest_key - lowest_key, dtype=bool)
+        is_missing[
+            keys[np.searchsorted(keys, lowest_key) : np.searchsorted(keys, highest_key)]
+            - lowest_key
+        ] = False
+        offsets = np.flatnonzero(is_missing)
+        if len(offsets) == 0:
+            continue
+
+        yield pd.DataFrame(
+            {
+                "item_id": item_ids[first_item + offsets // num_hours],
+                "timestamp": pd.to_datetime(
+                    (first_hour + offsets % num_hours) * 3600, unit="s", utc=True
+                ),
+            }
+        )
+
+
+def determine_missing_combinations(
+    all_items: pd.DataFrame,
+    available_price_data: pd.DataFrame,
+    dt_now: datetime,
+    dt_past: datetime,
+) -> pd.DataFrame:
+    """Determines all (item_id, timestamp) combinations of every full hour from dt_past (inclusive) to dt_now (exclusive) that are missing in the price data."""
+    blocks = list(
+        iter_missing_combinations(all_items, available_price_data, dt_now, dt_past)
+    )
+    if not blocks:
+        return pd.DataFrame(
+            {
+                "item_id": pd.Series(dtype=np.int64),
+                "timestamp": pd.Series(dtype="datetime64[ns, UTC]"),
+            }
+        )
+    return pd.concat(blocks, ignore_index=True)
+
+
+def query_missing_combinations(
+    database: DatabaseResource,
+    dt_now: datetime,
+    dt_past: datetime,
+) -> pd.DataFrame:
+    """Same as determine_missing_combinations, but computed inside Postgres. Only the missing
+    (item_id, timestamp) combinations are transferred, not the items or the price data.
+    """
+    first_hour = math.ceil(dt_past.timestamp() / 3600) * 3600
+    end_hour = math.ceil(dt_now.timestamp() / 3600) * 3600
+    with database.get_connection() as conn:
+        # The range predicate lets Postgres use the (item_id, timestamp) index per hour
+        df = pd.read_sql(
+            """
+            SELECT items.item_id, hours.hour AS timestamp
+            FROM items
+            CROSS JOIN generate_series(
+                to_timestamp(%(first_hour)s),
+                to_timestamp(%(end_hour)s) - interval '1 hour',
+                interval '1 hour'
+            ) AS hours(hour)
+            WHERE NOT EXISTS (
+                SELECT 1 FROM price_data
+                WHERE price_data.item_id = items.item_id
+                AND price_data.timestamp >= hours.hour
+                AND price_data.timestamp < hours.hour + interval '1 hour'
+            )
+            ORDER BY items.item_id, hours.hour
+            """,
+            conn,
+            params={"first_hour": first_hour, "end_hour": end_hour},
+        )
+    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
+    return df
+
+
+def parse_price_result(result: dict, item_id: int, dt: datetime) -> dict:
+    """Validates a single price result returned by the api and turns it into a price_data entry."""
+    # Various checks to make we successfully got data
+    if not result.get("success", False):
+        raise Exception(
+            f"Unsuccessful query: {result.get('error','(No error returned)')}."
+        )
+    if not "price" in result or not "volume" in result:
+        raise Exception("Missing price or volume field in response.")
+
+    return {
+        "item_id": item_id,
+        "volume": result.get("volume"),
+        "price": result.get("price"),
+        "timestamp": dt,
+    }
+
+
+def fetch_price_point(api: ApiEndpointResource, item_id: int, dt: datetime) -> dict:
+    """Requests the price and volume of one item at one point in time from the api."""
+    response = api.request(
+        item_id=str(item_id),
+        time=dt.isoformat(),
+    )
+    response.raise_for_status()
+    return parse_price_result(response.json(), item_id, dt)
+
+
+def fetch_price_batch(
+    api: ApiEndpointResource, batch: list[tuple[int, datetime]]
+) -> list[dict | Exception]:
+    """Requests a batch of (item_id, datetime) pairs. Returns one entry per pair,
+    or the exception describing why that pair failed."""
+    if len(batch) == 1:
+        # No need for the batch endpoint
+        try:
+            return [fetch_price_point(api, *batch[0])]
+        except Exception as e:
+            return [e]
+
+    response = api.request_batch(
+        [(str(item_id), dt.isoformat()) for item_id, dt in batch]
+    )
+    response.raise_for_status()
+    results = response.json().get("results", [])
+    if len(results) != len(batch):
+        raise Exception(
+            f"Expected {len(batch)} results in batch response, got {len(results)}."
+        )
+
+    entries = []
+    for (item_id, dt), result in zip(batch, results):
+        try:
+            entries.append(parse_price_result(result, item_id, dt))
+        except Exception as e:
+            entries.append(e)
+    return entries
+
+
+def log_crawl_progress(
+    context: dg.AssetExecutionContext, successful: int, tried: int, total: int
+) -> None:
+    context.log_event(
+        dg.AssetObservation(
+            asset_key=context.asset_key,
+            metadata={
+                "successful": successful,
+                "failed": tried - successful,
+                "total": total,
+                "progress": tried / total,
+            },
+        )
+    )
+
+
+def fetch_price_range(
+    api: ApiEndpointResource,
+    dt_start: datetime,
+    dt_end: datetime,
+    item_id: int | None = None,
+) -> list[dict]:
+    """Requests every hour in [dt_start, dt_end) for one item or all items with a single, streamed request."""
+    entries = []
+    # Closing the streamed response hands its connection back to the session's pool
+    with api.request_range(
+        dt_start.isoformat(),
+        dt_end.isoformat(),
+        str(item_id) if item_id is not None else None,
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            result = json.loads(line)
+            entries.append(
+                parse_price_result(
+                    result,
+                    int(result["item_id"]),
+                    datetime.fromisoformat(result["time"]),
+                )
+            )
+    return entries
+
+
+def to_hour_ranges(
+    timestamps: pd.Series, max_hours: int = 24
+) -> list[tuple[datetime, datetime]]:
+    """Groups whole hours into ranges [start, end) of consecutive hours, each at most max_hours long."""
+    hours = np.unique(to_epoch_hours(timestamps))
+    # A new range starts after every jump and every max_hours hours
+    starts = np.flatnonzero(np.diff(hours, prepend=hours[:1] - 2) > 1)
+    ranges = []
+    for start, end in zip(starts, np.append(starts[1:], len(hours))):
+        for chunk_start in range(start, end, max_hours):
+            first = hours[chunk_start]
+            last = hours[min(chunk_start + max_hours, end) - 1]
+            ranges.append(
+                (
+                    pd.Timestamp(int(first) * 3600, unit="s", tz="UTC").to_pydatetime(),
+                    pd.Timestamp(
+                        int(last + 1) * 3600, unit="s", tz="UTC"
+                    ).to_pydatetime(),
+                )
+            )
+    return ranges
+
+
+def mostly_missing_hours(
+    missing_combinations: pd.DataFrame, num_items: int, min_missing: float
+) -> np.ndarray:
+    """Returns for every missing combination whether at least a share of min_missing of all
+    items lack its hour. A range request returns every item of an hour, so it only pays off
+    for hours like these, the others are cheaper to request pair by pair."""
+    hours = to_epoch_hours(missing_combinations["timestamp"])
+    _, inverse, counts = np.unique(hours, return_inverse=True, return_counts=True)
+    return counts[inverse] >= min_missing * max(1, num_items)
+
+
+def crawl_missing_price_ranges(
+    context: dg.AssetExecutionContext,
+    missing_combinations: pd.DataFrame,
+    api: ApiEndpointResource,
+    on_entry: Callable[[dict], None],
+    on_failure: Callable[[int, datetime, Exception], None],
+    latency: LatencyHistogram | None = None,
+) -> None:
+    """Crawls all missing pairs of (item_id, timestamp) with range requests. Every range of
+    consecutive hours is fetched at once for all items, and only the missing pairs are kept.
+    Every new entry is handed to on_entry, every failed pair to on_failure, as soon as known.
+    The duration of every request is observed by latency, if given.
+    """
+    keys = list(
+        zip(
+            missing_combinations["item_id"].tolist(),
+            missing_combinations["timestamp"].array.to_pydatetime().tolist(),
+        )
+    )
+    missing = set(keys)
+    # The missing pairs of every hour, so a failed range only looks at its own hours
+    missing_by_hour = {}
+    for key, hour in zip(keys, to_epoch_hours(missing_combinations["timestamp"])):
+        missing_by_hour.setdefault(int(hour), []).append(key)
+    item_ids = missing_combinations["item_id"].unique()
+    # Only ask for a single item if that's all we lack
+    item_id = int(item_ids[0]) if len(item_ids) == 1 else None
+
+    successful_entries = 0
+    errors = {}
+    total_entries = len(missing)
+    tried_ranges = 0
+    ranges = to_hour_ranges(missing_combinations["timestamp"])
+    # Log a status update at least every 5% percent of progress
+    progress_step = max(1, len(ranges) // 20)
+
+    def on_done(
+        hour_range: tuple[datetime, datetime],
+        entries: list[dict] | None,
+        error: Exception | None,
+    ) -> None:
+        nonlocal tried_ranges, successful_entries
+        dt_start, dt_end = hour_range
+        if error is not None:
+            context.log.warning(
+                f"Failed to crawl range {dt_start.isoformat()} - {dt_end.isoformat()}. Reason: {str(error)}"
+            )
+            for hour in range(
+                int(dt_start.timestamp()) // 3600, int(dt_end.timestamp()) // 3600
+            ):
+                for key in missing_by_hour.get(hour, []):
+                    if key in missing:
+                        errors[key] = error
+        else:
+            for entry in entries:
+                key = (entry["item_id"], entry["timestamp"])
+                if key in missing:
+                    missing.remove(key)
+                    on_entry(entry)
+                    successful_entries += 1
+        tried_ranges += 1
+        if tried_ranges % progress_step == 0 or tried_ranges == len(ranges):
+            log_crawl_progress(
+                context,
+                successful_entries,
+                round(total_entries * tried_ranges / len(ranges)),
+                total_entries,
+            )
+
+    def fetch(hour_range: tuple[datetime, datetime]) -> list[dict]:
+        return fetch_price_range(api, *hour_range, item_id)
+
+    api.crawl(ranges, latency.timed(fetch) if latency else fetch, on_done)
+    for item_id, dt in sorted(missing):
+        error = errors.get((item_id, dt), Exception("Not part of the range response."))
+        if not isinstance(error, CircuitOpenError):
+            context.log.warning(
+                f"Failed to crawl item_id: {item_id}, Time: {dt.isoformat()}. Reason: {str(error)}"
+            )
+        on_failure(item_id, dt, error)
+
+
+def crawl_missing_price_data(
+    context: dg.AssetExecutionContext,
+    missing_combinations: pd.DataFrame,
+    api: ApiEndpointResource,
+    on_entry: Callable[[dict], None],
+    on_failure: Callable[[int, datetime, Exception], None],
+    latency: LatencyHistogram | None = None,
+) -> None:
+    """Crawls all price and volume points for missing pairs of (item_id, timestamp).
+    Requests are sent concurrently, limited by the api's concurrency and rate limits,
+    and group up to `api.batch_size` pairs each, at most MAX_BATCH_SIZE. Every new entry
+    is handed to on_entry, every failed pair to on_failure, as soon as its request finished.
+    The duration of every request is observed by latency, if given."""
+
+    successful_entries = 0
+    total_entries = len(missing_combinations)
+    tried_entries = 0
+    batch_size = min(max(1, api.batch_size), MAX_BATCH_SIZE)
+    # Log a status update at least every 5% percent of progress
+    progress_step = max(1, total_entries // 20)
+
+    def to_batches():
+        batch = []
+        for row in missing_combinations.itertuples():
+            batch.append((row.item_id, row.timestamp.to_pydatetime()))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def on_done(
+        batch: list[tuple[int, datetime]],
+        entries: list[dict | Exception] | None,
+        error: Exception | None,
+    ) -> None:
+        nonlocal tried_entries, successful_entries
+        if error is not None:
+            # The whole request failed, so every pair in it failed
+            entries = [error] * len(batch)
+
+        for (item_id, dt), entry in zip(batch, entries):
+            if isinstance(entry, Exception):
+                if not isinstance(entry, CircuitOpenError):
+                    context.log.warning(
+                        f"Failed to crawl item_id: {item_id}, Time: {dt.isoformat()}. Reason: {str(entry)}"
+                    )
+                on_failure(item_id, dt, entry)
+            else:
+                on_entry(entry)
+                successful_entries += 1
+                context.log.debug(
+                    f"Successfuly crawled item: {item_id}, Time: {dt.isoformat()}."
+                )
+
+        previous_tried = tried_entries
+        tried_entries += len(batch)
+        if tried_entries // progress_step > previous_tried // progress_step:
+            log_crawl_progress(
+                context, successful_entries, tried_entries, total_entries
+            )
+
+    def fetch(batch: list[tuple[int, datetime]]) -> list[dict | Exception]:
+        return fetch_price_batch(api, batch)
+
+    api.crawl(to_batches(), latency.timed(fetch) if latency else fetch, on_done)
+
+
+def split_missing_combinations(
+    missing_combinations: pd.DataFrame,
+    shards: int,
+    shard_by: Literal["item", "time"],
+) -> list[pd.DataFrame]:
+    """Splits the missing combinations into at most `shards` parts of about the same size. All
+    combinations of an item (or an hour) end up in the same part, so no two parts request the same.
+    """
+    if len(missing_combinations) == 0:
+        return []
+    keys = (
+        missing_combinations["item_id"].to_numpy()
+        if shard_by == "item"
+        else to_epoch_hours(missing_combinations["timestamp"])
+    )
+    unique_keys, counts = np.unique(keys, return_counts=True)
+    # A key goes to the shard of the first of its combinations, in the order of the keys
+    shard_of_key = (np.cumsum(counts) - counts) * max(1, shards) // len(keys)
+    shard_of_row = shard_of_key[np.searchsorted(unique_keys, keys)]
+    return [
+        missing_combinations[shard_of_row == shard].reset_index(drop=True)
+        for shard in np.unique(shard_of_row)
+    ]
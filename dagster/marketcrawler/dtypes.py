@@ -0,0 +1,48 @@
+import pandas as pd
+import pyarrow as pa
+
+# Compact column types of the price data and the items. Ids and volumes are 32 bit integers in
+# Postgres, prices 32 bit floats (REAL), and the few distinct names and types are categories.
+PRICE_DTYPES = {"item_id": "int32", "volume": "int32", "price": "float32"}
+ITEM_DTYPES = {"item_id": "int32", "name": "category", "type": "category"}
+
+PRICE_ARROW_SCHEMA = pa.schema(
+    [
+        ("item_id", pa.int32()),
+        ("volume", pa.int32()),
+        ("price", pa.float32()),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+    ]
+)
+
+# Types of price_data's columns in Postgres, as the price cache stores them
+CACHE_ARROW_SCHEMA = pa.schema(
+    [
+        ("entry_id", pa.int64()),
+        ("item_id", pa.int64()),
+        ("volume", pa.int64()),
+        ("price", pa.float64()),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+    ]
+)
+
+
+def compact_price_data(df: pd.DataFrame) -> pd.DataFrame:
+    """Casts the price data's columns to the compact dtypes, and its timestamps to UTC."""
+    df = df.astype({k: v for k, v in PRICE_DTYPES.items() if k in df.columns})
+    if "timestamp" in df.columns:
+        df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
+    return df
+
+
+def compact_items(df: pd.DataFrame) -> pd.DataFrame:
+    """Casts the items' columns to the compact dtypes."""
+    return df.astype({k: v for k, v in ITEM_DTYPES.items() if k in df.columns})
+
+
+def compact_price_table(table: pa.Table) -> pa.Table:
+    """Casts the price data columns of an Arrow table to the compact types, others stay as they are."""
+    fields = {field.name: field for field in PRICE_ARROW_SCHEMA}
+    return table.cast(
+        pa.schema([fields.get(field.name, field) for field in table.schema])
+    )
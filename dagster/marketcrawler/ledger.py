@@ -0,0 +1,120 @@
+import pandas as pd
+import psycopg
+from datetime import datetime
+from marketcrawler.resources import DatabaseResource
+
+
+def read_backing_off(
+    database: DatabaseResource, dt_past: datetime, dt_now: datetime
+) -> pd.DataFrame:
+    """Returns the (item_id, timestamp) combinations of the window that failed before,
+    and whose next attempt is not due yet."""
+    with database.get_connection() as conn:
+        df = pd.read_sql(
+            "SELECT item_id, timestamp FROM crawl_ledger WHERE timestamp >= %(dt_past)s AND timestamp < %(dt_now)s AND next_attempt > now()",
+            conn,
+            params={"dt_past": dt_past, "dt_now": dt_now},
+        )
+    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
+    return df
+
+
+def remove_backing_off(
+    missing_combinations: pd.DataFrame, backing_off: pd.DataFrame
+) -> pd.DataFrame:
+    """Returns the missing combinations that are not in backing_off."""
+    if len(backing_off) == 0:
+        return missing_combinations
+    merged = missing_combinations.merge(
+        backing_off, on=["item_id", "timestamp"], how="left", indicator=True
+    )
+    return merged[merged["_merge"] == "left_only"].drop(columns="_merge")
+
+
+def record_failures(
+    conn: psycopg.Connection,
+    failures: list[tuple[int, datetime, str]],
+    backoff: float,
+    backoff_max: float,
+) -> None:
+    """Records failed (item_id, timestamp, error) attempts. The next attempt is due after
+    backoff * 2^(attempts - 1) seconds, at most backoff_max, randomized by +-50% so that
+    combinations that failed together are not all retried together. Does not commit."""
+    with conn.cursor() as cur:
+        cur.executemany(
+            """
+            INSERT INTO crawl_ledger (item_id, timestamp, attempts, last_attempt, next_attempt, last_error)
+            VALUES (
+                %(item_id)s, %(timestamp)s, 1, now(),
+                now() + LEAST(%(backoff_max)s, %(backoff)s) * (0.5 + random()) * interval '1 second',
+                %(error)s
+            )
+            ON CONFLICT (item_id, timestamp) DO UPDATE SET
+                attempts = crawl_ledger.attempts + 1,
+                last_attempt = EXCLUDED.last_attempt,
+                next_attempt = now() + LEAST(%(backoff_max)s, %(backoff)s * power(2, crawl_ledger.attempts)) * (0.5 + random()) * interval '1 second',
+                last_error = EXCLUDED.last_error
+            """,
+            [
+                {
+                    "item_id": item_id,
+                    "timestamp": timestamp,
+                    "error": error,
+                    "backoff": backoff,
+                    "backoff_max": backoff_max,
+                }
+                for item_id, timestamp, error in failures
+            ],
+        )
+
+
+def clear_crawled(conn: psycopg.Connection, dt_past: datetime, dt_now: datetime) -> int:
+    """Removes the ledger entries of the window that have price data by now. Does not commit.
+    Returns the number of removed entries."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            DELETE FROM crawl_ledger
+            WHERE timestamp >= %(dt_past)s AND timestamp < %(dt_now)s
+            AND EXISTS (
+                SELECT 1 FROM price_data
+                WHERE price_data.item_id = crawl_ledger.item_id
+                AND price_data.timestamp >= crawl_ledger.timestamp
+                AND price_data.timestamp < crawl_ledger.timestamp + interval '1 hour'
+            )
+            """,
+            {"dt_past": dt_past, "dt_now": dt_now},
+        )
+        return cur.rowcount
+
+
+def read_due_hours(
+    database: DatabaseResource, limit: int
+) -> list[tuple[datetime, datetime]]:
+    """Returns up to limit hours, newest first, that have combinations whose next attempt is due,
+    along with the latest of their next attempts."""
+    with database.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT date_trunc('hour', timestamp) AS hour, max(next_attempt)
+                FROM crawl_ledger
+                WHERE next_attempt <= now()
+                GROUP BY hour
+                ORDER BY hour DESC
+                LIMIT %(limit)s
+                """,
+                {"limit": limit},
+            )
+            return cur.fetchall()
+
+
+def drop_expired_entries(conn: psycopg.Connection, dt_cutoff: datetime) -> int:
+    """Removes the ledger entries of combinations before dt_cutoff, whose price data is not kept
+    anyway. Does not commit. Returns the number of removed entries."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "DELETE FROM crawl_ledger WHERE timestamp < %(dt_cutoff)s",
+            {"dt_cutoff": dt_cutoff},
+        )
+        return cur.rowcount
@@ -0,0 +1,179 @@
+import dagster as dg
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Generator, TypeVar
+
+T = TypeVar("T")
+
+# Where the OpenMetrics text files go, one per asset. Point a textfile collector
+# (e.g. node_exporter's --collector.textfile.directory) at it.
+METRICS_DIR = os.getenv("METRICS_DIR", "/app/metrics")
+
+# Upper bounds, in seconds, of the latency histogram's buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class LatencyHistogram:
+    """Collects durations in seconds, from any thread."""
+
+    def __init__(self):
+        self._values: list[float] = []
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._values.append(seconds)
+
+    def timed(self, fn: Callable[..., T]) -> Callable[..., T]:
+        """Wraps fn so that every call is observed, failed ones included."""
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs) -> T:
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    @property
+    def values(self) -> list[float]:
+        with self._lock:
+            return list(self._values)
+
+    @property
+    def count(self) -> int:
+        return len(self._values)
+
+    @property
+    def sum(self) -> float:
+        return float(sum(self._values))
+
+    def quantile(self, q: float) -> float:
+        import numpy as np
+
+        return float(np.quantile(self._values, q)) if self._values else 0.0
+
+    def buckets(self) -> list[tuple[str, int]]:
+        """Cumulative counts per upper bound, ending with +Inf like Prometheus' histograms."""
+        import numpy as np
+
+        values = np.sort(self._values)
+        counts = np.searchsorted(values, LATENCY_BUCKETS, side="right")
+        return [
+            (f"{le:g}", int(count)) for le, count in zip(LATENCY_BUCKETS, counts)
+        ] + [("+Inf", len(values))]
+
+
+class RunMetrics:
+    """Times the phases of an asset's materialization and the api requests it sends.
+    Every finished phase is logged as an AssetObservation right away, so slow phases show
+    up while the run is still going. At the end, `metadata()` goes into the output metadata
+    and `export()` writes the numbers as an OpenMetrics text file."""
+
+    def __init__(self, context: dg.AssetExecutionContext):
+        self.context = context
+        self.phase_seconds: dict[str, float] = {}
+        self.api_latency = LatencyHistogram()
+
+    @contextmanager
+    def phase(self, name: str) -> Generator[None, None, None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        """Adds time spent in a phase that was measured elsewhere, like on another thread."""
+        self.phase_seconds[name] = self.phase_seconds.get(name, 0.0) + seconds
+        self.context.log_event(
+            dg.AssetObservation(
+                asset_key=self.context.asset_key,
+                metadata={"phase": name, "seconds": seconds},
+            )
+        )
+
+    def merge(
+        self, phase_seconds: dict[str, float], api_latencies: list[float]
+    ) -> None:
+        """Adds the phases and requests that another op measured, and logged, already."""
+        for name, seconds in phase_seconds.items():
+            self.phase_seconds[name] = self.phase_seconds.get(name, 0.0) + seconds
+        for seconds in api_latencies:
+            self.api_latency.observe(seconds)
+
+    def metadata(self) -> dict:
+        metadata = {
+            f"{name}_seconds": dg.MetadataValue.float(seconds)
+            for name, seconds in self.phase_seconds.items()
+        }
+        if self.api_latency.count:
+            metadata.update(
+                {
+                    "api_requests": dg.MetadataValue.int(self.api_latency.count),
+                    "api_latency_p50": dg.MetadataValue.float(
+                        self.api_latency.quantile(0.5)
+                    ),
+                    "api_latency_p95": dg.MetadataValue.float(
+                        self.api_latency.quantile(0.95)
+                    ),
+                    "api_latency_p99": dg.MetadataValue.float(
+                        self.api_latency.quantile(0.99)
+                    ),
+                    "api_latency_histogram": dg.MetadataValue.json(
+                        dict(self.api_latency.buckets())
+                    ),
+                }
+            )
+        return metadata
+
+    def to_openmetrics(self) -> str:
+        """Formats the numbers of this materialization. Like metrics pushed by a batch job,
+        they describe the latest run, so the latency is a summary of that run's requests.
+        """
+        asset = self.context.asset_key.to_user_string()
+        labels = f'asset="{asset}"'
+        lines = [
+            "# HELP marketcrawler_phase_seconds Seconds spent per phase in the latest materialization.",
+            "# TYPE marketcrawler_phase_seconds gauge",
+            *(
+                f'marketcrawler_phase_seconds{{{labels},phase="{name}"}} {seconds}'
+                for name, seconds in self.phase_seconds.items()
+            ),
+            "# HELP marketcrawler_last_materialization_timestamp_seconds Unix time the latest materialization finished.",
+            "# TYPE marketcrawler_last_materialization_timestamp_seconds gauge",
+            f"marketcrawler_last_materialization_timestamp_seconds{{{labels}}} {time.time()}",
+        ]
+        if self.api_latency.count:
+            lines += [
+                "# HELP marketcrawler_api_request_seconds Latency of the api requests of the latest materialization.",
+                "# TYPE marketcrawler_api_request_seconds summary",
+                *(
+                    f'marketcrawler_api_request_seconds{{{labels},quantile="{q}"}} {self.api_latency.quantile(q)}'
+                    for q in (0.5, 0.95, 0.99)
+                ),
+                f"marketcrawler_api_request_seconds_sum{{{labels}}} {self.api_latency.sum}",
+                f"marketcrawler_api_request_seconds_count{{{labels}}} {self.api_latency.count}",
+            ]
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def export(self, directory: str = METRICS_DIR) -> None:
+        """Writes the OpenMetrics text file of this asset. Failing to do so is only logged,
+        the metrics are not worth failing a materialization for."""
+        name = "_".join(self.context.asset_key.path)
+        path = os.path.join(directory, f"marketcrawler_{name}.prom")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # Written next to it and renamed, so a scraper never reads half a file
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(self.to_openmetrics())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self.context.log.warning(f"Could not write metrics to {path}: {str(e)}")
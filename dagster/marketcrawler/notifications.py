@@ -0,0 +1,161 @@
+import json
+import psycopg
+import threading
+from datetime import datetime, timezone
+from marketcrawler.resources import DatabaseResource
+from psycopg import sql
+
+# Channel of the notifications sent by the insert trigger of price_data
+PRICE_DATA_CHANNEL = "price_data_inserted"
+
+# entry_ids are handed out on insert, but become visible on commit, so rows may show up below the
+# highest entry_id seen. Missed rows are looked for this far below it. It only has to exceed the
+# entry_ids that concurrent writers hold at once, commit_size times the number of shards.
+LOOKBACK_ENTRY_IDS = 1_000_000
+
+# Listeners outlive a single sensor evaluation, so that notifications sent between two ticks
+# are waiting on the connection. They're shared by everything in this process with the same settings.
+_listeners: dict[str, "PriceDataListener"] = {}
+_listeners_lock = threading.Lock()
+
+
+def epoch_hour_to_datetime(hour: int) -> datetime:
+    return datetime.fromtimestamp(int(hour) * 3600, tz=timezone.utc)
+
+
+def read_snapshot_xmin(conn: psycopg.Connection) -> int:
+    """Returns the oldest transaction that was still running when the snapshot was taken."""
+    return conn.execute(
+        "SELECT txid_snapshot_xmin(txid_current_snapshot())"
+    ).fetchone()[0]
+
+
+class PriceDataListener:
+    """LISTENs for new price data on a connection of its own."""
+
+    def __init__(self, conninfo: str):
+        self.conninfo = conninfo
+        self.conn: psycopg.Connection | None = None
+
+    def poll(self) -> tuple[list[dict], int] | None:
+        """Returns the notifications received since the last call, without waiting, and the xmin
+        of a snapshot taken right before. Transactions below it are finished, and their notifications
+        are among the returned ones. Returns None if the listener (re)connected instead, as anything
+        sent meanwhile was not received.
+        """
+        if self.conn is not None and not self.conn.closed:
+            try:
+                xmin = read_snapshot_xmin(self.conn)
+                return [
+                    json.loads(notify.payload)
+                    for notify in self.conn.notifies(timeout=0)
+                ], xmin
+            except psycopg.OperationalError:
+                # The connection died, start over
+                self.conn.close()
+        self.conn = psycopg.connect(self.conninfo, autocommit=True)
+        self.conn.execute(
+            sql.SQL("LISTEN {}").format(sql.Identifier(PRICE_DATA_CHANNEL))
+        )
+        return None
+
+
+def get_listener(database: DatabaseResource) -> PriceDataListener:
+    """Returns the process-wide listener for this database, created on first use."""
+    conninfo = database.get_conninfo()
+    with _listeners_lock:
+        listener = _listeners.get(conninfo)
+        if listener is None:
+            listener = _listeners[conninfo] = PriceDataListener(conninfo)
+    return listener
+
+
+def hours_of_notifications(
+    notifications: list[dict],
+) -> tuple[set[datetime], int, list[tuple[int, int]]]:
+    """Returns the hours that received rows according to the notifications, the highest entry_id,
+    and the (first, last) entry_ids of the inserts whose hours were too many to be sent.
+    """
+    hours = set()
+    lookups = []
+    for notification in notifications:
+        if "hours" in notification:
+            hours.update(epoch_hour_to_datetime(hour) for hour in notification["hours"])
+        elif "first_hour" in notification:
+            # Sent by the trigger of older schemas
+            for hour in range(
+                int(notification["first_hour"]), int(notification["last_hour"]) + 1
+            ):
+                hours.add(epoch_hour_to_datetime(hour))
+        else:
+            lookups.append(
+                (int(notification["first_entry_id"]), int(notification["entry_id"]))
+            )
+    return (
+        hours,
+        max((int(n["entry_id"]) for n in notifications), default=0),
+        lookups,
+    )
+
+
+def read_hours_of_entries(
+    database: DatabaseResource, lookups: list[tuple[int, int]]
+) -> set[datetime]:
+    """Returns the hours of the rows with an entry_id in one of the (first, last) ranges."""
+    if not lookups:
+        return set()
+    conditions = sql.SQL(" OR ").join(
+        sql.SQL("entry_id BETWEEN {} AND {}").format(first, last)
+        for first, last in lookups
+    )
+    with database.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL(
+                    "SELECT DISTINCT floor(extract(epoch FROM timestamp) / 3600)::bigint FROM price_data WHERE {}"
+                ).format(conditions)
+            )
+            return {epoch_hour_to_datetime(hour) for (hour,) in cur.fetchall()}
+
+
+def read_position(database: DatabaseResource) -> tuple[int, int]:
+    """Returns the highest entry_id and the xmin of the snapshot it was read with."""
+    with database.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT coalesce(max(entry_id), 0), txid_snapshot_xmin(txid_current_snapshot()) FROM price_data"
+            )
+            return cur.fetchone()
+
+
+def read_new_hours(
+    database: DatabaseResource, entry_id: int, xmin: int | None
+) -> tuple[set[datetime], int, int]:
+    """Returns the hours that received rows since the given position, the highest entry_id, and
+    the xmin of the snapshot they were read with. Used when notifications may have been missed.
+
+    New rows are the ones of transactions that were still running at the given xmin. Without
+    one, the rows with an entry_id above the given one are taken.
+    """
+    if xmin is None:
+        condition = sql.SQL("entry_id > {}").format(entry_id)
+    else:
+        # xmin is a 32 bit transaction id that wraps around, compared by its age instead
+        condition = sql.SQL("entry_id > {} AND age(xmin) <= age({}::text::xid)").format(
+            entry_id - LOOKBACK_ENTRY_IDS, xmin % 2**32
+        )
+    with database.get_connection() as conn:
+        with conn.cursor() as cur:
+            # A single statement, so the rows and the xmin come from the same snapshot. The
+            # entry_id index only touches the rows above the lookback.
+            cur.execute(
+                sql.SQL(
+                    "WITH new_rows AS (SELECT entry_id, timestamp FROM price_data WHERE {}) SELECT array(SELECT DISTINCT floor(extract(epoch FROM timestamp) / 3600)::bigint FROM new_rows), (SELECT max(entry_id) FROM new_rows), txid_snapshot_xmin(txid_current_snapshot())"
+                ).format(condition)
+            )
+            hours, max_entry_id, snapshot_xmin = cur.fetchone()
+    return (
+        {epoch_hour_to_datetime(hour) for hour in hours},
+        max(entry_id, max_entry_id or 0),
+        snapshot_xmin,
+    )
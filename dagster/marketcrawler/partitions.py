@@ -0,0 +1,12 @@
+import dagster as dg
+import os
+
+# One partition per hour of price data. A partition becomes available once its hour has passed.
+hourly_partitions = dg.HourlyPartitionsDefinition(
+    start_date=os.getenv("MARKETCRAWLER_START_DATE", "2025-06-01-00:00"),
+    timezone="UTC",
+)
+
+# Backfills launch one run per hour, so the run queue limits in dagster.yaml decide
+# how many hours are crawled in parallel
+hourly_backfill_policy = dg.BackfillPolicy.multi_run(max_partitions_per_run=1)
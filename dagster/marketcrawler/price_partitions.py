@@ -0,0 +1,76 @@
+import psycopg
+import re
+from datetime import date, datetime, timezone
+from psycopg import sql
+from typing import Iterable
+
+# Serializes creating partitions, as two runs may need the same month at the same time.
+# Any constant works, it only has to be unique.
+PARTITION_LOCK_ID = 727_002
+
+PARTITION_NAME = re.compile(r"^price_data_(\d{4})_(\d{2})$")
+
+
+def month_of(dt: datetime) -> date:
+    """Returns the first day of the (UTC) month the timestamp belongs to."""
+    return dt.astimezone(timezone.utc).date().replace(day=1)
+
+
+def next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"price_data_{month.year:04d}_{month.month:02d}"
+
+
+def month_bound(month: date) -> sql.Literal:
+    return sql.Literal(datetime(month.year, month.month, 1, tzinfo=timezone.utc))
+
+
+def ensure_partitions(conn: psycopg.Connection, months: Iterable[date]) -> list[str]:
+    """Creates the monthly partitions of price_data that don't exist yet, and returns their names.
+    Creating one locks price_data, so it's committed right away. Don't call it with uncommitted
+    changes on the connection."""
+    created = []
+    with conn.cursor() as cur:
+        for month in sorted(set(months)):
+            name = partition_name(month)
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+            if cur.fetchone()[0]:
+                continue
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (PARTITION_LOCK_ID,))
+            # Another run may have created it while we waited for the lock
+            cur.execute(
+                sql.SQL(
+                    "CREATE TABLE IF NOT EXISTS {} PARTITION OF price_data FOR VALUES FROM ({}) TO ({})"
+                ).format(
+                    sql.Identifier(name),
+                    month_bound(month),
+                    month_bound(next_month(month)),
+                )
+            )
+            conn.commit()
+            created.append(name)
+    return created
+
+
+def drop_expired_partitions(conn: psycopg.Connection, dt_cutoff: datetime) -> list[str]:
+    """Drops the partitions of price_data that only hold rows older than dt_cutoff, and returns
+    their names. Does not commit."""
+    dropped = []
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = 'price_data'::regclass"
+        )
+        for (name,) in cur.fetchall():
+            match = PARTITION_NAME.match(name)
+            if match is None:
+                # Not one of ours, leave it alone
+                continue
+            month = date(int(match.group(1)), int(match.group(2)), 1)
+            end = next_month(month)
+            if datetime(end.year, end.month, 1, tzinfo=timezone.utc) <= dt_cutoff:
+                cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+                dropped.append(name)
+    return sorted(dropped)
@@ -0,0 +1,208 @@
+import glob
+import gzip
+import os
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.offline
+import plotly.graph_objects as go
+import plotly.subplots as subplt
+
+
+def min_max_indices(values: np.ndarray, num_buckets: int) -> np.ndarray:
+    """Splits the values into num_buckets equally sized buckets and returns the sorted positions
+    of the minimum and maximum of every bucket. Unlike taking every n-th point, spikes survive.
+    """
+    num_values = len(values)
+    if num_buckets <= 0 or num_values <= 2 * num_buckets:
+        return np.arange(num_values)
+
+    buckets = np.arange(num_values) * num_buckets // num_values
+    # Ordered by bucket first and value second, so each bucket starts with its minimum
+    # and ends with its maximum
+    order = np.lexsort((values, buckets))
+    starts = np.searchsorted(buckets, np.arange(num_buckets))
+    ends = np.append(starts[1:], num_values) - 1
+    # Keep the first and last point too, so the series spans the whole window
+    return np.unique(np.concatenate([order[starts], order[ends], [0, num_values - 1]]))
+
+
+def downsample(
+    timestamps: np.ndarray, values: np.ndarray, max_points: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Reduces a series that is sorted by time to at most about max_points points."""
+    positions = min_max_indices(values, max_points // 2)
+    return timestamps[positions], values[positions]
+
+
+def build_dashboard(
+    df_with_items: pd.DataFrame,
+    item_names: list[str],
+    max_points: int = 200_000,
+    min_points_per_series: int = 200,
+    webgl_threshold: int = 20_000,
+    presorted: bool = False,
+) -> tuple[go.Figure, dict]:
+    """Builds the price and volume figure, with one line per item.
+
+    The data is split per item in a single pass, and each series is downsampled so that the
+    whole figure shows about max_points points per subplot, but no series less than
+    min_points_per_series. Above webgl_threshold points per subplot, WebGL traces are used.
+    Pass presorted if the data is sorted by name and timestamp already.
+    Returns the figure and statistics about the rendering.
+    """
+    if not presorted:
+        df_with_items = df_with_items.sort_values(["name", "timestamp"])
+    # Names are categorical, only the ones with data get a group
+    groups = df_with_items.groupby("name", sort=False, observed=True).indices
+    # Plotly validates pandas objects much slower than plain arrays, so hand it numpy arrays.
+    # Timestamps are converted to naive UTC, which plotly shows as is.
+    timestamps = (
+        df_with_items["timestamp"].dt.tz_convert("UTC").dt.tz_localize(None).to_numpy()
+    )
+    prices = df_with_items["price"].to_numpy()
+    volumes = df_with_items["volume"].to_numpy()
+
+    points_per_series = max(
+        min_points_per_series, max_points // max(1, len(item_names))
+    )
+    series = {}
+    for item_name in item_names:
+        positions = groups.get(item_name, np.array([], dtype=np.intp))
+        series[item_name] = (
+            downsample(timestamps[positions], prices[positions], points_per_series),
+            downsample(timestamps[positions], volumes[positions], points_per_series),
+        )
+
+    rendered_points = sum(len(price[0]) for price, _ in series.values())
+    webgl = rendered_points > webgl_threshold
+    scatter = go.Scattergl if webgl else go.Scatter
+
+    fig = subplt.make_subplots(
+        rows=2,
+        cols=1,
+        subplot_titles=("Prices Over Time", "Volumes Over Time"),
+        vertical_spacing=0.15,
+    )
+
+    colors = px.colors.qualitative.Plotly
+
+    traces, rows = [], []
+    for i, item_name in enumerate(item_names):
+        (price_x, price_y), (volume_x, volume_y) = series[item_name]
+        color = colors[i % len(colors)]
+
+        traces.append(
+            scatter(
+                x=price_x,
+                y=price_y,
+                mode="lines",
+                name=f"{item_name}",
+                legendgroup=f"item_{i}",
+                line=dict(color=color),
+                marker=dict(color=color),
+                showlegend=True,
+            )
+        )
+        rows.append(1)
+
+        traces.append(
+            scatter(
+                x=volume_x,
+                y=volume_y,
+                mode="lines",
+                name=f"{item_name}",
+                legendgroup=f"item_{i}",
+                line=dict(color=color),
+                marker=dict(color=color),
+                showlegend=False,
+            )
+        )
+        rows.append(2)
+
+    # Adding all traces at once, instead of one by one, saves a relayout per trace
+    fig.add_traces(traces, rows=rows, cols=[1] * len(rows))
+
+    fig.update_layout(
+        height=800,
+        title_text="Price Data Dashboard",
+        hovermode="x unified",
+    )
+
+    fig.update_xaxes(title_text="Time", row=1, col=1)
+    fig.update_xaxes(title_text="Time", row=2, col=1)
+
+    fig.update_yaxes(title_text="Price", row=1, col=1)
+    fig.update_yaxes(title_text="Volume", row=2, col=1)
+
+    return fig, {
+        "num_records": len(df_with_items),
+        "rendered_points": rendered_points,
+        "webgl": webgl,
+    }
+
+
+def write_gzip(path: str, text: str) -> None:
+    # Unique temporary name, as concurrent runs may write the same file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=9) as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_plotly_js(directory: str) -> str:
+    """Writes the plotly.js bundle to the directory, once per version, and returns its file name."""
+    name = f"plotly-{plotly.offline.get_plotlyjs_version()}.min.js"
+    path = os.path.join(directory, f"{name}.gz")
+    if not os.path.exists(path):
+        write_gzip(path, plotly.offline.get_plotlyjs())
+    return name
+
+
+def prune_dashboards(directory: str, keep_last: int) -> int:
+    """Removes all but the newest keep_last dashboards, and never the one latest.html points at.
+    Returns how many were removed."""
+    paths = glob.glob(os.path.join(directory, "dashboard_*.html*"))
+    paths.sort(key=os.path.getmtime, reverse=True)
+    try:
+        # A concurrent run may have published an older dashboard last
+        latest = os.path.join(
+            directory, os.readlink(os.path.join(directory, "latest.html.gz"))
+        )
+    except OSError:
+        latest = None
+    removed = 0
+    for path in paths[max(1, keep_last) :]:
+        if path == latest:
+            continue
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            # Another run pruned it already
+            pass
+    return removed
+
+
+def publish_dashboard(
+    fig: go.Figure, directory: str, name: str, keep_last: int = 50
+) -> dict:
+    """Writes the figure as precompressed `<name>.gz`, next to a shared plotly.js bundle,
+    points `latest.html` at it and prunes old dashboards. The web server is expected to
+    serve `<name>` from `<name>.gz` (nginx' gzip_static). Returns statistics about it.
+    """
+    os.makedirs(directory, exist_ok=True)
+    # Referencing the bundle instead of embedding it saves about 4.6 MB per dashboard
+    html = fig.to_html(include_plotlyjs=write_plotly_js(directory))
+    path = os.path.join(directory, f"{name}.gz")
+    write_gzip(path, html)
+
+    # Swap the symlink atomically, so latest.html never points nowhere
+    latest_tmp_path = os.path.join(directory, f"latest.html.gz.{os.getpid()}.tmp")
+    os.symlink(f"{name}.gz", latest_tmp_path)
+    os.replace(latest_tmp_path, os.path.join(directory, "latest.html.gz"))
+
+    return {
+        "size_bytes": os.path.getsize(path),
+        "pruned_dashboards": prune_dashboards(directory, keep_last),
+    }
@@ -1,2 +1,6 @@
 from .database import Database, DatabaseResource
 from .api import Api, ApiEndpointResource
+from .cache import PriceCache, PriceCacheResource
+from .io_manager import ArrowIO, ArrowIOManager, CrawlIO
+from .compute import Compute, ComputeResource
+from .retention import Retention, RetentionResource
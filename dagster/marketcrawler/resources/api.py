@@ -1,20 +1,270 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
 import dagster as dg
-import requests
 
-from requests import Response
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Iterable, Optional, TypeVar
+from urllib.parse import urlparse
+
+# requests is imported where it's used, so that loading the definitions doesn't pay for it
+if TYPE_CHECKING:
+    import requests
+    from requests import Response
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# The price api's upper bound for the number of entries of a batch request
+MAX_BATCH_SIZE = 1000
+
+# Sessions and circuit breakers are shared by all resource instances of this process with the
+# same settings, so keep-alive connections and the breaker's state survive between ops.
+_sessions: dict[str, requests.Session] = {}
+_breakers: dict[str, "CircuitBreaker"] = {}
+_shared_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Stops sending requests to a host after `threshold` consecutive failures. After `cooldown`
+    seconds a single trial request is let through, and its outcome closes or reopens the circuit.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_request(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if (
+                self._trial_running
+                or time.monotonic() - self._opened_at < self.cooldown
+            ):
+                raise CircuitOpenError(
+                    f"Circuit breaker is open after {self._failures} consecutive failures."
+                )
+            self._trial_running = True
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            self._trial_running = False
+            if success:
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._failures += 1
+            if self.threshold > 0 and self._failures >= self.threshold:
+                # Also restarts the cooldown if the trial request failed
+                self._opened_at = time.monotonic()
+
+
+class HostRateLimiter:
+    """Spaces out requests so that each host receives at most `requests_per_second` requests."""
+
+    def __init__(self, requests_per_second: float):
+        self.interval = 1 / requests_per_second if requests_per_second > 0 else 0.0
+        self._next_slot: dict[str, float] = {}
+
+    async def wait(self, host: str) -> None:
+        if not self.interval:
+            return
+        # Reserve the next free slot for this host. All coroutines run on the same
+        # event loop, so no lock is needed between reading and updating the slot.
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
 
 
 class ApiEndpointResource(dg.ConfigurableResource):
     api_endpoint: str
+    max_concurrency: int = 16
+    requests_per_second: float = 0.0
+    # Number of (item_id, time) pairs sent per request, at most MAX_BATCH_SIZE.
+    # 1 uses the single-item endpoint.
+    batch_size: int = 1
+    # Seconds to wait for a connection, and for data to arrive on it
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    # Retries of connection errors, timeouts and 429/5xx responses, waiting
+    # backoff_factor * 2^(retry - 1) seconds (at most backoff_max) plus up to backoff_jitter seconds
+    max_retries: int = 3
+    backoff_factor: float = 0.5
+    backoff_max: float = 30.0
+    backoff_jitter: float = 0.5
+    # Consecutive failed requests after which the api is left alone for circuit_breaker_cooldown seconds.
+    # 0 disables the circuit breaker.
+    circuit_breaker_threshold: int = 10
+    circuit_breaker_cooldown: float = 30.0
+
+    @property
+    def host(self) -> str:
+        return urlparse(self.api_endpoint).netloc
+
+    def share_rate_limit(self, parts: int) -> "ApiEndpointResource":
+        """Returns a copy with a `parts`th of the rate limit, for `parts` processes that crawl
+        the host side by side. Each process spaces out only its own requests."""
+        if parts <= 1 or self.requests_per_second <= 0:
+            return self
+        return self.model_copy(
+            update={"requests_per_second": self.requests_per_second / parts}
+        )
+
+    def get_session(self) -> requests.Session:
+        """Returns the process-wide session for these settings. It keeps up to `max_concurrency`
+        connections alive and retries failed requests with exponential backoff."""
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        key = " ".join(
+            [
+                self.api_endpoint,
+                str(self.max_concurrency),
+                str(self.max_retries),
+                str(self.backoff_factor),
+                str(self.backoff_max),
+                str(self.backoff_jitter),
+            ]
+        )
+        with _shared_lock:
+            session = _sessions.get(key)
+            if session is None:
+                retry = Retry(
+                    total=self.max_retries,
+                    backoff_factor=self.backoff_factor,
+                    backoff_max=self.backoff_max,
+                    backoff_jitter=self.backoff_jitter,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                    # All our requests only read, so POSTs are safe to retry as well
+                    allowed_methods=None,
+                    respect_retry_after_header=True,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=max(1, self.max_concurrency),
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _sessions[key] = session
+        return session
+
+    def get_circuit_breaker(self) -> CircuitBreaker:
+        key = f"{self.host} {self.circuit_breaker_threshold} {self.circuit_breaker_cooldown}"
+        with _shared_lock:
+            breaker = _breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    self.circuit_breaker_threshold, self.circuit_breaker_cooldown
+                )
+                _breakers[key] = breaker
+        return breaker
+
+    def send(self, method: str, path: str, **kwargs) -> Response:
+        """Sends a request through the shared session, unless the circuit breaker is open."""
+        breaker = self.get_circuit_breaker()
+        breaker.before_request()
+        try:
+            response = self.get_session().request(
+                method,
+                f"{self.api_endpoint}{path}",
+                timeout=(self.connect_timeout, self.read_timeout),
+                **kwargs,
+            )
+        except Exception:
+            breaker.record(success=False)
+            raise
+        # Client errors are our fault, not a sign of an unhealthy api
+        breaker.record(success=response.status_code < 500)
+        return response
 
     def request(self, item_id: str, time: str) -> Response:
-        return requests.get(
-            f"{self.api_endpoint}/price",
+        return self.send(
+            "GET",
+            "/price",
             params={
                 "item_id": item_id,
                 "time": time,
             },
         )
 
+    def request_batch(self, entries: list[tuple[str, str]]) -> Response:
+        """Requests the prices of many (item_id, time) pairs with a single call."""
+        return self.send(
+            "POST",
+            "/prices",
+            json={
+                "entries": [
+                    {"item_id": item_id, "time": time} for item_id, time in entries
+                ],
+            },
+        )
+
+    def request_range(
+        self, start: str, end: str, item_id: Optional[str] = None
+    ) -> Response:
+        """Requests the prices of every full hour in [start, end), for one item or all of them.
+        The response is streamed as JSON lines, read it with `iter_lines`."""
+        params = {"start": start, "end": end}
+        if item_id is not None:
+            params["item_id"] = item_id
+        return self.send("GET", "/prices/range", params=params, stream=True)
+
+    def crawl(
+        self,
+        tasks: Iterable[T],
+        fetch: Callable[[T], R],
+        on_done: Callable[[T, Optional[R], Optional[Exception]], None],
+    ) -> None:
+        """Runs `fetch` for every task with at most `max_concurrency` requests in flight,
+        respecting the per-host rate limit. `on_done` is called on the calling thread
+        for every finished task, with either the result or the raised exception."""
+        asyncio.run(self._crawl(iter(tasks), fetch, on_done))
+
+    async def _crawl(
+        self,
+        tasks: Iterable[T],
+        fetch: Callable[[T], R],
+        on_done: Callable[[T, Optional[R], Optional[Exception]], None],
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        limiter = HostRateLimiter(self.requests_per_second)
+        concurrency = max(1, self.max_concurrency)
+
+        async def worker(executor: ThreadPoolExecutor) -> None:
+            # Workers share one iterator, so tasks are pulled lazily and each task runs once
+            for task in tasks:
+                await limiter.wait(self.host)
+                try:
+                    result = await loop.run_in_executor(executor, fetch, task)
+                except Exception as e:
+                    on_done(task, None, e)
+                else:
+                    on_done(task, result, None)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            await asyncio.gather(*(worker(executor) for _ in range(concurrency)))
+
 
-Api = ApiEndpointResource(api_endpoint="http://price-api:8000")
+Api = ApiEndpointResource(
+    api_endpoint="http://price-api:8000",
+    max_concurrency=int(os.getenv("PRICE_API_MAX_CONCURRENCY", "16")),
+    requests_per_second=float(os.getenv("PRICE_API_REQUESTS_PER_SECOND", "0")),
+    batch_size=int(os.getenv("PRICE_API_BATCH_SIZE", "100")),
+)
@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from dagster import ConfigurableResource
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Generator, Optional
+from marketcrawler.resources.database import DatabaseResource
+
+# numpy, pandas and pyarrow are imported where they're used, so that loading the definitions doesn't pay for them
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+    import pyarrow as pa
+
+
+def missing_ranges(ids: np.ndarray, low: int, high: int) -> list[list[int]]:
+    """Returns the [low, high] ranges of ids between low and high (inclusive) that are not in the sorted ids."""
+    import numpy as np
+
+    ids = ids[(ids >= low) & (ids <= high)]
+    bounds = np.concatenate([[low - 1], ids, [high + 1]])
+    gaps = np.flatnonzero(np.diff(bounds) > 1)
+    return [[int(bounds[i] + 1), int(bounds[i + 1] - 1)] for i in gaps]
+
+
+class PriceCacheResource(ConfigurableResource):
+    """A local, columnar copy of the price_data table, stored as Parquet files partitioned by day.
+    New rows are appended incrementally, using the highest entry_id seen so far as high-water mark.
+    """
+
+    cache_dir: str
+    # Number of rows fetched from Postgres and written per Parquet file
+    fetch_size: int = 100_000
+    # Days with more files than this are compacted into a single file
+    max_files_per_day: int = 24
+    # Seconds to keep looking for entry_ids below the high-water mark that were not visible
+    # yet, e.g. because their transaction was still running. Afterwards they count as rolled back.
+    hole_timeout: float = 3600.0
+
+    @property
+    def state_path(self) -> str:
+        return os.path.join(self.cache_dir, "_state.json")
+
+    def read_state(self) -> dict:
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {
+                "high_water_mark": 0,
+                "sync_id": 0,
+                "holes": [],
+                "superseded": [],
+                # Start of the oldest day that retention kept, see drop_before
+                "dropped_before": None,
+            }
+
+    def write_state(self, state: dict) -> None:
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    @contextmanager
+    def lock(self) -> Generator[None, None, None]:
+        """Makes sure only one process at a time modifies the cache."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(os.path.join(self.cache_dir, "_lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def day_dir(self, day: str) -> str:
+        return os.path.join(self.cache_dir, f"day={day}")
+
+    def list_files(self, day: str, state: dict) -> list[str]:
+        """Lists the committed files of a day. Files of unfinished syncs are left out."""
+        try:
+            names = sorted(os.listdir(self.day_dir(day)))
+        except FileNotFoundError:
+            return []
+        paths = []
+        for name in names:
+            if not name.endswith(".parquet"):
+                continue
+            path = os.path.join(self.day_dir(day), name)
+            if (
+                int(name.split("-")[1]) <= state["sync_id"]
+                and path not in state["superseded"]
+            ):
+                paths.append(path)
+        return paths
+
+    def clean_up(self, state: dict) -> dict:
+        """Removes what an interrupted sync left behind: files newer than the last committed
+        sync and files that a finished compaction replaced."""
+        for day_name in os.listdir(self.cache_dir):
+            if not day_name.startswith("day="):
+                continue
+            for name in os.listdir(os.path.join(self.cache_dir, day_name)):
+                path = os.path.join(self.cache_dir, day_name, name)
+                if (
+                    not name.endswith(".parquet")
+                    or int(name.split("-")[1]) > state["sync_id"]
+                ):
+                    os.remove(path)
+        for path in state["superseded"]:
+            if os.path.exists(path):
+                os.remove(path)
+        return {**state, "superseded": []}
+
+    def write_file(self, day: str, table: pa.Table, sync_id: int, part: int) -> str:
+        import pyarrow.parquet as pq
+
+        os.makedirs(self.day_dir(day), exist_ok=True)
+        path = os.path.join(self.day_dir(day), f"part-{sync_id:08d}-{part:06d}.parquet")
+        # Write to a temporary name first, so readers never see half written files
+        pq.write_table(table, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        return path
+
+    def sync(self, database: DatabaseResource) -> dict:
+        """Appends all rows of price_data that are not cached yet. Returns statistics about the sync."""
+        import numpy as np
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        from marketcrawler.dtypes import CACHE_ARROW_SCHEMA
+
+        with self.lock():
+            state = self.clean_up(self.read_state())
+            sync_id = state["sync_id"] + 1
+            holes = [
+                hole
+                for hole in state["holes"]
+                if time.time() - hole[2] < self.hole_timeout
+            ]
+
+            # Fetch rows above the high-water mark, and rows we could not see last time
+            conditions = ["entry_id > %s"]
+            params = [state["high_water_mark"]]
+            for low, high, _ in holes:
+                conditions.append("entry_id BETWEEN %s AND %s")
+                params.extend([low, high])
+
+            dt_dropped_before = None
+            if state.get("dropped_before"):
+                dt_dropped_before = pa.scalar(
+                    datetime.fromisoformat(state["dropped_before"]),
+                    type=CACHE_ARROW_SCHEMA.field("timestamp").type,
+                )
+
+            seen_ids = []
+            touched_days = set()
+            part = 0
+            with database.get_connection() as conn:
+                # A named cursor streams the rows instead of loading them all at once
+                with conn.cursor(name="price_cache_sync") as cur:
+                    cur.execute(
+                        f"SELECT entry_id, item_id, volume, price, timestamp FROM price_data WHERE {' OR '.join(conditions)} ORDER BY entry_id",
+                        params,
+                    )
+                    while rows := cur.fetchmany(self.fetch_size):
+                        table = pa.Table.from_arrays(
+                            [
+                                pa.array(column, type=field.type)
+                                for column, field in zip(zip(*rows), CACHE_ARROW_SCHEMA)
+                            ],
+                            schema=CACHE_ARROW_SCHEMA,
+                        )
+                        seen_ids.append(table["entry_id"].to_numpy())
+                        # Rows without a timestamp can never be part of a window, and rows of
+                        # days that retention dropped already would only bring them back
+                        valid = table["timestamp"].is_valid()
+                        if dt_dropped_before is not None:
+                            valid = pc.and_(
+                                valid,
+                                pc.greater_equal(table["timestamp"], dt_dropped_before),
+                            )
+                        table = table.filter(valid)
+                        days = pc.strftime(table["timestamp"], format="%Y-%m-%d")
+                        for day in pc.unique(days).to_pylist():
+                            self.write_file(
+                                day, table.filter(pc.equal(days, day)), sync_id, part
+                            )
+                            touched_days.add(day)
+                            part += 1
+
+            # Remember the ids we expected but did not see, they may still show up
+            seen = (
+                np.sort(np.concatenate(seen_ids))
+                if seen_ids
+                else np.array([], dtype=np.int64)
+            )
+            high_water_mark = max(
+                state["high_water_mark"], int(seen[-1]) if len(seen) else 0
+            )
+            new_holes = []
+            for low, high, first_seen in holes:
+                new_holes += [[*r, first_seen] for r in missing_ranges(seen, low, high)]
+            new_holes += [
+                [*r, time.time()]
+                for r in missing_ranges(
+                    seen, state["high_water_mark"] + 1, high_water_mark
+                )
+            ]
+
+            state = {
+                **state,
+                "high_water_mark": high_water_mark,
+                "sync_id": sync_id,
+                "holes": new_holes,
+            }
+            self.write_state(state)
+            compacted_days = self.compact(touched_days, state)
+
+            return {
+                "appended_rows": len(seen),
+                "high_water_mark": high_water_mark,
+                "pending_holes": len(new_holes),
+                "compacted_days": compacted_days,
+            }
+
+    def compact(self, days: set[str], state: dict) -> int:
+        """Merges the files of days that have too many of them. Must be called with the lock held."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        compacted = 0
+        for day in sorted(days):
+            paths = self.list_files(day, state)
+            if len(paths) <= self.max_files_per_day:
+                continue
+            sync_id = state["sync_id"] + 1
+            table = pa.concat_tables(pq.read_table(path) for path in paths)
+            self.write_file(day, table.sort_by("entry_id"), sync_id, 0)
+            # Commit the new file and mark the old ones as replaced before deleting them
+            state.update(sync_id=sync_id, superseded=paths)
+            self.write_state(state)
+            for path in paths:
+                os.remove(path)
+            state.update(superseded=[])
+            self.write_state(state)
+            compacted += 1
+        return compacted
+
+    def drop_before(self, dt_cutoff: datetime) -> list[str]:
+        """Removes the days that only hold rows older than dt_cutoff, and returns them.
+
+        The high-water mark stays, as entry_ids are never handed out twice, and so do the holes,
+        as they may still be filled with rows of the days that are kept. Rows of the dropped days
+        that show up later are left out by the following syncs.
+        """
+        # Only whole days are dropped
+        dt_first_kept = dt_cutoff.astimezone(timezone.utc).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        with self.lock():
+            state = self.clean_up(self.read_state())
+            dropped = []
+            for day_name in sorted(os.listdir(self.cache_dir)):
+                if (
+                    day_name.startswith("day=")
+                    and day_name[len("day=") :] < dt_first_kept.date().isoformat()
+                ):
+                    shutil.rmtree(os.path.join(self.cache_dir, day_name))
+                    dropped.append(day_name[len("day=") :])
+            if (
+                state.get("dropped_before") is None
+                or datetime.fromisoformat(state["dropped_before"]) < dt_first_kept
+            ):
+                state = {**state, "dropped_before": dt_first_kept.isoformat()}
+            self.write_state(state)
+            return dropped
+
+    def read(
+        self,
+        dt_start: datetime,
+        dt_end: datetime,
+        columns: Optional[list[str]] = None,
+    ) -> pd.DataFrame:
+        """Reads the cached price data with dt_start <= timestamp < dt_end. Files are memory mapped,
+        and only the requested columns are loaded (by default item_id, volume, price, timestamp),
+        with compact dtypes.
+        """
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        from marketcrawler.dtypes import CACHE_ARROW_SCHEMA, compact_price_table
+
+        columns = columns or ["item_id", "volume", "price", "timestamp"]
+        dt_start = dt_start.astimezone(timezone.utc)
+        dt_end = dt_end.astimezone(timezone.utc)
+        filters = [
+            ("timestamp", ">=", pd.Timestamp(dt_start)),
+            ("timestamp", "<", pd.Timestamp(dt_end)),
+        ]
+
+        for attempt in range(3):
+            state = self.read_state()
+            tables = [CACHE_ARROW_SCHEMA.empty_table().select(columns)]
+            day = dt_start.date()
+            try:
+                while day <= dt_end.date():
+                    for path in self.list_files(day.isoformat(), state):
+                        tables.append(
+                            pq.read_table(
+                                path, columns=columns, memory_map=True, filters=filters
+                            )
+                        )
+                    day += timedelta(days=1)
+            except FileNotFoundError:
+                # A compaction replaced the files while we were reading, start over
+                continue
+            return compact_price_table(pa.concat_tables(tables)).to_pandas(
+                split_blocks=True, self_destruct=True, coerce_temporal_nanoseconds=True
+            )
+        raise Exception("Price cache kept changing while reading it.")
+
+
+PriceCache = PriceCacheResource(
+    cache_dir=os.getenv("PRICE_CACHE_DIR", "/app/price_cache"),
+)
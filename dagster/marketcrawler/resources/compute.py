@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import importlib.util
+import os
+from dagster import ConfigurableResource
+from pydantic import field_validator
+from typing import TYPE_CHECKING, Literal
+
+# The backends need pandas, so they're imported where they're used
+if TYPE_CHECKING:
+    from marketcrawler.compute import PandasBackend
+
+
+def missing_package_message(name: str) -> str:
+    return f'The "{name}" compute backend needs the {name} package, which is not installed. Install it with `pip install -r requirements-compute.txt`, or use the "pandas" backend.'
+
+
+class ComputeResource(ConfigurableResource):
+    """Chooses the library that runs the joins, filters and sorts of the pipeline's transforms.
+    "pandas" is always available, "polars" and "duckdb" use all cores, but need their package
+    to be installed. All of them return the same frames.
+    """
+
+    backend: Literal["pandas", "polars", "duckdb"] = "pandas"
+
+    @field_validator("backend")
+    @classmethod
+    def backend_is_installed(cls, backend: str) -> str:
+        # Fails when the definitions load, instead of in the middle of a run. Only looks for
+        # the package, importing it is left to the run.
+        if backend != "pandas" and importlib.util.find_spec(backend) is None:
+            raise ValueError(missing_package_message(backend))
+        return backend
+
+    def get_backend(self) -> PandasBackend:
+        from marketcrawler.compute import get_compute_backend
+
+        return get_compute_backend(self.backend)
+
+
+Compute = ComputeResource(
+    backend=os.getenv("COMPUTE_BACKEND", "pandas"),
+)
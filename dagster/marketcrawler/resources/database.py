@@ -1,36 +1,197 @@
+from __future__ import annotations
+
 from contextlib import contextmanager
+import atexit
 import os
-import psycopg
+import threading
 from dagster import ConfigurableResource
-from typing import Generator
+from typing import TYPE_CHECKING, Generator, Iterable, Sequence
+
+# psycopg is imported where it's used, so that loading the definitions doesn't pay for it
+if TYPE_CHECKING:
+    import psycopg
+    from psycopg_pool import ConnectionPool
+
+# Pools are shared by all resource instances of this process with the same settings,
+# so that consecutive ops and runs in the same process reuse the open connections.
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+@atexit.register
+def _close_pools() -> None:
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
 
 
 class DatabaseResource(ConfigurableResource):
-    """A simple context manager, making sure conn.close() is called when we don't need it anymore."""
+    """A simple context manager, making sure conn.close() is called when we don't need it anymore.
+    In pooled mode, connections are borrowed from a shared pool and returned to it instead.
+    """
 
     host: str
     port: int
     database: str
     user: str
     password: str
+    pooled: bool = False
+    pool_min_size: int = 1
+    pool_max_size: int = 4
+    # Seconds an unused connection may stay idle before it's closed
+    pool_max_idle: float = 300.0
+    # Seconds after which a connection is replaced, even if still healthy
+    pool_max_lifetime: float = 3600.0
+    # Seconds to wait for a free connection before giving up
+    pool_timeout: float = 30.0
+    # Number of rows sent per COPY statement by copy_rows
+    copy_chunk_size: int = 10_000
+    # Number of rows fetched per round trip by streaming reads
+    fetch_chunk_size: int = 100_000
 
-    @contextmanager
-    def get_connection(self) -> Generator[
-        psycopg.Connection,
-        None,
-        None,
-    ]:
-        conn = psycopg.connect(
+    def get_conninfo(self) -> str:
+        from psycopg.conninfo import make_conninfo
+
+        return make_conninfo(
             host=self.host,
             port=self.port,
             dbname=self.database,
             user=self.user,
             password=self.password,
         )
-        try:
+
+    def get_pool(self) -> ConnectionPool:
+        """Returns the process-wide pool for these settings, opening it on first use."""
+        from psycopg_pool import ConnectionPool
+
+        key = " ".join(
+            [
+                self.get_conninfo(),
+                str(self.pool_min_size),
+                str(self.pool_max_size),
+                str(self.pool_max_idle),
+                str(self.pool_max_lifetime),
+                str(self.pool_timeout),
+            ]
+        )
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(
+                    self.get_conninfo(),
+                    min_size=self.pool_min_size,
+                    max_size=self.pool_max_size,
+                    max_idle=self.pool_max_idle,
+                    max_lifetime=self.pool_max_lifetime,
+                    timeout=self.pool_timeout,
+                    # Make sure we never lend out a connection that died while idle
+                    check=ConnectionPool.check_connection,
+                    name=f"marketcrawler-{self.database}",
+                    open=True,
+                )
+                _pools[key] = pool
+        return pool
+
+    @contextmanager
+    def get_connection(self) -> Generator[
+        psycopg.Connection,
+        None,
+        None,
+    ]:
+        """Lends out a connection for the duration of the with block. In both modes, an open
+        transaction is committed when the block exits normally, and rolled back when it raises.
+        """
+        if self.pooled:
+            # The pool commits (or rolls back) before the connection is returned
+            with self.get_pool().connection() as conn:
+                yield conn
+            return
+
+        import psycopg
+
+        # The connection's own context commits (or rolls back) before it closes
+        with psycopg.connect(self.get_conninfo()) as conn:
             yield conn
-        finally:
-            conn.close()
+
+    def copy_rows(
+        self,
+        conn: psycopg.Connection,
+        table: str,
+        columns: Sequence[str],
+        rows: Iterable[Sequence],
+    ) -> int:
+        """Bulk loads rows into the table with COPY ... FROM STDIN, streaming them from memory
+        in chunks of `copy_chunk_size` rows. Does not commit. Returns the number of rows written.
+        """
+        from psycopg import sql
+
+        statement = sql.SQL("COPY {} ({}) FROM STDIN").format(
+            sql.Identifier(table),
+            sql.SQL(", ").join(map(sql.Identifier, columns)),
+        )
+        chunk_size = max(1, self.copy_chunk_size)
+        written = 0
+        rows = iter(rows)
+        with conn.cursor() as cur:
+            while True:
+                chunk_written = 0
+                with cur.copy(statement) as copy:
+                    for row in rows:
+                        copy.write_row(row)
+                        chunk_written += 1
+                        if chunk_written == chunk_size:
+                            break
+                written += chunk_written
+                if chunk_written < chunk_size:
+                    return written
+
+    def upsert_rows(
+        self,
+        conn: psycopg.Connection,
+        table: str,
+        columns: Sequence[str],
+        rows: Iterable[Sequence],
+        key_columns: Sequence[str],
+    ) -> int:
+        """Bulk loads rows into a temporary staging table with copy_rows, then moves them into the
+        table with INSERT ... ON CONFLICT DO NOTHING, so rows whose key exists already are skipped.
+        Does not commit. Returns the number of rows actually inserted.
+        """
+        from psycopg import sql
+
+        staging = sql.Identifier(f"{table}_staging")
+        column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+        key_list = sql.SQL(", ").join(map(sql.Identifier, key_columns))
+        with conn.cursor() as cur:
+            # One per session, emptied by every commit
+            cur.execute(
+                sql.SQL(
+                    "CREATE TEMPORARY TABLE IF NOT EXISTS {} ON COMMIT DELETE ROWS AS SELECT {} FROM {} WITH NO DATA"
+                ).format(staging, column_list, sql.Identifier(table))
+            )
+            self.copy_rows(conn, f"{table}_staging", columns, rows)
+            # Known duplicates are filtered out beforehand, as a conflicting insert still
+            # draws its defaults, and would leave holes in the table's sequences
+            cur.execute(
+                sql.SQL(
+                    "INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} s WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE {matches}) ON CONFLICT ({keys}) DO NOTHING"
+                ).format(
+                    table=sql.Identifier(table),
+                    columns=column_list,
+                    staging=staging,
+                    matches=sql.SQL(" AND ").join(
+                        sql.SQL("t.{column} = s.{column}").format(
+                            column=sql.Identifier(column)
+                        )
+                        for column in key_columns
+                    ),
+                    keys=key_list,
+                )
+            )
+            inserted = cur.rowcount
+            cur.execute(sql.SQL("TRUNCATE {}").format(staging))
+        return inserted
 
 
 Database = DatabaseResource(
@@ -39,4 +200,6 @@ Database = DatabaseResource(
     database=os.getenv("POSTGRES_DB", "database"),
     user=os.getenv("POSTGRES_USER", "user"),
     password=os.getenv("POSTGRES_PASSWORD", ""),
+    pooled=os.getenv("POSTGRES_POOLED", "true").lower() == "true",
+    pool_max_size=int(os.getenv("POSTGRES_POOL_MAX_SIZE", "4")),
 )
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import os
+import dagster as dg
+from typing import TYPE_CHECKING
+
+# pandas and pyarrow are imported where they're used, so that loading the definitions doesn't pay for them
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
+
+class ArrowIOManager(dg.ConfigurableIOManager):
+    """Stores DataFrames handed between assets as uncompressed Arrow IPC (Feather v2) files.
+    Files are memory mapped when loaded, so only the columns that are actually used get read.
+    Inputs can ask for a subset of columns with AssetIn(metadata={"columns": [...]})."""
+
+    base_dir: str
+
+    def get_path(
+        self, context: dg.InputContext | dg.OutputContext, partition_key=None
+    ) -> str:
+        path = os.path.join(self.base_dir, *context.asset_key.path)
+        if partition_key is not None:
+            path = os.path.join(path, partition_key)
+        return f"{path}.arrow"
+
+    def handle_output(
+        self, context: dg.OutputContext, obj: pd.DataFrame | None
+    ) -> None:
+        import pandas as pd
+        import pyarrow as pa
+
+        if obj is None:
+            # Assets like the dashboard have nothing to hand over
+            return
+        if not isinstance(obj, pd.DataFrame):
+            raise TypeError(
+                f"ArrowIOManager can only store DataFrames, got {type(obj).__name__}."
+            )
+
+        path = self.get_path(
+            context,
+            context.asset_partition_key if context.has_asset_partitions else None,
+        )
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = pa.Table.from_pandas(obj, preserve_index=False)
+        # Uncompressed, so readers can map the buffers directly instead of decompressing them
+        with pa.OSFile(f"{path}.tmp", "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(f"{path}.tmp", path)
+        context.add_output_metadata(
+            {
+                "path": dg.MetadataValue.path(path),
+                "size_bytes": dg.MetadataValue.int(os.path.getsize(path)),
+            }
+        )
+
+    def load_table(self, path: str, columns: list[str] | None) -> pa.Table:
+        import pyarrow as pa
+
+        # The mapping stays open as long as the table's buffers reference it
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        return table.select(columns) if columns else table
+
+    def load_input(self, context: dg.InputContext) -> pd.DataFrame:
+        import pyarrow as pa
+
+        columns = context.definition_metadata.get("columns")
+        if context.has_asset_partitions:
+            tables = [
+                self.load_table(self.get_path(context, key), columns)
+                for key in context.asset_partition_keys
+            ]
+            table = pa.concat_tables(tables)
+        else:
+            table = self.load_table(self.get_path(context), columns)
+        # split_blocks avoids consolidating columns into 2D blocks, which would copy them
+        return table.to_pandas(split_blocks=True)
+
+
+ArrowIO = ArrowIOManager(
+    base_dir=os.getenv(
+        "ARROW_IO_DIR",
+        os.path.join(os.getenv("DAGSTER_HOME", "/app/dagster_storage"), "arrow"),
+    ),
+)
+
+# Hands the shards of the crawl and their results from op to op. These can run in separate
+# processes, so they are pickled to files instead of being kept in memory.
+CrawlIO = dg.FilesystemIOManager(
+    base_dir=os.getenv(
+        "CRAWL_IO_DIR",
+        os.path.join(os.getenv("DAGSTER_HOME", "/app/dagster_storage"), "crawl"),
+    ),
+)
@@ -0,0 +1,24 @@
+import os
+from dagster import ConfigurableResource
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+
+class RetentionResource(ConfigurableResource):
+    """How long the raw price data is kept, in Postgres and in the price cache. Months are dropped
+    as a whole, once all of their data is older than that. The rollups keep theirs.
+    """
+
+    # 0 keeps all of it
+    retention_days: int = 0
+
+    def get_cutoff(self) -> Optional[datetime]:
+        """Returns the time before which price data expires, or None if it's kept forever."""
+        if self.retention_days <= 0:
+            return None
+        return datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+
+
+Retention = RetentionResource(
+    retention_days=int(os.getenv("PRICE_DATA_RETENTION_DAYS", "0")),
+)
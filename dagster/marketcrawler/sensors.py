@@ -0,0 +1,149 @@
+import dagster as dg
+import json
+import os
+from marketcrawler.partitions import hourly_partitions
+from marketcrawler.resources import DatabaseResource
+
+# What starts the hourly crawl: "schedule" runs the crawl job at the end of every hour, "sensor"
+# crawls the newest hour as soon as it closed, and refreshes everything else only when rows arrived
+CRAWL_TRIGGER = os.getenv("CRAWL_TRIGGER", "schedule")
+
+sensor_status = (
+    dg.DefaultSensorStatus.RUNNING
+    if CRAWL_TRIGGER == "sensor"
+    else dg.DefaultSensorStatus.STOPPED
+)
+
+
+@dg.sensor(
+    target=["all_items", "available_price_data", "recent_price_data"],
+    minimum_interval_seconds=30,
+    default_status=sensor_status,
+    description="Crawls the newest hour as soon as it closed.",
+)
+def newest_hour_sensor(context: dg.SensorEvaluationContext):
+    """Requests a crawl of the newest hour once its partition exists. The cursor holds the
+    last hour requested, so every hour is requested once."""
+    partition_key = hourly_partitions.get_last_partition_key()
+    if partition_key is None or partition_key == context.cursor:
+        return dg.SkipReason("The newest hour was requested already.")
+    context.update_cursor(partition_key)
+    return dg.RunRequest(run_key=partition_key, partition_key=partition_key)
+
+
+# Hours with failed combinations requested per tick, so a long outage doesn't flood the run queue
+RETRY_HOURS_PER_TICK = 24
+
+# With the sensors, new_price_data_sensor refreshes what depends on the retried rows
+retry_target = ["all_items", "available_price_data", "recent_price_data"]
+if CRAWL_TRIGGER != "sensor":
+    retry_target += ["price_rollups", "price_history_cache"]
+
+
+@dg.sensor(
+    target=retry_target,
+    minimum_interval_seconds=300,
+    default_status=dg.DefaultSensorStatus.RUNNING,
+    description="Crawls the hours again whose failed combinations are due for another attempt.",
+)
+def crawl_retry_sensor(context: dg.SensorEvaluationContext, database: DatabaseResource):
+    """Requests a crawl of every hour that has combinations in the crawl ledger whose next attempt
+    is due. The latest next attempt is part of the run key: a retry that fails again pushes it
+    back and gets requested once more when that's due, while an hour is not requested twice
+    for the same attempt."""
+    # Needs pandas and psycopg, which loading the definitions shouldn't pay for
+    from marketcrawler.ledger import read_due_hours
+
+    run_requests = []
+    for hour, next_attempt in read_due_hours(database, RETRY_HOURS_PER_TICK):
+        partition_key = hour.strftime("%Y-%m-%d-%H:%M")
+        if not hourly_partitions.has_partition_key(partition_key):
+            continue
+        run_requests.append(
+            dg.RunRequest(
+                run_key=f"retry:{partition_key}:{next_attempt.isoformat()}",
+                partition_key=partition_key,
+            )
+        )
+    if not run_requests:
+        return dg.SkipReason("No failed combinations are due.")
+    return run_requests
+
+
+@dg.sensor(
+    target=[
+        "price_history_cache",
+        "price_rollups",
+        "price_data_retention",
+        "generate_plotly_dashboard",
+    ],
+    minimum_interval_seconds=30,
+    default_status=sensor_status,
+    description="Refreshes the rollups, the price cache and the dashboard once new price data arrived.",
+)
+def new_price_data_sensor(
+    context: dg.SensorEvaluationContext, database: DatabaseResource
+):
+    """Listens to the notifications of price_data's insert trigger. Every hour that received rows
+    gets its rollups updated, and the price cache and dashboard are refreshed once. If the listener
+    had to (re)connect, notifications may have been missed, and the rows of all transactions that
+    were still running at the previous tick are looked up instead. The cursor holds the xmin of that
+    tick's snapshot and the highest entry_id handled."""
+    # Needs psycopg, which loading the definitions shouldn't pay for
+    from marketcrawler.notifications import (
+        get_listener,
+        hours_of_notifications,
+        read_hours_of_entries,
+        read_new_hours,
+        read_position,
+    )
+
+    listener = get_listener(database)
+    polled = listener.poll()
+    if context.cursor is None:
+        # Older rows were taken care of by the schedule or by backfills
+        entry_id, xmin = read_position(database)
+        context.update_cursor(json.dumps({"entry_id": entry_id, "xmin": xmin}))
+        return dg.SkipReason("Started listening for new price data.")
+
+    cursor = json.loads(context.cursor)
+    if isinstance(cursor, int):
+        # Written before the cursor held an xmin
+        cursor = {"entry_id": cursor, "xmin": None}
+    if polled is None:
+        hours, max_entry_id, xmin = read_new_hours(
+            database, cursor["entry_id"], cursor["xmin"]
+        )
+    else:
+        # Delivered in commit order, which isn't the order of the entry_ids. Some may describe
+        # rows that were looked up already, their hours are updated once more.
+        notifications, xmin = polled
+        hours, max_entry_id, lookups = hours_of_notifications(notifications)
+        hours |= read_hours_of_entries(database, lookups)
+        max_entry_id = max(cursor["entry_id"], max_entry_id)
+    new_cursor = json.dumps({"entry_id": max_entry_id, "xmin": xmin})
+    if not hours:
+        return dg.SensorResult(skip_reason="No new price data.", cursor=new_cursor)
+
+    # The entry_id makes the run keys unique, so an hour that receives more rows later is updated again
+    partition_keys = sorted(hour.strftime("%Y-%m-%d-%H:%M") for hour in hours)
+    run_requests = [
+        dg.RunRequest(
+            run_key=f"price_rollups:{partition_key}:{max_entry_id}",
+            asset_selection=[dg.AssetKey("price_rollups")],
+            partition_key=partition_key,
+        )
+        for partition_key in partition_keys
+        if hourly_partitions.has_partition_key(partition_key)
+    ]
+    run_requests.append(
+        dg.RunRequest(
+            run_key=f"refresh:{max_entry_id}",
+            asset_selection=[
+                dg.AssetKey("price_history_cache"),
+                dg.AssetKey("price_data_retention"),
+                dg.AssetKey("generate_plotly_dashboard"),
+            ],
+        )
+    )
+    return dg.SensorResult(run_requests=run_requests, cursor=new_cursor)
@@ -0,0 +1,130 @@
+import queue
+import threading
+import time
+from datetime import datetime
+from marketcrawler.ledger import record_failures
+from marketcrawler.price_partitions import ensure_partitions, month_of
+from marketcrawler.resources import DatabaseResource
+
+PRICE_COLUMNS = ["item_id", "volume", "price", "timestamp"]
+# Every (item_id, timestamp) exists once in price_data
+PRICE_KEY = ["item_id", "timestamp"]
+
+
+class ChunkedWriter:
+    """Writes crawled price data to the database on a background thread while the crawl goes on.
+    Entries are committed in chunks of `chunk_size`, or after `flush_seconds` at the latest, so a
+    crash only loses the current chunk. The queue in between is bounded, so the crawl waits for
+    the database instead of piling up results in memory. Rows that another run inserted already
+    are skipped, and the monthly partitions of price_data are created as needed.
+
+    Use as a context manager: leaving it writes the last chunk and raises any error of the writer.
+    """
+
+    def __init__(
+        self,
+        database: DatabaseResource,
+        chunk_size: int,
+        flush_seconds: float,
+        retry_backoff: float,
+        retry_backoff_max: float,
+    ):
+        self.database = database
+        self.chunk_size = max(1, chunk_size)
+        self.flush_seconds = flush_seconds
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.inserted_rows = 0
+        self.duplicate_rows = 0
+        self.recorded_failures = 0
+        self.committed_chunks = 0
+        self.insert_seconds = 0.0
+        self._queue = queue.Queue(maxsize=self.chunk_size)
+        self._error: Exception | None = None
+        # Months whose partition is known to exist
+        self._months = set()
+        self._thread = threading.Thread(
+            target=self._run, name="price-data-writer", daemon=True
+        )
+
+    def __enter__(self) -> "ChunkedWriter":
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        # Also on errors of the crawl, so that what was crawled so far is kept
+        self._put(None)
+        self._thread.join()
+        if self._error is not None and exc is None:
+            raise self._error
+
+    def write(self, entry: dict) -> None:
+        self._put(("entry", entry))
+
+    def fail(self, item_id: int, dt: datetime, error: str) -> None:
+        """Records a failed attempt in the crawl ledger, with the next chunk."""
+        self._put(("failure", (item_id, dt, error)))
+
+    def _put(self, message) -> None:
+        # Don't wait forever on a full queue when nobody is left to empty it
+        while self._thread.is_alive():
+            try:
+                self._queue.put(message, timeout=1)
+                return
+            except queue.Full:
+                continue
+        if message is not None:
+            raise self._error or Exception("The price data writer has stopped.")
+
+    def _run(self) -> None:
+        rows, failures = [], []
+        try:
+            with self.database.get_connection() as conn:
+                deadline = time.monotonic() + self.flush_seconds
+                while True:
+                    try:
+                        message = self._queue.get(
+                            timeout=max(0.0, deadline - time.monotonic())
+                        )
+                    except queue.Empty:
+                        message = "flush"
+                    if message is None or message == "flush":
+                        self._commit(conn, rows, failures)
+                        rows, failures = [], []
+                        deadline = time.monotonic() + self.flush_seconds
+                        if message is None:
+                            return
+                        continue
+
+                    kind, value = message
+                    if kind == "entry":
+                        rows.append(tuple(value[column] for column in PRICE_COLUMNS))
+                    else:
+                        failures.append(value)
+                    if len(rows) + len(failures) >= self.chunk_size:
+                        self._commit(conn, rows, failures)
+                        rows, failures = [], []
+                        deadline = time.monotonic() + self.flush_seconds
+        except Exception as e:
+            self._error = e
+
+    def _commit(self, conn, rows: list[tuple], failures: list[tuple]) -> None:
+        if not rows and not failures:
+            return
+        start = time.perf_counter()
+        timestamp = PRICE_COLUMNS.index("timestamp")
+        months = {month_of(row[timestamp]) for row in rows} - self._months
+        if months:
+            ensure_partitions(conn, months)
+            self._months |= months
+        inserted = self.database.upsert_rows(
+            conn, "price_data", PRICE_COLUMNS, rows, PRICE_KEY
+        )
+        # The ledger is part of the same transaction as the data it describes
+        record_failures(conn, failures, self.retry_backoff, self.retry_backoff_max)
+        conn.commit()
+        self.insert_seconds += time.perf_counter() - start
+        self.inserted_rows += inserted
+        self.duplicate_rows += len(rows) - inserted
+        self.recorded_failures += len(failures)
+        self.committed_chunks += 1
@@ -0,0 +1,118 @@
+import pytest
+import threading
+from marketcrawler.resources import api as api_module
+from marketcrawler.resources.api import (
+    ApiEndpointResource,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(api_module.time, "monotonic", clock)
+    return clock
+
+
+def fail(breaker: CircuitBreaker, times: int) -> None:
+    for _ in range(times):
+        breaker.before_request()
+        breaker.record(success=False)
+
+
+def test_opens_after_threshold_consecutive_failures(clock):
+    breaker = CircuitBreaker(threshold=3, cooldown=30.0)
+    fail(breaker, 2)
+    breaker.before_request()
+    breaker.record(success=True)
+    # A success resets the count
+    fail(breaker, 2)
+    breaker.before_request()
+
+    breaker.record(success=False)
+
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+
+def test_lets_a_single_trial_through_after_the_cooldown(clock):
+    breaker = CircuitBreaker(threshold=1, cooldown=30.0)
+    fail(breaker, 1)
+    clock.now += 29.0
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+    clock.now += 1.0
+    breaker.before_request()
+    # Only one trial at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+    breaker.record(success=True)
+    breaker.before_request()
+    breaker.before_request()
+
+
+def test_failed_trial_restarts_the_cooldown(clock):
+    breaker = CircuitBreaker(threshold=1, cooldown=30.0)
+    fail(breaker, 1)
+    clock.now += 30.0
+    breaker.before_request()
+
+    breaker.record(success=False)
+
+    clock.now += 29.0
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    clock.now += 1.0
+    breaker.before_request()
+
+
+def test_threshold_zero_never_opens(clock):
+    breaker = CircuitBreaker(threshold=0, cooldown=30.0)
+    fail(breaker, 100)
+    breaker.before_request()
+
+
+def test_crawl_runs_every_task_once_and_reports_errors():
+    resource = ApiEndpointResource(api_endpoint="http://localhost:1", max_concurrency=4)
+    done = {}
+    threads = set()
+
+    def fetch(task: int) -> int:
+        if task % 5 == 0:
+            raise ValueError(task)
+        return task * 2
+
+    def on_done(task, result, error):
+        threads.add(threading.get_ident())
+        done[task] = error if error is not None else result
+
+    resource.crawl(range(20), fetch, on_done)
+
+    assert sorted(done) == list(range(20))
+    assert all(isinstance(done[task], ValueError) for task in range(0, 20, 5))
+    assert done[3] == 6
+    # on_done runs on the calling thread
+    assert threads == {threading.get_ident()}
+
+
+def test_shards_share_the_rate_limit():
+    resource = ApiEndpointResource(
+        api_endpoint="http://localhost:1", requests_per_second=10.0
+    )
+
+    assert resource.share_rate_limit(4).requests_per_second == 2.5
+    assert resource.share_rate_limit(1).requests_per_second == 10.0
+    # No limit stays no limit
+    unlimited = ApiEndpointResource(api_endpoint="http://localhost:1")
+    assert unlimited.share_rate_limit(4).requests_per_second == 0.0
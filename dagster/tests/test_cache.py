@@ -0,0 +1,175 @@
+import numpy as np
+import os
+import pyarrow as pa
+import pytest
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from marketcrawler.resources.cache import PriceCacheResource, missing_ranges
+
+DAY = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeCursor:
+    def __init__(self, database: "FakeDatabase"):
+        self.database = database
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query: str, params: list) -> None:
+        # WHERE entry_id > %s OR entry_id BETWEEN %s AND %s ... ORDER BY entry_id
+        high_water_mark, holes = params[0], list(zip(params[1::2], params[2::2]))
+        self.rows = sorted(
+            row
+            for row in self.database.visible
+            if row[0] > high_water_mark
+            or any(low <= row[0] <= high for low, high in holes)
+        )
+
+    def fetchmany(self, size: int) -> list[tuple]:
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+class FakeConnection:
+    def __init__(self, database: "FakeDatabase"):
+        self.database = database
+
+    def cursor(self, name=None):
+        return FakeCursor(self.database)
+
+
+class FakeDatabase:
+    """Serves the committed rows of price_data to the cache's sync."""
+
+    def __init__(self):
+        self.visible = []
+
+    def add(self, entry_id: int, hours: int, item_id: int = 1) -> None:
+        self.visible.append((entry_id, item_id, 10, 1.5, DAY + timedelta(hours=hours)))
+
+    @contextmanager
+    def get_connection(self):
+        yield FakeConnection(self)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PriceCacheResource(cache_dir=str(tmp_path), fetch_size=2)
+
+
+def test_missing_ranges():
+    ids = np.array([2, 3, 7, 20])
+    assert missing_ranges(ids, 1, 10) == [[1, 1], [4, 6], [8, 10]]
+    assert missing_ranges(ids, 2, 3) == []
+    assert missing_ranges(np.array([], dtype=np.int64), 5, 6) == [[5, 6]]
+
+
+def test_sync_appends_and_reads_back(cache):
+    database = FakeDatabase()
+    for entry_id in range(1, 6):
+        database.add(entry_id, hours=entry_id * 10)
+
+    stats = cache.sync(database)
+
+    assert stats["appended_rows"] == 5
+    assert stats["high_water_mark"] == 5
+    assert stats["pending_holes"] == 0
+    df = cache.read(DAY, DAY + timedelta(hours=40))
+    assert sorted(df["item_id"].tolist()) == [1, 1, 1]
+    assert str(df["item_id"].dtype) == "int32"
+    assert str(df["price"].dtype) == "float32"
+    assert str(df["timestamp"].dtype) == "datetime64[ns, UTC]"
+    # Nothing new, nothing appended
+    assert cache.sync(database)["appended_rows"] == 0
+
+
+def test_holes_are_filled_when_their_rows_show_up(cache):
+    database = FakeDatabase()
+    # 3 and 4 are not committed yet
+    for entry_id in [1, 2, 5]:
+        database.add(entry_id, hours=entry_id)
+    cache.sync(database)
+    assert [hole[:2] for hole in cache.read_state()["holes"]] == [[3, 4]]
+
+    database.add(4, hours=4)
+    stats = cache.sync(database)
+
+    assert stats["appended_rows"] == 1
+    assert [hole[:2] for hole in cache.read_state()["holes"]] == [[3, 3]]
+    assert len(cache.read(DAY, DAY + timedelta(days=1))) == 4
+
+
+def test_holes_expire(cache):
+    database = FakeDatabase()
+    for entry_id in [1, 3]:
+        database.add(entry_id, hours=entry_id)
+    cache.sync(database)
+
+    expired = PriceCacheResource(cache_dir=cache.cache_dir, hole_timeout=0.0)
+    stats = expired.sync(database)
+
+    assert stats["pending_holes"] == 0
+    assert expired.read_state()["holes"] == []
+
+
+def test_compaction_keeps_all_rows(tmp_path):
+    cache = PriceCacheResource(
+        cache_dir=str(tmp_path), fetch_size=1, max_files_per_day=2
+    )
+    database = FakeDatabase()
+    for entry_id in range(1, 6):
+        database.add(entry_id, hours=entry_id)
+        cache.sync(database)
+
+    state = cache.read_state()
+    assert len(cache.list_files("2025-01-01", state)) <= 2
+    assert state["superseded"] == []
+    df = cache.read(DAY, DAY + timedelta(days=1), columns=["entry_id"])
+    assert sorted(df["entry_id"].tolist()) == [1, 2, 3, 4, 5]
+
+
+def test_unfinished_syncs_are_cleaned_up(cache):
+    database = FakeDatabase()
+    database.add(1, hours=1)
+    cache.sync(database)
+    state = cache.read_state()
+    # Written by a sync that never committed its state
+    path = cache.write_file(
+        "2025-01-01", pa.table({"entry_id": [2]}), state["sync_id"] + 1, 0
+    )
+    assert len(cache.read(DAY, DAY + timedelta(days=1))) == 1
+
+    cache.clean_up(state)
+
+    assert not os.path.exists(path)
+
+
+def test_drop_before_removes_old_days(cache):
+    database = FakeDatabase()
+    # Days 1, 2 and 3 of January, and a hole at 4
+    for entry_id, hours in [(1, 1), (2, 25), (3, 49), (5, 50)]:
+        database.add(entry_id, hours=hours)
+    cache.sync(database)
+
+    dropped = cache.drop_before(DAY + timedelta(days=1, hours=12))
+
+    assert dropped == ["2025-01-01"]
+    assert not os.path.exists(cache.day_dir("2025-01-01"))
+    state = cache.read_state()
+    assert state["high_water_mark"] == 5
+    assert [hole[:2] for hole in state["holes"]] == [[4, 4]]
+    df = cache.read(DAY, DAY + timedelta(days=3), columns=["entry_id"])
+    assert sorted(df["entry_id"].tolist()) == [2, 3, 5]
+
+    # Late rows of a dropped day are not cached again, the ones of kept days are
+    database.add(4, hours=2)
+    database.add(6, hours=30)
+    assert cache.sync(database)["appended_rows"] == 2
+    assert not os.path.exists(cache.day_dir("2025-01-01"))
+    df = cache.read(DAY, DAY + timedelta(days=3), columns=["entry_id"])
+    assert sorted(df["entry_id"].tolist()) == [2, 3, 5, 6]
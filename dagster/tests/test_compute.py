@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+from datetime import datetime, timedelta, timezone
+from marketcrawler.compute import BACKENDS, PandasBackend, cell_blocks
+
+
+@pytest.fixture(params=["polars", "duckdb"])
+def backend(request):
+    # Optional backends are only tested where their package is installed
+    pytest.importorskip(request.param)
+    return BACKENDS[request.param](block_size=7)
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    dt_now = datetime(2025, 3, 1, tzinfo=timezone.utc)
+    dt_past = dt_now - timedelta(hours=50)
+    all_items = pd.DataFrame(
+        {
+            "item_id": np.arange(1, 41),
+            "name": pd.Categorical([f"Item {i % 7}" for i in range(40)]),
+        }
+    )
+    available = pd.DataFrame(
+        {
+            # Some of the items are unknown, and some points are outside of the window
+            "item_id": rng.integers(1, 45, size=1500),
+            "price": rng.random(1500),
+            "timestamp": pd.to_datetime(
+                int(dt_past.timestamp()) + rng.integers(-3600, 52 * 3600, size=1500),
+                unit="s",
+                utc=True,
+            ),
+        }
+    )
+    return all_items, available, dt_now, dt_past
+
+
+def test_cell_blocks():
+    assert list(cell_blocks(5, 3, 7)) == [(0, 6), (6, 12), (12, 15)]
+    # Blocks hold at least one item
+    assert list(cell_blocks(2, 10, 7)) == [(0, 10), (10, 20)]
+
+
+def test_backends_match_pandas(backend, data):
+    all_items, available, dt_now, dt_past = data
+    reference = PandasBackend()
+
+    missing = backend.missing_combinations(all_items, available, dt_now, dt_past)
+    expected = reference.missing_combinations(all_items, available, dt_now, dt_past)
+    pd.testing.assert_frame_equal(missing, expected)
+
+    backing_off = expected.sample(frac=0.2, random_state=1)
+    pd.testing.assert_frame_equal(
+        backend.remove_backing_off(expected, backing_off),
+        reference.remove_backing_off(expected, backing_off),
+    )
+
+    pd.testing.assert_frame_equal(
+        backend.join_items(available, all_items),
+        reference.join_items(available, all_items),
+    )
+
+
+def test_empty_window(backend, data):
+    all_items, available, dt_now, _ = data
+    missing = backend.missing_combinations(all_items, available, dt_now, dt_now)
+    assert len(missing) == 0
+    assert list(missing.columns) == ["item_id", "timestamp"]
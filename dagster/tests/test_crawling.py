@@ -0,0 +1,467 @@
+import json
+import logging
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta, timezone
+from marketcrawler.crawling import (
+    crawl_missing_price_data,
+    crawl_missing_price_ranges,
+    determine_missing_combinations,
+    fetch_price_batch,
+    fetch_price_range,
+    iter_missing_combinations,
+    mostly_missing_hours,
+    split_missing_combinations,
+    to_hour_ranges,
+)
+from marketcrawler.resources.api import MAX_BATCH_SIZE
+
+HOUR = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeResponse:
+    def __init__(self, lines: list[dict] | dict, fail_after: int | None = None):
+        self.lines = lines
+        self.fail_after = fail_after
+
+    def json(self) -> dict:
+        return self.lines
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self) -> None:
+        pass
+
+    def iter_lines(self):
+        for number, line in enumerate(self.lines):
+            if number == self.fail_after:
+                raise ConnectionError("Connection dropped")
+            yield json.dumps(line).encode()
+
+
+class FakeApi:
+    """Answers with a price for every known item and hour. Range requests leave out the
+    left out ones, single and batch requests report unknown items as failed."""
+
+    def __init__(self, item_ids: list[int], left_out=(), fail_after=None, batch_size=1):
+        self.item_ids = item_ids
+        self.left_out = set(left_out)
+        # Hour the stream breaks at -> number of lines sent before
+        self.fail_after = fail_after or {}
+        self.batch_size = batch_size
+        self.ranges = []
+        self.batches = []
+
+    def price(self, item_id: str, time: str) -> dict:
+        if int(item_id) not in self.item_ids:
+            return {"success": False, "error": f"Item with id {item_id} not found."}
+        return {"price": float(item_id), "volume": 1, "success": True}
+
+    def request(self, item_id: str, time: str):
+        self.batches.append([(item_id, time)])
+        return FakeResponse(self.price(item_id, time))
+
+    def request_batch(self, entries: list[tuple[str, str]]):
+        self.batches.append(entries)
+        return FakeResponse(
+            {"success": True, "results": [self.price(*entry) for entry in entries]}
+        )
+
+    def request_range(self, start: str, end: str, item_id: str | None = None):
+        dt_start, dt_end = datetime.fromisoformat(start), datetime.fromisoformat(end)
+        self.ranges.append((dt_start, dt_end, item_id))
+        item_ids = [int(item_id)] if item_id is not None else self.item_ids
+        lines = [
+            {
+                "item_id": item,
+                "time": hour.isoformat(),
+                "price": float(item),
+                "volume": 1,
+                "success": True,
+            }
+            for hour in pd.date_range(dt_start, dt_end, freq="h", inclusive="left")
+            for item in item_ids
+            if (item, hour.to_pydatetime()) not in self.left_out
+        ]
+        return FakeResponse(lines, self.fail_after.get(dt_start))
+
+    def crawl(self, tasks, fetch, on_done) -> None:
+        for task in tasks:
+            try:
+                result = fetch(task)
+            except Exception as e:
+                on_done(task, None, e)
+            else:
+                on_done(task, result, None)
+
+
+class FakeContext:
+    asset_key = "recent_price_data"
+    log = logging.getLogger("test_crawling")
+
+    def log_event(self, event) -> None:
+        pass
+
+
+def expected_missing(item_ids, available, dt_now, dt_past):
+    """The missing combinations, computed the slow and obvious way."""
+    known = {
+        (item_id, ts.floor("h"))
+        for item_id, ts in zip(available["item_id"], available["timestamp"])
+        if not pd.isna(ts)
+    }
+    hours = pd.date_range(dt_past, dt_now, freq="h", inclusive="left")
+    return [
+        (item_id, hour)
+        for item_id in sorted(set(item_ids))
+        for hour in hours
+        if (item_id, hour) not in known
+    ]
+
+
+def as_pairs(df: pd.DataFrame) -> list:
+    return list(zip(df["item_id"], df["timestamp"]))
+
+
+def test_window_across_new_year():
+    dt_past = datetime(2024, 12, 31, 20, tzinfo=timezone.utc)
+    dt_now = datetime(2025, 1, 1, 4, tzinfo=timezone.utc)
+    all_items = pd.DataFrame({"item_id": [3, 1, 2]})
+    available = pd.DataFrame(
+        {
+            "item_id": [1, 1, 2, 3],
+            "timestamp": pd.to_datetime(
+                [
+                    "2024-12-31 23:00",
+                    "2025-01-01 00:30",
+                    "2025-01-01 03:59",
+                    # Same hour of day, one year earlier
+                    "2023-12-31 22:00",
+                ],
+                utc=True,
+            ),
+        }
+    )
+
+    missing = determine_missing_combinations(all_items, available, dt_now, dt_past)
+
+    assert as_pairs(missing) == expected_missing([1, 2, 3], available, dt_now, dt_past)
+    assert len(missing) == 3 * 8 - 3
+    assert str(missing["timestamp"].dtype) == "datetime64[ns, UTC]"
+
+
+def test_blocks_match_a_single_block():
+    rng = np.random.default_rng(0)
+    dt_now = datetime(2025, 3, 1, tzinfo=timezone.utc)
+    dt_past = dt_now - timedelta(hours=50)
+    all_items = pd.DataFrame({"item_id": np.arange(1, 41)})
+    available = pd.DataFrame(
+        {
+            "item_id": rng.integers(1, 45, size=1500),
+            "timestamp": pd.to_datetime(
+                int(dt_past.timestamp()) + rng.integers(-3600, 52 * 3600, size=1500),
+                unit="s",
+                utc=True,
+            ),
+        }
+    )
+
+    blocks = list(
+        iter_missing_combinations(all_items, available, dt_now, dt_past, block_size=7)
+    )
+
+    assert len(blocks) > 1
+    assert as_pairs(pd.concat(blocks)) == expected_missing(
+        all_items["item_id"], available, dt_now, dt_past
+    )
+
+
+def test_ignores_unknown_items_missing_timestamps_and_other_hours():
+    dt_past = datetime(2025, 1, 1, 10, tzinfo=timezone.utc)
+    dt_now = datetime(2025, 1, 1, 12, tzinfo=timezone.utc)
+    all_items = pd.DataFrame({"item_id": [1]})
+    available = pd.DataFrame(
+        {
+            "item_id": [1, 1, 1, 99],
+            "timestamp": pd.to_datetime(
+                [None, "2025-01-01 09:59", "2025-01-01 12:00", "2025-01-01 10:00"],
+                utc=True,
+            ),
+        }
+    )
+
+    missing = determine_missing_combinations(all_items, available, dt_now, dt_past)
+
+    assert as_pairs(missing) == [
+        (1, pd.Timestamp("2025-01-01 10:00", tz="UTC")),
+        (1, pd.Timestamp("2025-01-01 11:00", tz="UTC")),
+    ]
+
+
+def test_partial_hours_are_left_out():
+    # Only full hours from dt_past count, the window rounds up to whole hours
+    dt_past = datetime(2025, 1, 1, 10, 30, tzinfo=timezone.utc)
+    dt_now = datetime(2025, 1, 1, 11, 30, tzinfo=timezone.utc)
+    all_items = pd.DataFrame({"item_id": [1]})
+    available = pd.DataFrame(
+        {
+            "item_id": pd.Series([], dtype="int64"),
+            "timestamp": pd.to_datetime([], utc=True),
+        }
+    )
+
+    missing = determine_missing_combinations(all_items, available, dt_now, dt_past)
+
+    assert as_pairs(missing) == [(1, pd.Timestamp("2025-01-01 11:00", tz="UTC"))]
+
+
+def test_empty_window():
+    dt = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    all_items = pd.DataFrame({"item_id": [1, 2]})
+    available = pd.DataFrame(
+        {
+            "item_id": pd.Series([], dtype="int64"),
+            "timestamp": pd.to_datetime([], utc=True),
+        }
+    )
+
+    missing = determine_missing_combinations(all_items, available, dt, dt)
+
+    assert len(missing) == 0
+    assert list(missing.columns) == ["item_id", "timestamp"]
+    assert str(missing["timestamp"].dtype) == "datetime64[ns, UTC]"
+
+
+def test_mostly_missing_hours():
+    missing = pd.DataFrame(
+        {
+            "item_id": [1, 2, 3, 1, 2],
+            "timestamp": pd.to_datetime(
+                [
+                    "2025-01-01 10:00",
+                    "2025-01-01 10:00",
+                    "2025-01-01 10:00",
+                    "2025-01-01 11:00",
+                    "2025-01-01 12:00",
+                ],
+                utc=True,
+            ),
+        }
+    )
+
+    by_range = mostly_missing_hours(missing, num_items=4, min_missing=0.5)
+
+    assert by_range.tolist() == [True, True, True, False, False]
+
+
+def hourly_combinations(item_ids, num_hours) -> pd.DataFrame:
+    hours = pd.date_range("2025-01-01", periods=num_hours, freq="h", tz="UTC")
+    return pd.DataFrame(
+        {
+            "item_id": np.repeat(item_ids, num_hours),
+            "timestamp": np.tile(hours, len(item_ids)),
+        }
+    )
+
+
+def test_split_by_item_keeps_items_together():
+    missing = hourly_combinations([5, 1, 3, 2, 4, 6, 7, 9, 8, 10], 3)
+
+    shards = split_missing_combinations(missing, 3, "item")
+
+    assert len(shards) == 3
+    item_sets = [set(shard["item_id"]) for shard in shards]
+    assert set().union(*item_sets) == set(range(1, 11))
+    assert sum(len(items) for items in item_sets) == 10
+    # Sizes differ by at most one item's combinations
+    sizes = [len(shard) for shard in shards]
+    assert sum(sizes) == len(missing)
+    assert max(sizes) - min(sizes) <= 3
+
+
+def test_split_by_time_keeps_hours_together():
+    missing = hourly_combinations([1, 2, 3], 8)
+
+    shards = split_missing_combinations(missing, 4, "time")
+
+    hour_sets = [set(shard["timestamp"]) for shard in shards]
+    assert [len(hours) for hours in hour_sets] == [2, 2, 2, 2]
+    assert set().union(*hour_sets) == set(missing["timestamp"])
+    assert [len(shard) for shard in shards] == [6, 6, 6, 6]
+    assert str(shards[0]["timestamp"].dtype) == "datetime64[ns, UTC]"
+
+
+def test_split_into_fewer_parts_than_shards():
+    missing = hourly_combinations([1, 2], 4)
+
+    shards = split_missing_combinations(missing, 5, "item")
+
+    # One item can't be split, so there are only as many parts as items
+    assert len(shards) == 2
+    assert [set(shard["item_id"]) for shard in shards] == [{1}, {2}]
+
+
+def test_split_nothing_missing():
+    missing = hourly_combinations([], 4)
+
+    assert split_missing_combinations(missing, 3, "item") == []
+    assert split_missing_combinations(missing, 3, "time") == []
+
+
+def hours(*offsets: int) -> list[datetime]:
+    return [HOUR + timedelta(hours=offset) for offset in offsets]
+
+
+def test_hour_ranges_are_split_at_max_hours():
+    timestamps = pd.Series(pd.to_datetime(hours(*range(30)), utc=True))
+
+    assert to_hour_ranges(timestamps, max_hours=24) == [
+        (HOUR, HOUR + timedelta(hours=24)),
+        (HOUR + timedelta(hours=24), HOUR + timedelta(hours=30)),
+    ]
+
+
+def test_hour_ranges_of_non_contiguous_hours():
+    # Unordered and repeated, as every item lists its hours
+    timestamps = pd.Series(pd.to_datetime(hours(7, 1, 0, 5, 2, 1, 0), utc=True))
+
+    assert to_hour_ranges(timestamps, max_hours=2) == [
+        (HOUR, HOUR + timedelta(hours=2)),
+        (HOUR + timedelta(hours=2), HOUR + timedelta(hours=3)),
+        (HOUR + timedelta(hours=5), HOUR + timedelta(hours=6)),
+        (HOUR + timedelta(hours=7), HOUR + timedelta(hours=8)),
+    ]
+
+
+def test_mostly_missing_hours_at_the_threshold():
+    missing = pd.DataFrame(
+        {
+            "item_id": [1, 2, 1],
+            "timestamp": pd.to_datetime(hours(0, 0, 1), utc=True),
+        }
+    )
+
+    # Exactly half of the items lack hour 0, so it's requested as a range
+    assert mostly_missing_hours(missing, 4, 0.5).tolist() == [True, True, False]
+    # 0 requests everything as ranges, more than 1 nothing
+    assert mostly_missing_hours(missing, 4, 0.0).all()
+    assert not mostly_missing_hours(missing, 4, 1.1).any()
+
+
+def test_fetch_price_range_parses_every_line():
+    api = FakeApi([1, 2])
+
+    entries = fetch_price_range(api, HOUR, HOUR + timedelta(hours=2), item_id=2)
+
+    assert api.ranges == [(HOUR, HOUR + timedelta(hours=2), "2")]
+    assert [(entry["item_id"], entry["timestamp"]) for entry in entries] == [
+        (2, HOUR),
+        (2, HOUR + timedelta(hours=1)),
+    ]
+
+
+def crawl_ranges(api: FakeApi, missing: list[tuple[int, datetime]]):
+    entries, failures = [], []
+    crawl_missing_price_ranges(
+        FakeContext(),
+        pd.DataFrame(missing, columns=["item_id", "timestamp"]).astype(
+            {"timestamp": "datetime64[ns, UTC]"}
+        ),
+        api,
+        entries.append,
+        lambda item_id, dt, error: failures.append((item_id, dt, str(error))),
+    )
+    return [(entry["item_id"], entry["timestamp"]) for entry in entries], failures
+
+
+def test_range_crawl_keeps_only_missing_pairs():
+    api = FakeApi([1, 2, 3])
+    missing = [(1, hour) for hour in hours(0, 1)] + [(3, hours(1)[0])]
+
+    entries, failures = crawl_ranges(api, missing)
+
+    # Every item is requested, as more than one lacks data
+    assert api.ranges == [(HOUR, HOUR + timedelta(hours=2), None)]
+    assert sorted(entries) == sorted(missing)
+    assert failures == []
+
+
+def test_failed_and_partial_ranges_fail_their_own_pairs():
+    api = FakeApi(
+        [1, 2],
+        # Ends early without an error
+        left_out=[(2, hours(1)[0])],
+        # Breaks after the first line
+        fail_after={hours(5)[0]: 1},
+    )
+    missing = [(item_id, hour) for item_id in [1, 2] for hour in hours(0, 1, 5)]
+
+    entries, failures = crawl_ranges(api, missing)
+
+    assert sorted(entries) == [(1, hours(0)[0]), (1, hours(1)[0]), (2, hours(0)[0])]
+    assert failures == [
+        (1, hours(5)[0], "Connection dropped"),
+        (2, hours(1)[0], "Not part of the range response."),
+        (2, hours(5)[0], "Connection dropped"),
+    ]
+
+
+def test_batch_failures_only_fail_their_own_pairs():
+    api = FakeApi([1, 2])
+    batch = [(1, HOUR), (99, HOUR), (2, HOUR)]
+
+    entries = fetch_price_batch(api, batch)
+
+    assert api.batches == [[(str(item_id), dt.isoformat()) for item_id, dt in batch]]
+    assert entries[0] == {"item_id": 1, "volume": 1, "price": 1.0, "timestamp": HOUR}
+    assert "99 not found" in str(entries[1])
+    assert entries[2]["item_id"] == 2
+
+
+def test_batch_of_one_uses_the_single_endpoint():
+    api = FakeApi([1])
+
+    assert fetch_price_batch(api, [(1, HOUR)]) == [
+        {"item_id": 1, "volume": 1, "price": 1.0, "timestamp": HOUR}
+    ]
+    assert "not found" in str(fetch_price_batch(api, [(5, HOUR)])[0])
+
+
+def crawl_batches(api: FakeApi, missing: list[tuple[int, datetime]]):
+    entries, failures = [], []
+    crawl_missing_price_data(
+        FakeContext(),
+        pd.DataFrame(missing, columns=["item_id", "timestamp"]).astype(
+            {"timestamp": "datetime64[ns, UTC]"}
+        ),
+        api,
+        entries.append,
+        lambda item_id, dt, error: failures.append((item_id, dt)),
+    )
+    return [(entry["item_id"], entry["timestamp"]) for entry in entries], failures
+
+
+def test_batches_are_split_at_the_batch_size():
+    api = FakeApi([1, 2, 3], batch_size=3)
+    missing = [(item_id, hour) for item_id in [1, 2, 3, 4] for hour in hours(0, 1)]
+
+    entries, failures = crawl_batches(api, missing)
+
+    assert [len(batch) for batch in api.batches] == [3, 3, 2]
+    assert entries == missing[:6]
+    assert failures == missing[6:]
+
+
+def test_batches_are_at_most_max_batch_size():
+    api = FakeApi([1], batch_size=MAX_BATCH_SIZE * 2)
+    missing = [(1, hour) for hour in hours(*range(MAX_BATCH_SIZE + 1))]
+
+    entries, failures = crawl_batches(api, missing)
+
+    assert [len(batch) for batch in api.batches] == [MAX_BATCH_SIZE, 1]
+    assert len(entries) == len(missing)
+    assert failures == []
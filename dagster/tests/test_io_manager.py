@@ -0,0 +1,94 @@
+import dagster as dg
+import pandas as pd
+from marketcrawler.resources.io_manager import ArrowIOManager
+
+# Two partitions, so the unpartitioned downstream asset loads both of them
+hourly = dg.HourlyPartitionsDefinition(
+    start_date="2025-01-01-10:00", end_date="2025-01-01-12:00", timezone="UTC"
+)
+
+
+def price_frame(item_ids: list[int], hour: str) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "item_id": pd.Series(item_ids, dtype="int32"),
+            "timestamp": pd.Series(
+                pd.Timestamp(hour, tz="UTC"), index=range(len(item_ids))
+            ),
+            "price": pd.Series(
+                [1.5 * item_id for item_id in item_ids], dtype="float32"
+            ),
+            "name": pd.Categorical([f"item {item_id}" for item_id in item_ids]),
+        }
+    )
+
+
+@dg.asset(partitions_def=hourly)
+def prices(context: dg.AssetExecutionContext) -> pd.DataFrame:
+    hour = context.partition_key
+    return price_frame(
+        [1, 2] if hour.endswith("10:00") else [3], hour[:10] + " " + hour[11:]
+    )
+
+
+@dg.asset(ins={"prices": dg.AssetIn(metadata={"columns": ["item_id", "name"]})})
+def names(prices: pd.DataFrame) -> pd.DataFrame:
+    return prices
+
+
+def test_round_trip_keeps_dtypes(tmp_path):
+    io_manager = ArrowIOManager(base_dir=str(tmp_path))
+    df = price_frame([3, 1, 2], "2025-01-01 10:00")
+
+    io_manager.handle_output(dg.build_output_context(asset_key="prices"), df)
+    loaded = io_manager.load_input(dg.build_input_context(asset_key="prices"))
+
+    pd.testing.assert_frame_equal(loaded, df)
+    assert isinstance(loaded["name"].dtype, pd.CategoricalDtype)
+
+
+def test_loads_partitions_concatenated_and_selects_columns(tmp_path):
+    resources = {"io_manager": ArrowIOManager(base_dir=str(tmp_path))}
+    for partition_key in ["2025-01-01-10:00", "2025-01-01-11:00"]:
+        assert dg.materialize(
+            [prices], partition_key=partition_key, resources=resources
+        ).success
+
+    loaded = ArrowIOManager(base_dir=str(tmp_path)).load_input(
+        dg.build_input_context(
+            asset_key="prices",
+            asset_partitions_def=hourly,
+            asset_partition_key_range=dg.PartitionKeyRange(
+                "2025-01-01-10:00", "2025-01-01-11:00"
+            ),
+        )
+    )
+    expected = pd.concat(
+        [price_frame([1, 2], "2025-01-01 10:00"), price_frame([3], "2025-01-01 11:00")],
+        ignore_index=True,
+    )
+    # The partitions' categories differ, they're unified instead of falling back to strings
+    expected["name"] = pd.Categorical(expected["name"])
+    pd.testing.assert_frame_equal(loaded, expected)
+
+    # The downstream asset only asked for two of the columns, of both partitions
+    result = dg.materialize(
+        [prices.to_source_asset(), names], resources=resources, selection=[names]
+    )
+    assert result.success
+    assert list(result.output_for_node("names").columns) == ["item_id", "name"]
+    assert result.output_for_node("names")["item_id"].tolist() == [1, 2, 3]
+
+
+def test_none_and_empty_outputs(tmp_path):
+    io_manager = ArrowIOManager(base_dir=str(tmp_path))
+
+    # Assets without a DataFrame to hand over store nothing
+    io_manager.handle_output(dg.build_output_context(asset_key="dashboard"), None)
+    assert list(tmp_path.iterdir()) == []
+
+    empty = price_frame([], "2025-01-01 10:00")
+    io_manager.handle_output(dg.build_output_context(asset_key="prices"), empty)
+    loaded = io_manager.load_input(dg.build_input_context(asset_key="prices"))
+    assert len(loaded) == 0
+    assert loaded.dtypes.to_dict() == empty.dtypes.to_dict()
@@ -0,0 +1,105 @@
+import dagster as dg
+import logging
+import os
+from marketcrawler.metrics import LATENCY_BUCKETS, LatencyHistogram, RunMetrics
+
+
+class FakeContext:
+    asset_key = dg.AssetKey(["recent_price_data"])
+    log = logging.getLogger("test_metrics")
+
+    def __init__(self):
+        self.events = []
+
+    def log_event(self, event) -> None:
+        self.events.append(event)
+
+
+def histogram(*values: float) -> LatencyHistogram:
+    latency = LatencyHistogram()
+    for seconds in values:
+        latency.observe(seconds)
+    return latency
+
+
+def test_buckets_are_cumulative_and_end_with_inf():
+    buckets = histogram(0.001, 0.01, 0.02, 0.3, 0.3, 60.0).buckets()
+
+    assert [le for le, _ in buckets] == [f"{le:g}" for le in LATENCY_BUCKETS] + ["+Inf"]
+    counts = dict(buckets)
+    # A value on a bound counts towards that bucket
+    assert counts["0.005"] == 1
+    assert counts["0.01"] == 2
+    assert counts["0.025"] == 3
+    assert counts["0.5"] == 5
+    assert counts["30"] == 5
+    assert counts["+Inf"] == 6
+    assert all(
+        count <= following for (_, count), (_, following) in zip(buckets, buckets[1:])
+    )
+
+
+def test_empty_histogram():
+    assert histogram().buckets()[-1] == ("+Inf", 0)
+    assert histogram().quantile(0.5) == 0.0
+
+
+def test_openmetrics_text():
+    metrics = RunMetrics(FakeContext())
+    metrics.add_phase("crawl", 2.5)
+    for seconds in [0.1, 0.2, 0.3]:
+        metrics.api_latency.observe(seconds)
+
+    lines = metrics.to_openmetrics().splitlines()
+
+    labels = 'asset="recent_price_data"'
+    assert f'marketcrawler_phase_seconds{{{labels},phase="crawl"}} 2.5' in lines
+    values = {
+        line.split(" ")[0]: float(line.split(" ")[1])
+        for line in lines
+        if line.startswith("marketcrawler_api_request_seconds_")
+    }
+    assert values[f"marketcrawler_api_request_seconds_count{{{labels}}}"] == 3
+    assert values[f"marketcrawler_api_request_seconds_sum{{{labels}}}"] == (
+        metrics.api_latency.sum
+    )
+    assert lines[-1] == "# EOF"
+    # Every metric is announced before its samples
+    assert lines.index("# TYPE marketcrawler_api_request_seconds summary") < min(
+        number
+        for number, line in enumerate(lines)
+        if line.startswith("marketcrawler_api_request_seconds")
+    )
+
+
+def test_merge_adds_up_shards():
+    metrics = RunMetrics(FakeContext())
+    metrics.add_phase("gap_detection", 1.0)
+
+    metrics.merge({"crawl": 2.0, "insert": 0.5}, [0.1, 0.2])
+    metrics.merge({"crawl": 3.0}, [0.4])
+
+    assert metrics.phase_seconds == {"gap_detection": 1.0, "crawl": 5.0, "insert": 0.5}
+    assert sorted(metrics.api_latency.values) == [0.1, 0.2, 0.4]
+    # The shards logged their phases already
+    assert len(metrics.context.events) == 1
+    assert metrics.metadata()["api_requests"] == dg.MetadataValue.int(3)
+
+
+def test_export_writes_the_file(tmp_path):
+    metrics = RunMetrics(FakeContext())
+    metrics.add_phase("crawl", 1.0)
+
+    metrics.export(str(tmp_path))
+
+    assert os.listdir(tmp_path) == ["marketcrawler_recent_price_data.prom"]
+    text = (tmp_path / "marketcrawler_recent_price_data.prom").read_text()
+
+    def without_timestamp(text: str) -> list[str]:
+        return [
+            line
+            for line in text.splitlines()
+            if not line.startswith("marketcrawler_last_materialization_timestamp")
+        ]
+
+    assert without_timestamp(text) == without_timestamp(metrics.to_openmetrics())
@@ -0,0 +1,26 @@
+from datetime import datetime, timezone
+from marketcrawler.notifications import epoch_hour_to_datetime, hours_of_notifications
+
+HOUR = int(datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp()) // 3600
+
+
+def test_hours_of_notifications():
+    hours, max_entry_id, lookups = hours_of_notifications(
+        [
+            {"hours": [HOUR, HOUR + 5], "first_entry_id": 1, "entry_id": 4},
+            # Sent by the trigger of older schemas
+            {"first_hour": HOUR + 10, "last_hour": HOUR + 11, "entry_id": 6},
+            # Too many hours to be sent
+            {"first_entry_id": 7, "entry_id": 9000},
+        ]
+    )
+
+    assert hours == {
+        epoch_hour_to_datetime(hour) for hour in [HOUR, HOUR + 5, HOUR + 10, HOUR + 11]
+    }
+    assert max_entry_id == 9000
+    assert lookups == [(7, 9000)]
+
+
+def test_no_notifications():
+    assert hours_of_notifications([]) == (set(), 0, [])
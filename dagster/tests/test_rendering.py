@@ -0,0 +1,140 @@
+import gzip
+import numpy as np
+import os
+import pandas as pd
+import plotly
+import plotly.graph_objects as go
+from marketcrawler.rendering import (
+    build_dashboard,
+    downsample,
+    min_max_indices,
+    prune_dashboards,
+    publish_dashboard,
+)
+
+
+def test_short_series_are_kept_whole():
+    values = np.array([3.0, 1.0, 2.0, 5.0])
+    assert min_max_indices(values, 2).tolist() == [0, 1, 2, 3]
+    assert min_max_indices(values, 0).tolist() == [0, 1, 2, 3]
+
+
+def test_keeps_minimum_and_maximum_of_every_bucket():
+    rng = np.random.default_rng(0)
+    values = rng.random(1000)
+    values[437] = 10.0
+    values[612] = -10.0
+
+    positions = min_max_indices(values, 10)
+
+    assert np.all(np.diff(positions) > 0)
+    assert positions[0] == 0 and positions[-1] == 999
+    assert {437, 612} <= set(positions.tolist())
+    for bucket in np.array_split(np.arange(1000), 10):
+        assert bucket[np.argmin(values[bucket])] in positions
+        assert bucket[np.argmax(values[bucket])] in positions
+    # Two per bucket, plus the first and last point
+    assert len(positions) <= 2 * 10 + 2
+
+
+def test_downsample_keeps_timestamps_and_values_together():
+    timestamps = np.arange(500)
+    values = np.sin(timestamps / 10.0)
+
+    ds_timestamps, ds_values = downsample(timestamps, values, max_points=40)
+
+    assert len(ds_timestamps) <= 42
+    assert np.array_equal(values[ds_timestamps], ds_values)
+
+
+def test_build_dashboard_downsamples_every_item():
+    timestamps = pd.date_range("2025-01-01", periods=1000, freq="h", tz="UTC")
+    df = pd.DataFrame(
+        {
+            "name": pd.Categorical(["b"] * 1000 + ["a"] * 1000),
+            "timestamp": timestamps.append(timestamps),
+            "price": np.arange(2000, dtype=np.float32),
+            "volume": np.arange(2000, dtype=np.int32),
+        }
+    ).sample(frac=1, random_state=0)
+
+    fig, stats = build_dashboard(
+        df, ["a", "b", "c"], max_points=200, min_points_per_series=10
+    )
+
+    assert stats["num_records"] == 2000
+    assert stats["rendered_points"] <= 3 * (200 // 3 + 2)
+    assert not stats["webgl"]
+    # Price and volume trace per item, items without data too
+    assert [trace.name for trace in fig.data] == ["a", "a", "b", "b", "c", "c"]
+    # Sorted by time again, despite the shuffled input
+    assert np.all(np.diff(fig.data[0].x.astype("int64")) > 0)
+
+
+def publish(directory, name: str, keep_last: int = 50) -> dict:
+    return publish_dashboard(
+        go.Figure(go.Scatter(x=[1, 2], y=[3, 4])), str(directory), name, keep_last
+    )
+
+
+def test_plotly_bundle_is_written_once(tmp_path, monkeypatch):
+    calls = []
+    get_plotlyjs = plotly.offline.get_plotlyjs
+    monkeypatch.setattr(
+        plotly.offline,
+        "get_plotlyjs",
+        lambda: calls.append(1) or get_plotlyjs(),
+    )
+
+    publish(tmp_path, "dashboard_1.html")
+    publish(tmp_path, "dashboard_2.html")
+
+    assert len(calls) == 1
+    bundles = [path.name for path in tmp_path.glob("plotly-*.min.js.gz")]
+    assert bundles == [f"plotly-{plotly.offline.get_plotlyjs_version()}.min.js.gz"]
+    with gzip.open(tmp_path / "dashboard_2.html.gz", "rt") as f:
+        assert bundles[0][: -len(".gz")] in f.read()
+
+
+def test_prune_keeps_the_newest_and_latest(tmp_path):
+    for number in range(5):
+        path = tmp_path / f"dashboard_{number}.html.gz"
+        path.write_bytes(b"")
+        os.utime(path, (1000 + number, 1000 + number))
+    # Published last by a run that started before the others
+    os.symlink("dashboard_0.html.gz", tmp_path / "latest.html.gz")
+
+    assert prune_dashboards(str(tmp_path), keep_last=2) == 2
+
+    assert sorted(path.name for path in tmp_path.glob("dashboard_*")) == [
+        "dashboard_0.html.gz",
+        "dashboard_3.html.gz",
+        "dashboard_4.html.gz",
+    ]
+
+
+def test_publish_swaps_latest_atomically(tmp_path, monkeypatch):
+    publish(tmp_path, "dashboard_1.html")
+    latest = tmp_path / "latest.html.gz"
+    replace = os.replace
+    seen = []
+
+    def checking_replace(src, dst):
+        if str(dst) == str(latest):
+            # The new link is complete before it takes the old one's place
+            seen.append((os.readlink(latest), os.readlink(src)))
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", checking_replace)
+    stats = publish(tmp_path, "dashboard_2.html", keep_last=1)
+
+    assert seen == [("dashboard_1.html.gz", "dashboard_2.html.gz")]
+    assert os.readlink(latest) == "dashboard_2.html.gz"
+    assert stats["pruned_dashboards"] == 1
+    # No temporary files are left behind
+    assert sorted(
+        path.name for path in tmp_path.iterdir() if "plotly" not in path.name
+    ) == [
+        "dashboard_2.html.gz",
+        "latest.html.gz",
+    ]
@@ -0,0 +1,41 @@
+import dagster as dg
+import marketcrawler.ledger
+from datetime import datetime, timedelta, timezone
+from marketcrawler.resources import DatabaseResource
+from marketcrawler.sensors import crawl_retry_sensor
+
+HOUR = datetime(2025, 6, 1, 10, tzinfo=timezone.utc)
+
+
+def evaluate_retry_sensor(monkeypatch, due_hours):
+    monkeypatch.setattr(
+        marketcrawler.ledger, "read_due_hours", lambda database, limit: due_hours
+    )
+    context = dg.build_sensor_context(
+        resources={
+            "database": DatabaseResource(
+                host="", port=0, user="", password="", database=""
+            )
+        }
+    )
+    return crawl_retry_sensor(context)
+
+
+def test_retry_sensor_requests_due_hours(monkeypatch):
+    next_attempt = HOUR + timedelta(hours=3)
+    result = evaluate_retry_sensor(
+        monkeypatch,
+        [
+            (HOUR, next_attempt),
+            # Before the first partition
+            (datetime(2020, 1, 1, tzinfo=timezone.utc), next_attempt),
+        ],
+    )
+
+    assert [(request.partition_key, request.run_key) for request in result] == [
+        ("2025-06-01-10:00", f"retry:2025-06-01-10:00:{next_attempt.isoformat()}")
+    ]
+
+
+def test_retry_sensor_skips_without_due_hours(monkeypatch):
+    assert isinstance(evaluate_retry_sensor(monkeypatch, []), dg.SkipReason)
@@ -0,0 +1,135 @@
+import pytest
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from marketcrawler import writer as writer_module
+from marketcrawler.writer import ChunkedWriter
+
+
+class FakeConnection:
+    def __init__(self, database: "FakeDatabase"):
+        self.database = database
+
+    def commit(self) -> None:
+        self.database.commits.append(
+            (list(self.database.pending_rows), list(self.database.pending_failures))
+        )
+        self.database.pending_rows.clear()
+        self.database.pending_failures.clear()
+
+
+class FakeDatabase:
+    """Keeps what the writer commits, and skips rows whose key it has seen already."""
+
+    def __init__(self, fail_on_commit: int | None = None):
+        self.keys = set()
+        self.pending_rows = []
+        self.pending_failures = []
+        self.commits = []
+        self.fail_on_commit = fail_on_commit
+
+    @contextmanager
+    def get_connection(self):
+        yield FakeConnection(self)
+
+    def upsert_rows(self, conn, table, columns, rows, key_columns) -> int:
+        if self.fail_on_commit == len(self.commits):
+            raise RuntimeError("database is gone")
+        inserted = 0
+        for row in rows:
+            if (row[0], row[3]) not in self.keys:
+                self.keys.add((row[0], row[3]))
+                self.pending_rows.append(row)
+                inserted += 1
+        return inserted
+
+
+@pytest.fixture(autouse=True)
+def no_sql(monkeypatch):
+    partitions = []
+    monkeypatch.setattr(
+        writer_module,
+        "ensure_partitions",
+        lambda conn, months: partitions.append(sorted(months)),
+    )
+    monkeypatch.setattr(
+        writer_module,
+        "record_failures",
+        lambda conn, failures, *args: conn.database.pending_failures.extend(failures),
+    )
+    return partitions
+
+
+def entry(item_id: int, month: int = 1) -> dict:
+    return {
+        "item_id": item_id,
+        "volume": 1,
+        "price": 2.0,
+        "timestamp": datetime(2025, month, 1, tzinfo=timezone.utc),
+    }
+
+
+def make_writer(database, chunk_size=3, flush_seconds=60.0) -> ChunkedWriter:
+    return ChunkedWriter(
+        database,
+        chunk_size=chunk_size,
+        flush_seconds=flush_seconds,
+        retry_backoff=1.0,
+        retry_backoff_max=10.0,
+    )
+
+
+def test_commits_full_chunks_and_the_rest_on_exit():
+    database = FakeDatabase()
+    with make_writer(database) as writer:
+        for item_id in range(7):
+            writer.write(entry(item_id))
+
+    assert [len(rows) for rows, _ in database.commits] == [3, 3, 1]
+    assert writer.inserted_rows == 7
+    assert writer.committed_chunks == 3
+
+
+def test_failures_are_committed_with_the_rows():
+    database = FakeDatabase()
+    dt = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    with make_writer(database) as writer:
+        writer.write(entry(1))
+        writer.fail(2, dt, "timeout")
+
+    assert database.commits == [([(1, 1, 2.0, dt)], [(2, dt, "timeout")])]
+    assert writer.recorded_failures == 1
+
+
+def test_commits_after_flush_seconds_without_a_full_chunk():
+    database = FakeDatabase()
+    with make_writer(database, chunk_size=100, flush_seconds=0.05) as writer:
+        writer.write(entry(1))
+        deadline = time.monotonic() + 5
+        while not database.commits and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(database.commits) == 1
+        writer.write(entry(2))
+
+    assert [len(rows) for rows, _ in database.commits] == [1, 1]
+
+
+def test_counts_duplicates_and_creates_each_partition_once(no_sql):
+    database = FakeDatabase()
+    with make_writer(database, chunk_size=2) as writer:
+        for item_id, month in [(1, 1), (1, 1), (2, 2), (3, 1), (4, 2)]:
+            writer.write(entry(item_id, month))
+
+    assert writer.inserted_rows == 4
+    assert writer.duplicate_rows == 1
+    assert no_sql == [[date(2025, 1, 1)], [date(2025, 2, 1)]]
+
+
+def test_raises_the_writers_error_and_keeps_earlier_chunks():
+    database = FakeDatabase(fail_on_commit=1)
+    with pytest.raises(RuntimeError, match="database is gone"):
+        with make_writer(database, chunk_size=1) as writer:
+            for item_id in range(50):
+                writer.write(entry(item_id))
+
+    assert [len(rows) for rows, _ in database.commits] == [1]
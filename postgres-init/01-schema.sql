@@ -4,10 +4,97 @@ CREATE TABLE items (
     type VARCHAR(64) NOT NULL
 );
 
+-- Partitioned by month of the timestamp. The crawler creates the partitions it needs (price_data_YYYY_MM),
+-- and retention drops whole partitions. Every (item_id, timestamp) exists once, the crawler skips duplicates.
 CREATE TABLE price_data(
-    entry_id SERIAL PRIMARY KEY,
-    item_id SERIAL NOT NULL,
+    -- Increases with every insert, the price cache uses it as high-water mark
+    entry_id BIGSERIAL NOT NULL,
+    item_id INTEGER NOT NULL,
     volume INTEGER NOT NULL,
     price REAL NOT NULL,
-    timestamp TIMESTAMP WITH TIME ZONE
-);
\ No newline at end of file
+    timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+    -- Also serves per-item lookups of a time range
+    PRIMARY KEY (item_id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+-- Serves the time window reads of the pipeline. Rows arrive roughly in time order, so a BRIN index is
+-- a fraction of the size of a B-tree and almost as selective.
+CREATE INDEX price_data_timestamp_idx ON price_data USING BRIN (timestamp);
+-- Serves the incremental reads of the price cache
+CREATE INDEX price_data_entry_id_idx ON price_data (entry_id);
+
+-- Tells listeners (the new_price_data_sensor) which hours received rows, once per insert statement. Delivered on
+-- commit, as JSON with the distinct hours (in hours since the unix epoch) and the lowest and highest entry_id
+-- inserted. Payloads are limited to 8000 bytes, so statements that span too many hours leave the hours out, and
+-- listeners look them up by the entry_ids.
+CREATE FUNCTION notify_price_data() RETURNS trigger AS $$
+DECLARE
+    payload TEXT;
+BEGIN
+    SELECT json_build_object(
+        'hours', array_agg(DISTINCT floor(extract(epoch FROM timestamp) / 3600)::bigint),
+        'first_entry_id', min(entry_id),
+        'entry_id', max(entry_id)
+    )::text
+    INTO payload
+    FROM new_rows
+    HAVING count(*) > 0;
+    IF octet_length(payload) >= 8000 THEN
+        SELECT json_build_object('first_entry_id', min(entry_id), 'entry_id', max(entry_id))::text
+        INTO payload
+        FROM new_rows;
+    END IF;
+    IF payload IS NOT NULL THEN
+        PERFORM pg_notify('price_data_inserted', payload);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER price_data_notify
+    AFTER INSERT ON price_data
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_price_data();
+
+-- Failed crawl attempts per item and hour, so that known-bad combinations are retried on a backoff
+-- schedule instead of in every run. Rows are removed once the price data exists.
+CREATE TABLE crawl_ledger(
+    item_id INTEGER NOT NULL,
+    timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+    attempts INTEGER NOT NULL,
+    last_attempt TIMESTAMP WITH TIME ZONE NOT NULL,
+    next_attempt TIMESTAMP WITH TIME ZONE NOT NULL,
+    last_error TEXT,
+    PRIMARY KEY (item_id, timestamp)
+);
+
+-- Per item aggregates of price_data, maintained by the price_rollups asset
+CREATE TABLE price_rollup_hourly(
+    item_id INTEGER NOT NULL,
+    hour TIMESTAMP WITH TIME ZONE NOT NULL,
+    num_points INTEGER NOT NULL,
+    volume BIGINT NOT NULL,
+    -- Volume weighted average price, NULL if nothing was traded
+    vwap DOUBLE PRECISION,
+    min_price REAL NOT NULL,
+    max_price REAL NOT NULL,
+    mean_price DOUBLE PRECISION NOT NULL,
+    -- Standard deviation of the hourly log returns of the vwap, ln(vwap / previous hour's vwap), over the last
+    -- 24 hours (this one included)
+    volatility_24h DOUBLE PRECISION,
+    PRIMARY KEY (item_id, hour)
+);
+
+CREATE TABLE price_rollup_daily(
+    item_id INTEGER NOT NULL,
+    day DATE NOT NULL,
+    num_points INTEGER NOT NULL,
+    volume BIGINT NOT NULL,
+    vwap DOUBLE PRECISION,
+    min_price REAL NOT NULL,
+    max_price REAL NOT NULL,
+    mean_price DOUBLE PRECISION NOT NULL,
+    -- Standard deviation of the hourly log returns of the vwap within the day
+    volatility DOUBLE PRECISION,
+    PRIMARY KEY (item_id, day)
+);
@@ -0,0 +1,144 @@
+-- Moves an existing, unpartitioned price_data table to the monthly partitioned one of postgres-init/01-schema.sql,
+-- and creates the tables and the trigger that were added to the schema since. postgres-init only runs on an empty
+-- database, so run this once on databases created before:
+--
+--   docker compose exec -T db sh -c 'psql -v ON_ERROR_STOP=1 -U "$POSTGRES_USER" -d "$POSTGRES_DB"' < postgres-migrations/01-partition-price-data.sql
+--
+-- Runs in a single transaction and does nothing if price_data is partitioned already. Rows keep their entry_id,
+-- so the price cache stays valid. Of several rows of the same item and hour, the first inserted one is kept, and
+-- rows without a timestamp are left behind. The old table is kept as price_data_unpartitioned, drop it once you
+-- checked the migrated data.
+
+BEGIN;
+
+DO $$
+DECLARE
+    month DATE;
+BEGIN
+    IF EXISTS (SELECT FROM pg_partitioned_table WHERE partrelid = 'price_data'::regclass) THEN
+        RAISE NOTICE 'price_data is partitioned already, nothing to migrate';
+        RETURN;
+    END IF;
+
+    -- Keeps writers out until the migration is committed
+    LOCK TABLE price_data IN ACCESS EXCLUSIVE MODE;
+
+    -- Frees the names for the new table. Index names are unique per schema, so they move along.
+    ALTER TABLE price_data RENAME TO price_data_unpartitioned;
+    ALTER INDEX IF EXISTS price_data_pkey RENAME TO price_data_unpartitioned_pkey;
+    ALTER INDEX IF EXISTS price_data_timestamp_idx RENAME TO price_data_unpartitioned_timestamp_idx;
+    ALTER INDEX IF EXISTS price_data_item_id_timestamp_idx RENAME TO price_data_unpartitioned_item_id_timestamp_idx;
+    DROP TRIGGER IF EXISTS price_data_notify ON price_data_unpartitioned;
+
+    CREATE TABLE price_data(
+        -- Continues the old sequence, see below
+        entry_id BIGINT NOT NULL DEFAULT nextval('price_data_entry_id_seq'),
+        item_id INTEGER NOT NULL,
+        volume INTEGER NOT NULL,
+        price REAL NOT NULL,
+        timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+        PRIMARY KEY (item_id, timestamp)
+    ) PARTITION BY RANGE (timestamp);
+
+    -- The sequence would be dropped with the old table otherwise
+    ALTER SEQUENCE price_data_entry_id_seq AS BIGINT OWNED BY price_data.entry_id;
+
+    -- Named like the ones the crawler creates (marketcrawler/price_partitions.py)
+    FOR month IN
+        SELECT DISTINCT date_trunc('month', timestamp AT TIME ZONE 'UTC')::date
+        FROM price_data_unpartitioned
+        WHERE timestamp IS NOT NULL
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF price_data FOR VALUES FROM (%L) TO (%L)',
+            'price_data_' || to_char(month, 'YYYY_MM'),
+            month::timestamp AT TIME ZONE 'UTC',
+            (month + interval '1 month') AT TIME ZONE 'UTC'
+        );
+    END LOOP;
+
+    INSERT INTO price_data (entry_id, item_id, volume, price, timestamp)
+    SELECT DISTINCT ON (item_id, timestamp) entry_id, item_id, volume, price, timestamp
+    FROM price_data_unpartitioned
+    WHERE timestamp IS NOT NULL
+    ORDER BY item_id, timestamp, entry_id;
+
+    -- Created after the copy, it is cheaper than maintaining them row by row
+    CREATE INDEX price_data_timestamp_idx ON price_data USING BRIN (timestamp);
+    CREATE INDEX price_data_entry_id_idx ON price_data (entry_id);
+
+    RAISE NOTICE 'Copied % rows into % partitions',
+        (SELECT count(*) FROM price_data),
+        (SELECT count(*) FROM pg_inherits WHERE inhparent = 'price_data'::regclass);
+END;
+$$;
+
+-- From here on, everything is the same as in postgres-init/01-schema.sql
+
+CREATE OR REPLACE FUNCTION notify_price_data() RETURNS trigger AS $$
+DECLARE
+    payload TEXT;
+BEGIN
+    SELECT json_build_object(
+        'hours', array_agg(DISTINCT floor(extract(epoch FROM timestamp) / 3600)::bigint),
+        'first_entry_id', min(entry_id),
+        'entry_id', max(entry_id)
+    )::text
+    INTO payload
+    FROM new_rows
+    HAVING count(*) > 0;
+    IF octet_length(payload) >= 8000 THEN
+        SELECT json_build_object('first_entry_id', min(entry_id), 'entry_id', max(entry_id))::text
+        INTO payload
+        FROM new_rows;
+    END IF;
+    IF payload IS NOT NULL THEN
+        PERFORM pg_notify('price_data_inserted', payload);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS price_data_notify ON price_data;
+CREATE TRIGGER price_data_notify
+    AFTER INSERT ON price_data
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_price_data();
+
+CREATE TABLE IF NOT EXISTS crawl_ledger(
+    item_id INTEGER NOT NULL,
+    timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+    attempts INTEGER NOT NULL,
+    last_attempt TIMESTAMP WITH TIME ZONE NOT NULL,
+    next_attempt TIMESTAMP WITH TIME ZONE NOT NULL,
+    last_error TEXT,
+    PRIMARY KEY (item_id, timestamp)
+);
+
+CREATE TABLE IF NOT EXISTS price_rollup_hourly(
+    item_id INTEGER NOT NULL,
+    hour TIMESTAMP WITH TIME ZONE NOT NULL,
+    num_points INTEGER NOT NULL,
+    volume BIGINT NOT NULL,
+    vwap DOUBLE PRECISION,
+    min_price REAL NOT NULL,
+    max_price REAL NOT NULL,
+    mean_price DOUBLE PRECISION NOT NULL,
+    volatility_24h DOUBLE PRECISION,
+    PRIMARY KEY (item_id, hour)
+);
+
+CREATE TABLE IF NOT EXISTS price_rollup_daily(
+    item_id INTEGER NOT NULL,
+    day DATE NOT NULL,
+    num_points INTEGER NOT NULL,
+    volume BIGINT NOT NULL,
+    vwap DOUBLE PRECISION,
+    min_price REAL NOT NULL,
+    max_price REAL NOT NULL,
+    mean_price DOUBLE PRECISION NOT NULL,
+    volatility DOUBLE PRECISION,
+    PRIMARY KEY (item_id, day)
+);
+
+COMMIT;
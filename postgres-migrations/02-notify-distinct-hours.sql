@@ -0,0 +1,27 @@
+-- Makes the insert trigger of price_data send the distinct hours that received rows, instead of the first and the
+-- last one. 01-partition-price-data.sql installs this function as well, this is only needed for databases that ran
+-- an earlier version of it. Running it again does no harm.
+
+CREATE OR REPLACE FUNCTION notify_price_data() RETURNS trigger AS $$
+DECLARE
+    payload TEXT;
+BEGIN
+    SELECT json_build_object(
+        'hours', array_agg(DISTINCT floor(extract(epoch FROM timestamp) / 3600)::bigint),
+        'first_entry_id', min(entry_id),
+        'entry_id', max(entry_id)
+    )::text
+    INTO payload
+    FROM new_rows
+    HAVING count(*) > 0;
+    IF octet_length(payload) >= 8000 THEN
+        SELECT json_build_object('first_entry_id', min(entry_id), 'entry_id', max(entry_id))::text
+        INTO payload
+        FROM new_rows;
+    END IF;
+    IF payload IS NOT NULL THEN
+        PERFORM pg_notify('price_data_inserted', payload);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
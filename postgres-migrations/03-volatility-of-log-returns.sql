@@ -0,0 +1,53 @@
+-- Recomputes the volatility of all rollups as the standard deviation of the hourly log returns of the vwap,
+-- ln(vwap / previous hour's vwap), like the price_rollups asset does now. Before, it was the standard deviation
+-- of the vwap itself. Run it after 01-partition-price-data.sql, like that one. Running it again does no harm.
+
+BEGIN;
+
+-- Same lock as the price_rollups asset, so no run updates the rollups meanwhile
+SELECT pg_advisory_xact_lock(727001);
+
+UPDATE price_rollup_hourly SET volatility_24h = rolling.volatility
+FROM (
+    SELECT
+        item_id,
+        hour,
+        stddev_samp(log_return) OVER (
+            PARTITION BY item_id ORDER BY hour
+            RANGE BETWEEN interval '23 hours' PRECEDING AND CURRENT ROW
+        ) AS volatility
+    FROM (
+        SELECT
+            item_id,
+            hour,
+            CASE
+                WHEN lag(hour) OVER w = hour - interval '1 hour' AND lag(vwap) OVER w > 0 AND vwap > 0
+                THEN ln(vwap / lag(vwap) OVER w)
+            END AS log_return
+        FROM price_rollup_hourly
+        WINDOW w AS (PARTITION BY item_id ORDER BY hour)
+    ) AS returns
+) AS rolling
+WHERE price_rollup_hourly.item_id = rolling.item_id
+AND price_rollup_hourly.hour = rolling.hour;
+
+UPDATE price_rollup_daily SET volatility = daily.volatility
+FROM (
+    SELECT item_id, (hour AT TIME ZONE 'UTC')::date AS day, stddev_samp(log_return) AS volatility
+    FROM (
+        SELECT
+            item_id,
+            hour,
+            CASE
+                WHEN lag(hour) OVER w = hour - interval '1 hour' AND lag(vwap) OVER w > 0 AND vwap > 0
+                THEN ln(vwap / lag(vwap) OVER w)
+            END AS log_return
+        FROM price_rollup_hourly
+        WINDOW w AS (PARTITION BY item_id ORDER BY hour)
+    ) AS returns
+    GROUP BY item_id, (hour AT TIME ZONE 'UTC')::date
+) AS daily
+WHERE price_rollup_daily.item_id = daily.item_id
+AND price_rollup_daily.day = daily.day;
+
+COMMIT;
@@ -1,8 +1,12 @@
-from fastapi import FastAPI
-from datetime import datetime, time
-import random
+from collections import OrderedDict
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from datetime import datetime, time, timedelta, timezone
+from typing import Iterator, Optional
 import uvicorn
 import numpy as np
+import os
 
 app = FastAPI(title="Market Item Price API", version="1.0.0")
 
@@ -39,8 +43,27 @@ ITEM_CONFIG = {
 BASE_PIZZA_PRICE = 15
 PACKAGE_PRICE = 3
 
+# Upper bound for the number of entries in a single batch request
+MAX_BATCH_SIZE = 1000
+# Upper bound for the number of hours in a single range request
+MAX_RANGE_HOURS = 366 * 24
+# Number of hours computed at once while streaming a range
+RANGE_CHUNK_HOURS = 7 * 24
+RANGE_LINE_FORMAT = (
+    '{"item_id": %d, "time": "%s", "price": %r, "volume": %d, "success": true}\n'
+)
 
-def get_time(dt) -> tuple[str, int, str]:
+
+class PriceQuery(BaseModel):
+    item_id: int
+    time: datetime
+
+
+class BatchPriceRequest(BaseModel):
+    entries: list[PriceQuery]
+
+
+def get_time(dt) -> tuple[str, int]:
 
     current_time = "night"
     weekday = dt.weekday()
@@ -48,8 +71,7 @@ def get_time(dt) -> tuple[str, int, str]:
         if is_time_in_range(config["start"], config["end"], dt.time()):
             current_time = time
             break
-    seed = dt.strftime(f"%j %H")
-    return current_time, weekday, seed
+    return current_time, weekday
 
 
 def is_time_in_range(start_time: time, end_time: time, current_time: time):
@@ -72,7 +94,7 @@ def get_pizza_lam(current_time: str, weekday: int) -> int:
     return lam
 
 
-def get_icecream_data(current_time: str, weekday: int) -> tuple[int, float]:
+def get_icecream_data(current_time: str, weekday: int) -> tuple[float, float, float]:
     # our icecream seller is fair and does not change his prices
     price = 7
     if current_time == "lunch":
@@ -87,11 +109,12 @@ def get_icecream_data(current_time: str, weekday: int) -> tuple[int, float]:
     if weekday >= 5:
         # more icecream on weekdays
         lam += 2
-    volume = np.random.poisson(lam=lam)
-    return volume, price
+    return lam, price, 0
 
 
-def get_pizza_data(current_time: str, weekday: int, item: str) -> tuple[int, float]:
+def get_pizza_data(
+    current_time: str, weekday: int, item: str
+) -> tuple[float, float, float]:
     # also our pizza seller is fair, and does not adjust his prices that often
     size_factor = 1
     if item == "Large Pizza":
@@ -108,13 +131,12 @@ def get_pizza_data(current_time: str, weekday: int, item: str) -> tuple[int, flo
     if item == "Regular Pizza":
         lam *= 2
 
-    volume = np.random.poisson(lam=lam)
-    return volume, price
+    return lam, price, 0
 
 
 def get_ingredient_data(
     current_time: str, weekday: int, item: str
-) -> tuple[int, float]:
+) -> tuple[float, float, float]:
     ingredient_factor = 1
     if item == "Tomato":
         ingredient_factor = 0.2
@@ -137,25 +159,187 @@ def get_ingredient_data(
         sd_factor = sd_factor * 2
 
     sd = sd_factor * mean
-    price = max(0.1, np.random.normal(loc=mean, scale=sd))
     # People prefer buying pizzas than ingredients
     lam = get_pizza_lam(current_time, weekday) // 3
-    volume = np.random.poisson(lam=lam)
-    return volume, price
+    return lam, mean, sd
 
 
 def get_cardboard_box_data(
     current_time: str,
     weekday: int,
-) -> tuple[int, float]:
+) -> tuple[float, float, float]:
     # People buy cardboard boxes even less than ingredients
     lam = get_pizza_lam(current_time, weekday) // 4
-    volume = np.random.poisson(lam=lam)
     if weekday <= 4:
         # During the week, all the busy people just want to take-away
         # and sadly no one wants to sit in, increasing the price
-        return volume, PACKAGE_PRICE * 1.5
-    return volume, PACKAGE_PRICE
+        return lam, PACKAGE_PRICE * 1.5, 0
+    return lam, PACKAGE_PRICE, 0
+
+
+def get_item_data(
+    current_time: str, weekday: int, item: str, type: str
+) -> tuple[float, float, float]:
+    """Returns the expected volume, the (mean) price and the price's standard deviation of an item.
+    A standard deviation of 0 means the price is fixed."""
+    if current_time == "night":
+        # Shop is closed, nothing is traded
+        return 0, 0, 0
+    if item == "Icecream":
+        return get_icecream_data(current_time, weekday)
+    elif type == "Meal":
+        return get_pizza_data(current_time, weekday, item)
+    elif type == "Ingredient":
+        return get_ingredient_data(current_time, weekday, item)
+    elif type == "Packaging":
+        return get_cardboard_box_data(current_time, weekday)
+
+
+# Everything about a point in time that matters for the simulation is its hour of the week,
+# so the slot and weekday of all 168 hours (Monday 00:00 first) are computed once up front.
+TIME_SLOTS = list(TIME_CONFIGS)
+
+
+def get_hour_of_week_table() -> tuple[np.ndarray, np.ndarray]:
+    slots = np.empty(7 * 24, dtype=np.int64)
+    weekdays = np.empty(7 * 24, dtype=np.int64)
+    for hour_of_week in range(7 * 24):
+        # 2024-01-01 was a Monday
+        current_time, weekday = get_time(
+            datetime(2024, 1, 1 + hour_of_week // 24, hour_of_week % 24)
+        )
+        slots[hour_of_week] = TIME_SLOTS.index(current_time)
+        weekdays[hour_of_week] = weekday
+    return slots, weekdays
+
+
+HOUR_OF_WEEK_SLOT, HOUR_OF_WEEK_WEEKDAY = get_hour_of_week_table()
+
+# Per item and hour of the week: expected volume, price and price standard deviation
+ITEM_IDS = np.array(sorted(int(item_id) for item_id in ITEM_CONFIG))
+ITEM_PARAMETERS = np.array(
+    [
+        [
+            get_item_data(
+                TIME_SLOTS[HOUR_OF_WEEK_SLOT[hour_of_week]],
+                HOUR_OF_WEEK_WEEKDAY[hour_of_week],
+                *ITEM_CONFIG[str(item_id)],
+            )
+            for hour_of_week in range(7 * 24)
+        ]
+        for item_id in ITEM_IDS
+    ],
+    dtype=np.float64,
+)
+
+
+def poisson_cdf(lam: float) -> np.ndarray:
+    """Cumulative distribution of a Poisson distribution, up to where it's indistinguishable from 1."""
+    if lam <= 0:
+        return np.ones(1)
+    k = np.arange(int(lam + 20 * np.sqrt(lam) + 20))
+    pmf = np.exp(k * np.log(lam) - lam - np.cumsum(np.log(np.maximum(k, 1))))
+    return np.cumsum(pmf)
+
+
+POISSON_CDFS = {lam: poisson_cdf(lam) for lam in np.unique(ITEM_PARAMETERS[:, :, 0])}
+
+# Epoch hours start on a Thursday, hours of the week on a Monday
+EPOCH_HOUR_OF_WEEK = 3 * 24
+
+
+def stable_hash(x: np.ndarray) -> np.ndarray:
+    """The splitmix64 mixer. A fast and well distributed hash of 64 bit integers that,
+    unlike Python's hash(), gives the same result in every process."""
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def get_seeds(item_ids: np.ndarray, epoch_hours: np.ndarray) -> np.ndarray:
+    """One seed per (item, hour), the same no matter which process or worker computes it."""
+    return stable_hash(
+        (item_ids.astype(np.uint64) << np.uint64(40)) ^ epoch_hours.astype(np.uint64)
+    )
+
+
+def random_uniform(seeds: np.ndarray, stream: int) -> np.ndarray:
+    """Uniform numbers in (0, 1), the stream-th for every seed. A counter-based generator
+    has no state, so any number of (item, hour) pairs can be drawn for at once."""
+    x = stable_hash(seeds + np.uint64(stream))
+    return ((x >> np.uint64(11)).astype(np.float64) + 0.5) / 2.0**53
+
+
+def simulate(
+    item_ids: np.ndarray,
+    epoch_hours: np.ndarray,
+    lam: np.ndarray,
+    mean: np.ndarray,
+    sd: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Draws volume and price for every (item_ids[i], epoch_hours[i]) from its distribution
+    parameters (see get_item_data). Returns the volumes, prices and seeds."""
+    seeds = get_seeds(item_ids, epoch_hours)
+
+    # Poisson distributed volumes, by inverting the cumulative distribution of each lambda
+    u = random_uniform(seeds, 0)
+    volume = np.zeros(len(u), dtype=np.int64)
+    for value in np.unique(lam):
+        cdf = POISSON_CDFS.get(value)
+        if cdf is None:
+            cdf = poisson_cdf(value)
+        mask = lam == value
+        volume[mask] = np.minimum(
+            np.searchsorted(cdf, u[mask], side="right"), len(cdf) - 1
+        )
+
+    # Normal distributed prices (Box-Muller), where the price is not fixed
+    z = np.sqrt(-2 * np.log(random_uniform(seeds, 1))) * np.cos(
+        2 * np.pi * random_uniform(seeds, 2)
+    )
+    price = np.where(sd > 0, np.maximum(0.1, mean + sd * z), mean)
+    return volume, price, seeds
+
+
+def simulate_range(
+    item_ids: np.ndarray, epoch_hours: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Simulates volume and price for every pair of (item_ids[i], epoch_hours[i]) at once.
+    Epoch hours are the hours since 1970-01-01 00:00 in the shop's wall clock time."""
+    parameters = ITEM_PARAMETERS[
+        np.searchsorted(ITEM_IDS, item_ids),
+        (epoch_hours + EPOCH_HOUR_OF_WEEK) % (7 * 24),
+    ]
+    volume, price, _ = simulate(
+        item_ids, epoch_hours, parameters[:, 0], parameters[:, 1], parameters[:, 2]
+    )
+    return volume, price
+
+
+class LRUCache:
+    """A dict that forgets the least recently used entries once it holds more than maxsize.
+    Only used from the event loop, so it needs no lock."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, value) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+# Computed responses per (item_id, epoch hour, time slot)
+PRICE_CACHE = LRUCache(int(os.getenv("PRICE_CACHE_SIZE", "100000")))
 
 
 @app.get("/")
@@ -168,6 +352,14 @@ async def root():
                 "url": "/price",
                 "description": "Returns the prices for an item. Required parameter: item_id. Optional parameter: time (default: now).",
             },
+            {
+                "url": "/prices",
+                "description": f"POST a JSON body {{'entries': [{{'item_id': ..., 'time': ...}}, ...]}} to get the prices for up to {MAX_BATCH_SIZE} (item_id, time) pairs at once.",
+            },
+            {
+                "url": "/prices/range",
+                "description": f"Streams the prices of every full hour with start <= time < end as JSON lines. Required parameters: start, end (at most {MAX_RANGE_HOURS} hours apart). Optional parameter: item_id (default: all items).",
+            },
             {
                 "url": "/docs",
                 "description": "Auto-generated docs for the API.",
@@ -176,57 +368,178 @@ async def root():
     }
 
 
-@app.get("/price")
-async def get_price(item_id: int, time: datetime = datetime.now()):
-    """Returns price and volume for the specified item at the specified date"""
-    current_time, weekday, seed = get_time(time)
-    item, type = ITEM_CONFIG.get(str(item_id), (None, None))
-    if not item:
-        return {"success": False, "error": f"Item with id {item_id} not found."}
-    seed += "-" + item
-    if current_time == "night":
-        # Shop is closed, nothing is traded
-        return {
-            "price": 0,
-            "volume": 0,
+def get_epoch_hour(dt: datetime) -> int:
+    """Hours since 1970-01-01 00:00 in the wall clock time of dt, rounding down."""
+    return (dt.replace(tzinfo=None) - datetime(1970, 1, 1)) // timedelta(hours=1)
+
+
+def simulate_misses(misses: list[tuple[int, tuple, tuple]]) -> list[dict]:
+    """Simulates the (position, cache key, distribution parameters) misses together."""
+    parameters = np.array([data for _, _, data in misses], dtype=np.float64)
+    volumes, prices, seeds = simulate(
+        np.array([key[0] for _, key, _ in misses]),
+        np.array([key[1] for _, key, _ in misses]),
+        parameters[:, 0],
+        parameters[:, 1],
+        parameters[:, 2],
+    )
+    return [
+        {
+            "price": price,
+            "volume": volume,
             "success": True,
             "seed": seed,
         }
+        for price, volume, seed in zip(
+            prices.tolist(), volumes.tolist(), seeds.tolist()
+        )
+    ]
+
+
+def simulate_prices(entries: list[tuple[int, datetime]]) -> list[dict]:
+    """Simulates price and volume for every (item_id, time) pair. Cached pairs are answered
+    from memory, all others are simulated together. Pairs that fail get their own error.
+    """
+    results = [None] * len(entries)
+    misses = []
+    for i, (item_id, time) in enumerate(entries):
+        item, type = ITEM_CONFIG.get(str(item_id), (None, None))
+        if not item:
+            results[i] = {
+                "success": False,
+                "error": f"Item with id {item_id} not found.",
+            }
+            continue
+        try:
+            current_time, weekday = get_time(time)
+            key = (item_id, get_epoch_hour(time), current_time)
+            results[i] = PRICE_CACHE.get(key)
+            if results[i] is None:
+                misses.append(
+                    (i, key, get_item_data(current_time, weekday, item, type))
+                )
+        except Exception as e:
+            results[i] = {"success": False, "error": str(e)}
+
+    if misses:
+        try:
+            simulated = simulate_misses(misses)
+        except Exception:
+            # Simulate them one by one instead, so only the failing ones report an error
+            simulated = []
+            for miss in misses:
+                try:
+                    simulated += simulate_misses([miss])
+                except Exception as e:
+                    simulated.append({"success": False, "error": str(e)})
+        for (i, key, _), result in zip(misses, simulated):
+            results[i] = result
+            if result["success"]:
+                PRICE_CACHE.put(key, result)
+    return results
+
+
+def simulate_price(item_id: int, time: datetime) -> dict:
+    """Simulates price and volume for the specified item at the specified date"""
+    return simulate_prices([(item_id, time)])[0]
 
-    seed = abs(hash(seed)) % (2**32)
-    random.seed(seed)
-    np.random.seed(seed)
-    print(f"Item: {item}, Type: {type}, Seed: {seed}")
-    if item == "Icecream":
-        volume, price = get_icecream_data(
-            current_time,
-            weekday,
+
+@app.get("/price")
+async def get_price(item_id: int, time: datetime = datetime.now()):
+    """Returns price and volume for the specified item at the specified date"""
+    return simulate_price(item_id, time)
+
+
+@app.post("/prices")
+async def get_prices(request: BatchPriceRequest):
+    """Returns price and volume for every (item_id, time) pair in the request.
+    Entries that fail report their own error, the others are still returned."""
+    if len(request.entries) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {MAX_BATCH_SIZE} entries are allowed per request.",
         )
-    elif type == "Meal":
-        volume, price = get_pizza_data(
-            current_time,
-            weekday,
-            item,
+    results = simulate_prices(
+        [(entry.item_id, entry.time) for entry in request.entries]
+    )
+    results = [
+        {
+            "item_id": entry.item_id,
+            "time": entry.time.isoformat(),
+            **result,
+        }
+        for entry, result in zip(request.entries, results)
+    ]
+    return {"success": True, "results": results}
+
+
+def iter_range_lines(
+    item_ids: np.ndarray, first_hour: int, end_hour: int, tz: Optional[timezone]
+) -> Iterator[str]:
+    """Yields one JSON line per item and hour, computing a chunk of hours at a time."""
+    for chunk_start in range(first_hour, end_hour, RANGE_CHUNK_HOURS):
+        hours = np.arange(chunk_start, min(chunk_start + RANGE_CHUNK_HOURS, end_hour))
+        epoch_hours = np.repeat(hours, len(item_ids))
+        chunk_item_ids = np.tile(item_ids, len(hours))
+        volumes, prices = simulate_range(chunk_item_ids, epoch_hours)
+        times = [
+            (datetime(1970, 1, 1) + timedelta(hours=hour))
+            .replace(tzinfo=tz)
+            .isoformat()
+            for hour in hours.tolist()
+        ]
+        # Formatting the lines directly is several times faster than json.dumps per line
+        yield "".join(
+            RANGE_LINE_FORMAT % (item_id, times[i // len(item_ids)], price, volume)
+            for i, (item_id, price, volume) in enumerate(
+                zip(chunk_item_ids.tolist(), prices.tolist(), volumes.tolist())
+            )
         )
-    elif type == "Ingredient":
-        volume, price = get_ingredient_data(
-            current_time,
-            weekday,
-            item,
+
+
+@app.get("/prices/range")
+async def get_price_range(
+    start: datetime, end: datetime, item_id: Optional[int] = None
+):
+    """Streams price and volume of every full hour in [start, end) as JSON lines, for one item or all of them.
+    Times with a timezone are converted to UTC, times without one are taken as they are.
+    """
+    if item_id is not None and str(item_id) not in ITEM_CONFIG:
+        raise HTTPException(
+            status_code=404, detail=f"Item with id {item_id} not found."
         )
-    elif type == "Packaging":
-        volume, price = get_cardboard_box_data(
-            current_time,
-            weekday,
+    tz = timezone.utc if start.tzinfo is not None else None
+    if (end.tzinfo is not None) != (tz is not None):
+        raise HTTPException(
+            status_code=422,
+            detail="start and end must both have a timezone or neither.",
         )
 
-    return {
-        "price": price,
-        "volume": volume,
-        "success": True,
-        "seed": seed,
-    }
+    if tz is not None:
+        start, end = start.astimezone(tz), end.astimezone(tz)
+
+    # Hours since the epoch in wall clock time. Ranges start at the first full hour at or after start.
+    epoch = datetime(1970, 1, 1, tzinfo=tz)
+    first_hour = -((epoch - start) // timedelta(hours=1))
+    end_hour = -((epoch - end) // timedelta(hours=1))
+    if end_hour - first_hour > MAX_RANGE_HOURS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {MAX_RANGE_HOURS} hours are allowed per request.",
+        )
+
+    item_ids = np.array([item_id]) if item_id is not None else ITEM_IDS
+    return StreamingResponse(
+        iter_range_lines(item_ids, first_hour, max(first_hour, end_hour), tz),
+        media_type="application/x-ndjson",
+    )
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Results only depend on (item, hour), so any number of workers give the same answers
+    uvicorn.run(
+        "api:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.getenv("API_WORKERS", "1")),
+    )
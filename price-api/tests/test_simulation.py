@@ -0,0 +1,157 @@
+import json
+import numpy as np
+import pytest
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+import api
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(api, "PRICE_CACHE", api.LRUCache(1000))
+
+
+def test_stable_hash_is_splitmix64():
+    # Reference values of splitmix64 for the inputs 0 and 1
+    assert api.stable_hash(np.array([0, 1], dtype=np.uint64)).tolist() == [
+        0xE220A8397B1DCDAF,
+        0x910A2DEC89025CC1,
+    ]
+
+
+def test_random_uniform_is_deterministic_and_in_range():
+    seeds = api.get_seeds(np.arange(1, 9), np.full(8, 480_000))
+    u = api.random_uniform(seeds, 0)
+    assert np.array_equal(u, api.random_uniform(seeds.copy(), 0))
+    assert np.all((u > 0) & (u < 1))
+    # Every stream and every (item, hour) draws differently
+    assert not np.array_equal(u, api.random_uniform(seeds, 1))
+    assert len(np.unique(u)) == len(u)
+
+
+def test_same_pair_same_result():
+    entries = [(1, datetime(2025, 1, 1, 12, 30)), (8, datetime(2025, 7, 4, 20))]
+    first = api.simulate_prices(entries)
+    api.PRICE_CACHE = api.LRUCache(1000)
+    assert api.simulate_prices(entries) == first
+    assert api.simulate_prices(entries[::-1]) == first[::-1]
+    # Any minute of the hour gives the same answer
+    assert api.simulate_price(1, datetime(2025, 1, 1, 12, 5)) == first[0]
+
+
+def test_range_matches_single_prices():
+    hours = np.array([api.get_epoch_hour(datetime(2025, 1, 1, h)) for h in range(24)])
+    item_ids = np.full(24, 2)
+
+    volumes, prices = api.simulate_range(item_ids, hours)
+
+    for h, volume, price in zip(range(24), volumes.tolist(), prices.tolist()):
+        result = api.simulate_price(2, datetime(2025, 1, 1, h))
+        assert (result["volume"], result["price"]) == (volume, price)
+
+
+def test_failing_entries_report_their_own_error():
+    results = api.simulate_prices(
+        [(1, datetime(2025, 1, 1, 12)), (99, datetime(2025, 1, 1, 12))]
+    )
+    assert results[0]["success"]
+    assert not results[1]["success"]
+    assert "99" in results[1]["error"]
+
+
+def test_failing_simulation_only_fails_its_entry(monkeypatch):
+    simulate = api.simulate
+
+    def failing_for_icecream(item_ids, *args):
+        if 8 in item_ids.tolist():
+            raise ValueError("No icecream today")
+        return simulate(item_ids, *args)
+
+    monkeypatch.setattr(api, "simulate", failing_for_icecream)
+    results = api.simulate_prices(
+        [(1, datetime(2025, 1, 1, 12)), (8, datetime(2025, 1, 1, 12))]
+    )
+
+    assert results[0]["success"]
+    assert results[1] == {"success": False, "error": "No icecream today"}
+    # Failures are not cached
+    assert (
+        api.PRICE_CACHE.get((8, api.get_epoch_hour(datetime(2025, 1, 1, 12)), "lunch"))
+        is None
+    )
+
+
+def test_lru_cache_forgets_least_recently_used():
+    cache = api.LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def get_range(start: datetime, end: datetime, item_id: int) -> list[dict]:
+    response = TestClient(api.app).get(
+        "/prices/range",
+        params={"start": start.isoformat(), "end": end.isoformat(), "item_id": item_id},
+    )
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_range_across_chunks_matches_single_prices():
+    # Starts in the middle of an hour, and the hours starting in [start, end) are two more than a chunk
+    start = datetime(2025, 1, 1, 11, 30)
+    lines = get_range(
+        start, start + timedelta(hours=api.RANGE_CHUNK_HOURS + 2), item_id=3
+    )
+
+    first_hour = datetime(2025, 1, 1, 12)
+    assert len(lines) == api.RANGE_CHUNK_HOURS + 2
+    assert [line["time"] for line in lines] == [
+        (first_hour + timedelta(hours=hour)).isoformat() for hour in range(len(lines))
+    ]
+    # The hours on both sides of the chunk boundary
+    for hour in [api.RANGE_CHUNK_HOURS - 1, api.RANGE_CHUNK_HOURS]:
+        expected = api.simulate_price(3, first_hour + timedelta(hours=hour))
+        assert (lines[hour]["price"], lines[hour]["volume"]) == (
+            expected["price"],
+            expected["volume"],
+        )
+
+
+def test_range_ending_before_its_start_is_empty():
+    start = datetime(2025, 1, 1, 12)
+    assert get_range(start, start - timedelta(hours=5), item_id=3) == []
+
+
+def test_batch_matches_single_prices():
+    client = TestClient(api.app)
+    entries = [
+        {"item_id": 1, "time": "2025-01-01T12:30:00"},
+        {"item_id": 99, "time": "2025-01-01T12:00:00"},
+        {"item_id": 8, "time": "2025-07-04T20:00:00+00:00"},
+        {"item_id": 1, "time": "2025-01-01T12:30:00"},
+    ]
+
+    response = client.post("/prices", json={"entries": entries})
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [(result["item_id"], result["time"]) for result in results] == [
+        (entry["item_id"], entry["time"]) for entry in entries
+    ]
+    for entry, result in zip(entries, results):
+        single = client.get("/price", params=entry).json()
+        assert {key: result[key] for key in single} == single
+    # The unknown item fails on its own
+    assert [result["success"] for result in results] == [True, False, True, True]
+
+
+def test_batch_above_max_batch_size_is_rejected():
+    entries = [{"item_id": 1, "time": "2025-01-01T12:00:00"}] * (api.MAX_BATCH_SIZE + 1)
+
+    response = TestClient(api.app).post("/prices", json={"entries": entries})
+
+    assert response.status_code == 413